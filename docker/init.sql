@@ -67,4 +67,121 @@ CREATE TABLE IF NOT EXISTS models_deeprag (
     user_id INT,
     FOREIGN KEY (user_id) REFERENCES users_deeprag(id) ON DELETE CASCADE,
     INDEX idx_model_user (user_id)    -- Index for faster user-based lookups
-) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
\ No newline at end of file
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- 创建后台任务表 (文件服务: job_queue / job_worker)
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR(32) PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload LONGTEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, running, succeeded, failed
+    priority INT NOT NULL DEFAULT 0,              -- 数值越大越先执行
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after DATETIME NOT NULL,                  -- 重试退避: 早于该时间不会被领取
+    locked_by VARCHAR(128),
+    locked_at DATETIME,
+    last_error TEXT,
+    result TEXT,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    created_by VARCHAR(50),
+    batch_id VARCHAR(32),                         -- 同一批提交的任务 (例如批量转换) 共用的批次 ID
+    INDEX idx_jobs_claim (status, priority, run_after), -- Index for worker claim queries
+    INDEX idx_jobs_created (created_at),
+    INDEX idx_jobs_batch (batch_id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- jobs 表批次列: 已有的 jobs 表缺少 batch_id 时添加 (init-file 每次启动执行，需保持幂等)
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.columns
+     WHERE table_schema = DATABASE() AND table_name = 'jobs' AND column_name = 'batch_id') = 0,
+    'ALTER TABLE jobs ADD COLUMN batch_id VARCHAR(32) NULL, ADD INDEX idx_jobs_batch (batch_id)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 创建 Markdown 分块表 (文件服务: chunker). 分块正文不入库，按字节偏移从 MinIO 对象读取
+CREATE TABLE IF NOT EXISTS chunks (
+    id VARCHAR(32) PRIMARY KEY,
+    file_id VARCHAR(32) NOT NULL,             -- Markdown 文件 ID
+    derived_from_file_id VARCHAR(32),         -- Markdown 文件衍生自的原始文件 ID
+    chunk_index INT NOT NULL,
+    start_offset BIGINT NOT NULL,             -- UTF-8 字节偏移 [start_offset, end_offset)
+    end_offset BIGINT NOT NULL,
+    token_count INT NOT NULL,
+    heading VARCHAR(255),
+    content_hash CHAR(64) NOT NULL,           -- 分块文本的 SHA-256
+    created_at DATETIME NOT NULL,
+    UNIQUE INDEX idx_chunks_file (file_id, chunk_index),
+    INDEX idx_chunks_source (derived_from_file_id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- 创建文件分面统计表 (文件服务: /api/files/query). 由 insert_file / update_file / delete_file 在同一事务中增量维护,
+-- 分面计数直接汇总本表，不对 files 做 GROUP BY
+CREATE TABLE IF NOT EXISTS file_facets (
+    folder_id VARCHAR(32) NOT NULL DEFAULT '',   -- '' 表示未分类文件
+    created_by VARCHAR(50) NOT NULL DEFAULT '',
+    type VARCHAR(100) NOT NULL DEFAULT '',
+    month CHAR(7) NOT NULL,                      -- 上传月份 YYYY-MM
+    is_derived TINYINT NOT NULL DEFAULT 0,       -- 1: 衍生文件 (derived_from_file_id 非空)
+    file_count BIGINT NOT NULL DEFAULT 0,
+    total_size BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder_id, created_by, type, month, is_derived),
+    INDEX idx_file_facets_user (created_by, month)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- 创建文件夹汇总表 (文件服务: 文件夹列表的大小与文件数、按创建者的配额统计). 每个文件夹按文件创建者分行,
+-- direct_* 为直属文件，total_* 含全部子文件夹; 由文件增删移动与文件夹移动在同一事务中沿祖先链增量维护
+CREATE TABLE IF NOT EXISTS folder_rollups (
+    folder_id VARCHAR(32) NOT NULL,
+    created_by VARCHAR(50) NOT NULL DEFAULT '',  -- 文件创建者 ('' 表示未知)
+    direct_count BIGINT NOT NULL DEFAULT 0,
+    direct_size BIGINT NOT NULL DEFAULT 0,
+    total_count BIGINT NOT NULL DEFAULT 0,
+    total_size BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder_id, created_by),
+    INDEX idx_folder_rollups_user (created_by)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- files 表 (文件服务) 衍生关系索引: 衍生树查询与级联删除沿 derived_from_file_id 向下递归.
+-- files 表不在本文件中创建，仅在表已存在且索引缺失时添加 (init-file 每次启动执行，需保持幂等)
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.tables
+     WHERE table_schema = DATABASE() AND table_name = 'files') = 1
+    AND (SELECT COUNT(*) FROM information_schema.statistics
+         WHERE table_schema = DATABASE() AND table_name = 'files' AND index_name = 'idx_files_derived') = 0,
+    'ALTER TABLE files ADD INDEX idx_files_derived (derived_from_file_id)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- files 表软删除列: deleted_at 非空的文件在回收站中，保留期后由垃圾回收删除对象与记录
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.tables
+     WHERE table_schema = DATABASE() AND table_name = 'files') = 1
+    AND (SELECT COUNT(*) FROM information_schema.columns
+         WHERE table_schema = DATABASE() AND table_name = 'files' AND column_name = 'deleted_at') = 0,
+    'ALTER TABLE files ADD COLUMN deleted_at DATETIME NULL, ADD INDEX idx_files_deleted (deleted_at)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- files 表存储位置索引: MinIO 对账按对象名称批量 IN 查询 files.location
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.tables
+     WHERE table_schema = DATABASE() AND table_name = 'files') = 1
+    AND (SELECT COUNT(*) FROM information_schema.statistics
+         WHERE table_schema = DATABASE() AND table_name = 'files' AND index_name = 'idx_files_location') = 0,
+    'ALTER TABLE files ADD INDEX idx_files_location (location)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,557 @@
+"""
+近似最近邻 (ANN) 索引模块
+IVF 倒排索引: k-means 粗聚类把向量分配到 nlist 个倒排列表，查询只扫描最近的 nprobe 个列表.
+列表内的向量可以用乘积量化 (PQ, 每个向量 pq_m 字节) 或 float16 原向量 (flat) 存储.
+
+磁盘布局 (ANN_INDEX_DIR):
+    meta.json                       维度、nlist、pq_m、当前主段代号、已合并进主段的最大序号
+    centroids.npy / codebooks.npy   粗聚类中心 / PQ 码本
+    main-<代号>.*.npy               按列表排序的主段 (codes / cid / fid / seq) 与列表偏移，mmap 加载
+    delta.*                         新插入行 (list / codes / cid / fid / seq)，只追加
+    tombstones                      已删除行的序号 (int64，只追加)
+    LOCK                            fcntl 文件锁
+
+nprobe 越大召回率越高、延迟越高；pq_m 越大 PQ 精度越高、内存越大. 召回率与 QPS 参见
+benchmarks/ann_benchmark.py.
+
+用法: python ann_index.py --rebuild [--nlist 1024] [--pq-m 0]   从向量存储重建索引
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+from vector_store import ID_WIDTH, normalize, _encode_ids
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ann_index'))
+ANN_NLIST = int(os.getenv('ANN_NLIST', 1024))
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', 16))
+ANN_PQ_M = int(os.getenv('ANN_PQ_M', 0))  # 0 表示 flat (float16) 存储
+ANN_COMPACT_ROWS = int(os.getenv('ANN_COMPACT_ROWS', 100_000))
+ANN_TRAIN_SAMPLE = int(os.getenv('ANN_TRAIN_SAMPLE', 100_000))
+
+_ID_DTYPE = np.dtype(f'S{ID_WIDTH}')
+_PQ_CODES = 256
+
+
+def _squared_distances(x, centroids):
+    """x (n, d) 与 centroids (k, d) 的平方欧氏距离矩阵 (n, k)."""
+    return (
+        np.einsum('ij,ij->i', x, x)[:, None]
+        - 2 * x @ centroids.T
+        + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    )
+
+
+def kmeans(x, k, iterations=20, seed=0, batch_rows=65536):
+    """
+    Lloyd k-means
+
+    Args:
+        x (np.ndarray): (n, d) float32 样本
+        k (int): 聚类数
+        iterations (int): 迭代次数
+
+    Returns:
+        np.ndarray: (k, d) 聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_nearest(x, centroids, batch_rows)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():  # 空簇重新随机取点
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def assign_nearest(x, centroids, batch_rows=65536):
+    """返回每行最近的聚类中心下标."""
+    result = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), batch_rows):
+        result[start:start + batch_rows] = _squared_distances(x[start:start + batch_rows], centroids).argmin(axis=1)
+    return result
+
+
+class IVFIndex:
+    """
+    IVF-PQ / IVF-Flat 近似最近邻索引 (向量先归一化，按余弦相似度排序).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, 'meta.json')
+        self._lock_path = os.path.join(path, 'LOCK')
+        self._tombstone_path = os.path.join(path, 'tombstones')
+        self.meta = None
+        self._meta_mtime = None
+        self.centroids = self.codebooks = None
+        self._main = None
+        self._delta = None
+        self._delta_rows = -1
+        self._dead = np.zeros(0, dtype=np.int64)
+        self._tombstone_size = -1
+        if os.path.exists(self._meta_path):
+            self._refresh()
+
+    # ---- 基础属性 ----
+
+    @property
+    def is_trained(self):
+        """是否已训练. 训练可能在其他进程 (任务 worker) 中完成，因此每次都按 meta.json 同步."""
+        if os.path.exists(self._meta_path):
+            with self._lock:
+                self._refresh()
+        return self.meta is not None
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def pq_m(self):
+        return self.meta['pq_m']
+
+    def _code_dtype(self):
+        return np.uint8 if self.pq_m else np.float16
+
+    def _code_width(self):
+        return self.pq_m or self.dim
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # ---- 训练与编码 ----
+
+    def train(self, vectors, nlist=None, pq_m=None, iterations=20, seed=0):
+        """
+        训练粗聚类中心和 PQ 码本，并清空索引内容
+
+        Args:
+            vectors (array-like): 训练样本 (超过 ANN_TRAIN_SAMPLE 行时随机抽样)
+            nlist (int, optional): 倒排列表数
+            pq_m (int, optional): PQ 子空间数 (必须整除维度)，0 表示 flat 存储
+        """
+        vectors = normalize(vectors)
+        nlist = nlist or ANN_NLIST
+        pq_m = ANN_PQ_M if pq_m is None else pq_m
+        dim = vectors.shape[1]
+        if pq_m and dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} 必须整除向量维度 {dim}")
+        rng = np.random.default_rng(seed)
+        if len(vectors) > ANN_TRAIN_SAMPLE:
+            vectors = vectors[rng.choice(len(vectors), ANN_TRAIN_SAMPLE, replace=False)]
+
+        centroids = kmeans(vectors, nlist, iterations=iterations, seed=seed)
+        codebooks = np.zeros((0, _PQ_CODES, 0), dtype=np.float32)
+        if pq_m:
+            residuals = vectors - centroids[assign_nearest(vectors, centroids)]
+            dsub = dim // pq_m
+            codebooks = np.stack([
+                kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), _PQ_CODES, iterations=iterations, seed=seed + j)
+                for j in range(pq_m)
+            ]) if len(vectors) >= _PQ_CODES else None
+            if codebooks is None:
+                raise ValueError(f"PQ 训练至少需要 {_PQ_CODES} 个样本")
+
+        with self._lock, file_lock(self._lock_path):
+            self._remove_files(lambda name: name == 'tombstones')
+            np.save(self._file('centroids.npy'), centroids.astype(np.float32))
+            np.save(self._file('codebooks.npy'), codebooks.astype(np.float32))
+            self._write_meta({'dim': dim, 'pq_m': pq_m, 'generation': 0, 'merged_seq': -1})
+            self._remove_files(lambda name: name.startswith('main-'))
+            self._meta_mtime = None
+            self._refresh()
+        logging.info(f"ANN 索引训练完成: dim={dim}, nlist={len(centroids)}, pq_m={pq_m}")
+
+    def _encode(self, vectors, lists):
+        if not self.pq_m:
+            return vectors.astype(np.float16)
+        residuals = vectors - self.centroids[lists]
+        dsub = self.dim // self.pq_m
+        codes = np.empty((len(vectors), self.pq_m), dtype=np.uint8)
+        for j in range(self.pq_m):
+            codes[:, j] = assign_nearest(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), self.codebooks[j])
+        return codes
+
+    # ---- 持久化状态 ----
+
+    def _write_meta(self, meta):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _refresh(self):
+        """同步磁盘状态: 其他进程的训练与合并 (meta.json 被替换)、追加的行和墓碑."""
+        stat = os.stat(self._meta_path)
+        mtime = (stat.st_mtime_ns, stat.st_ino)
+        if mtime != self._meta_mtime:
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+            self.centroids = np.load(self._file('centroids.npy'))
+            self.codebooks = np.load(self._file('codebooks.npy'))
+            self._main = self._load_main(self.meta['generation'])
+            self._delta_rows = -1
+            self._tombstone_size = -1
+            self._meta_mtime = mtime
+
+        try:
+            rows = os.path.getsize(self._file('delta.cid')) // ID_WIDTH
+        except FileNotFoundError:
+            rows = 0
+        if rows != self._delta_rows:
+            delta = self._map_delta(rows)
+            # 合并后、删除 delta 文件前崩溃时，delta 中残留已合并进主段的行，按序号跳过
+            start = int(np.searchsorted(delta['seq'], self.meta.get('merged_seq', -1), side='right'))
+            self._delta = {name: column[start:] for name, column in delta.items()} if start else delta
+            self._delta_rows = rows
+
+        size = os.path.getsize(self._tombstone_path) if os.path.exists(self._tombstone_path) else 0
+        if size != self._tombstone_size:
+            with open(self._tombstone_path, 'rb') if size else open(os.devnull, 'rb') as f:
+                data = f.read(size - size % 8)
+            self._dead = np.unique(np.frombuffer(data, dtype=np.int64))
+            self._tombstone_size = size
+
+    def _load_main(self, generation):
+        if not generation:
+            width = self._code_width()
+            return {
+                'offsets': np.zeros(self.nlist + 1, dtype=np.int64),
+                'codes': np.zeros((0, width), dtype=self._code_dtype()),
+                'cid': np.zeros(0, dtype=_ID_DTYPE),
+                'fid': np.zeros(0, dtype=_ID_DTYPE),
+                'seq': np.zeros(0, dtype=np.int64),
+            }
+        prefix = self._file(f'main-{generation:06d}')
+        return {
+            'offsets': np.load(f'{prefix}.offsets.npy'),
+            'codes': np.load(f'{prefix}.codes.npy', mmap_mode='r'),
+            'cid': np.load(f'{prefix}.cid.npy', mmap_mode='r'),
+            'fid': np.load(f'{prefix}.fid.npy', mmap_mode='r'),
+            'seq': np.load(f'{prefix}.seq.npy', mmap_mode='r'),
+        }
+
+    def _map_delta(self, rows):
+        columns = {
+            'list': (np.int32, (rows,)),
+            'codes': (self._code_dtype(), (rows, self._code_width())),
+            'cid': (_ID_DTYPE, (rows,)),
+            'fid': (_ID_DTYPE, (rows,)),
+            'seq': (np.int64, (rows,)),
+        }
+        delta = {}
+        for name, (dtype, shape) in columns.items():
+            if rows:
+                delta[name] = np.memmap(self._file(f'delta.{name}'), dtype=dtype, mode='r', shape=shape)
+            else:
+                delta[name] = np.zeros(shape, dtype=dtype)
+        return delta
+
+    def _remove_files(self, extra):
+        """
+        删除 delta 文件 (delta.cid 最先删除，使 delta 整体对读者不可见) 以及 extra(name) 为真的文件.
+        中途崩溃残留的其他 delta 列由 _truncate_delta 在下次追加前截掉.
+        """
+        if os.path.exists(self._file('delta.cid')):
+            os.remove(self._file('delta.cid'))
+        for name in os.listdir(self.path):
+            if name.startswith('delta.') or extra(name):
+                os.remove(self._file(name))
+
+    def _truncate_delta(self):
+        """截掉 delta 各列中超出 delta.cid 行数的残留数据 (写入或删除中断所致，调用方需持有文件锁)."""
+        widths = {
+            'list': 4,
+            'codes': self._code_width() * np.dtype(self._code_dtype()).itemsize,
+            'fid': ID_WIDTH,
+            'seq': 8,
+            'cid': ID_WIDTH,
+        }
+        for name, width in widths.items():
+            path, expected = self._file(f'delta.{name}'), self._delta_rows * width
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                os.truncate(path, expected)
+
+    def _next_seq(self):
+        last = [int(self._main['seq'].max()) if len(self._main['seq']) else -1, self.meta.get('merged_seq', -1)]
+        if len(self._delta['seq']):
+            last.append(int(self._delta['seq'][-1]))
+        return max(last) + 1
+
+    # ---- 写入 ----
+
+    def add(self, vectors, chunk_ids, file_ids):
+        """
+        增量插入向量 (追加到 delta，超过 ANN_COMPACT_ROWS 行时自动合并到主段)
+
+        Args:
+            vectors (array-like): (n, dim) 向量
+            chunk_ids (list): 分块 ID
+            file_ids (list): 文件 ID
+        """
+        if not self.is_trained:
+            raise RuntimeError("ANN 索引尚未训练")
+        vectors = normalize(vectors)
+        cids, fids = _encode_ids(chunk_ids), _encode_ids(file_ids)
+        centroids = self.centroids
+        lists = assign_nearest(vectors, centroids).astype(np.int32)
+        codes = self._encode(vectors, lists)
+
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self.centroids is not centroids:  # 编码期间被其他进程重新训练
+                lists = assign_nearest(vectors, self.centroids).astype(np.int32)
+                codes = self._encode(vectors, lists)
+            self._truncate_delta()
+            first = self._next_seq()
+            seqs = np.arange(first, first + len(vectors), dtype=np.int64)
+            # delta.cid 最后写入: 其行数决定读者可见的行数
+            for name, data in (('list', lists), ('codes', codes), ('fid', fids), ('seq', seqs), ('cid', cids)):
+                with open(self._file(f'delta.{name}'), 'ab') as f:
+                    f.write(np.ascontiguousarray(data).tobytes())
+            self._refresh()
+            if self._delta_rows >= ANN_COMPACT_ROWS:
+                self._compact()
+
+    def _matching_seqs(self, column, ids):
+        targets = _encode_ids(ids)
+        found = []
+        for part in (self._main, self._delta):
+            if len(part[column]):
+                found.append(np.asarray(part['seq'])[np.isin(part[column], targets)])
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def _delete(self, column, ids):
+        if not self.is_trained:
+            return 0
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            seqs = self._matching_seqs(column, ids)
+            seqs = seqs[~np.isin(seqs, self._dead)]
+            if len(seqs):
+                with open(self._tombstone_path, 'ab') as f:
+                    f.write(seqs.astype(np.int64).tobytes())
+                self._refresh()
+            return len(seqs)
+
+    def delete_chunks(self, chunk_ids):
+        """按分块 ID 删除，返回删除的行数."""
+        return self._delete('cid', chunk_ids)
+
+    def delete_files(self, file_ids):
+        """删除文件的全部行，返回删除的行数."""
+        return self._delete('fid', file_ids)
+
+    def compact(self):
+        """把 delta 合并进主段并清除已删除行."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        main, delta = self._main, self._delta
+        main_lists = np.repeat(np.arange(self.nlist, dtype=np.int64), np.diff(main['offsets']))
+        lists = np.concatenate([main_lists, np.asarray(delta['list'], dtype=np.int64)])
+        seqs = np.concatenate([np.asarray(main['seq']), np.asarray(delta['seq'])])
+        alive = ~np.isin(seqs, self._dead)
+        order = np.flatnonzero(alive)[np.argsort(lists[alive], kind='stable')]
+
+        generation = self.meta['generation'] + 1
+        prefix = self._file(f'main-{generation:06d}')
+        counts = np.bincount(lists[order], minlength=self.nlist)
+        offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(f'{prefix}.offsets.npy', offsets)
+        for name in ('codes', 'cid', 'fid', 'seq'):
+            np.save(f'{prefix}.{name}.npy', np.concatenate([np.asarray(main[name]), np.asarray(delta[name])])[order])
+
+        old_generation = self.meta['generation']
+        merged_seq = max(int(seqs.max()) if len(seqs) else -1, self.meta.get('merged_seq', -1))
+        # 先切换主段再删除 delta: 两步之间崩溃时，残留的 delta 行由 merged_seq 过滤
+        self._write_meta(dict(self.meta, generation=generation, merged_seq=merged_seq))
+        self._remove_files(lambda name: name == 'tombstones' or (
+            old_generation and name.startswith(f'main-{old_generation:06d}.')
+        ))
+        self._meta_mtime = None
+        self._refresh()
+        logging.info(f"ANN 索引合并完成: 主段 {generation}, 行数 {len(order)}")
+
+    # ---- 检索 ----
+
+    def _lookup_tables(self, query, list_ids):
+        """PQ 距离表: (len(list_ids), pq_m, 256)，第 j 个子空间中查询残差到各码字的平方距离."""
+        dsub = self.dim // self.pq_m
+        residuals = (query - self.centroids[list_ids]).reshape(len(list_ids), self.pq_m, 1, dsub)
+        return ((residuals - self.codebooks[None]) ** 2).sum(axis=-1)
+
+    def _candidates(self, part, rows, dead, allowed, extra=None):
+        """过滤已删除行和不在 file_ids (及额外允许的 chunk_ids) 范围内的行，返回保留行的掩码."""
+        keep = np.ones(len(rows), dtype=bool)
+        if len(dead):
+            keep &= ~np.isin(part['seq'][rows], dead)
+        if allowed is not None:
+            allowed_rows = np.isin(part['fid'][rows], allowed)
+            if extra is not None:
+                allowed_rows |= np.isin(part['cid'][rows], extra)
+            keep &= allowed_rows
+        return keep
+
+    def search(self, queries, top_k=10, nprobe=None, file_ids=None, chunk_ids=None):
+        """
+        近似检索
+
+        Args:
+            queries (array-like): (q, dim) 或 (dim,) 查询向量
+            top_k (int): 每个查询的结果数
+            nprobe (int, optional): 扫描的倒排列表数. Defaults to ANN_NPROBE from .env.
+            file_ids (list, optional): 只返回这些文件的结果
+            chunk_ids (list, optional): 指定 file_ids 时额外允许的分块 (不论其所属文件)
+
+        Returns:
+            list: 每个查询一个列表 [(chunk_id, file_id, score), ...]，score 为余弦相似度 (PQ 下为近似值)
+        """
+        if not self.is_trained:
+            return [[] for _ in range(len(np.atleast_2d(queries)))]
+        queries = normalize(queries)
+        with self._lock:
+            self._refresh()
+            main, delta, dead = self._main, self._delta, self._dead
+        nprobe = min(nprobe or ANN_NPROBE, self.nlist)
+        allowed = _encode_ids(file_ids) if file_ids is not None else None
+        extra = _encode_ids(chunk_ids) if file_ids is not None and chunk_ids else None
+        probes = np.argpartition(_squared_distances(queries, self.centroids), nprobe - 1, axis=1)[:, :nprobe]
+        delta_lists = np.asarray(delta['list'])
+        probe_position = np.full(self.nlist, -1, dtype=np.int64)
+
+        results = []
+        for query, query_probes in zip(queries, probes):
+            # 一次性收集所有被探测列表中的行: 主段是连续区间，delta 按列表号筛选
+            starts, ends = main['offsets'][query_probes], main['offsets'][query_probes + 1]
+            lengths = ends - starts
+            main_rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            main_probe = np.repeat(np.arange(nprobe), lengths)
+            probe_position[query_probes] = np.arange(nprobe)
+            delta_rows = np.flatnonzero(probe_position[delta_lists] >= 0) if len(delta_lists) else delta_lists
+            delta_probe = probe_position[delta_lists[delta_rows]]
+            probe_position[query_probes] = -1
+
+            tables = self._lookup_tables(query, query_probes) if self.pq_m else None
+            distances, sources = [], []
+            for part, rows, row_probe in ((main, main_rows, main_probe), (delta, delta_rows, delta_probe)):
+                if not len(rows):
+                    continue
+                keep = self._candidates(part, rows, dead, allowed, extra)
+                rows, row_probe = rows[keep], row_probe[keep]
+                codes = part['codes'][rows]
+                if tables is None:
+                    diff = codes.astype(np.float32) - query
+                    distances.append(np.einsum('ij,ij->i', diff, diff))
+                else:
+                    distances.append(tables[row_probe[:, None], np.arange(self.pq_m), codes].sum(axis=1))
+                sources.append((part, rows))
+            distances = np.concatenate(distances) if distances else np.zeros(0, dtype=np.float32)
+            if not len(distances):
+                results.append([])
+                continue
+
+            k = min(top_k, len(distances))
+            best = np.argpartition(distances, k - 1)[:k]
+            best = best[np.argsort(distances[best], kind='stable')]
+            bounds = np.cumsum([len(rows) for _, rows in sources])
+            hits = []
+            for i in best:
+                source = int(np.searchsorted(bounds, i, side='right'))
+                part, rows = sources[source]
+                row = rows[i - (bounds[source - 1] if source else 0)]
+                # 单位向量: cos = 1 - d^2 / 2
+                hits.append((part['cid'][row].decode('ascii'), part['fid'][row].decode('ascii'), float(1 - distances[i] / 2)))
+            results.append(hits)
+        return results
+
+    def __len__(self):
+        if not self.is_trained:
+            return 0
+        with self._lock:
+            self._refresh()
+            return len(self._main['seq']) + len(self._delta['seq']) - len(self._dead)
+
+
+def build_from_vector_store(index, store, nlist=None, pq_m=None):
+    """
+    用向量存储中的全部有效行训练并重建 ANN 索引
+
+    Args:
+        index (IVFIndex): 目标索引
+        store (VectorStore): 分块向量存储
+    """
+    with store._lock:
+        store._refresh()
+        segments = list(store._segments)
+        dead = np.fromiter(store._dead, dtype=np.int64, count=len(store._dead))
+    blocks = []
+    for segment in segments:
+        alive = ~np.isin(np.arange(segment.base, segment.base + segment.rows), dead)
+        if alive.any():
+            blocks.append((segment.block(0, segment.rows)[alive], segment.chunk_ids[alive], segment.file_ids[alive]))
+    if not blocks:
+        logging.warning("向量存储为空，跳过 ANN 索引构建")
+        return 0
+    vectors = np.concatenate([b[0] for b in blocks])
+    chunk_ids = [c.decode('ascii') for b in blocks for c in b[1]]
+    file_ids = [f.decode('ascii') for b in blocks for f in b[2]]
+    index.train(vectors, nlist=nlist, pq_m=pq_m)
+    for start in range(0, len(vectors), ANN_COMPACT_ROWS):
+        end = start + ANN_COMPACT_ROWS
+        index.add(vectors[start:end], chunk_ids[start:end], file_ids[start:end])
+    index.compact()
+    return len(vectors)
+
+
+_ann_index = None
+_ann_index_lock = threading.Lock()
+
+
+def get_ann_index():
+    """获取分块向量的 ANN 索引 (进程内单例)."""
+    global _ann_index
+    with _ann_index_lock:
+        if _ann_index is None:
+            _ann_index = IVFIndex(ANN_INDEX_DIR)
+        return _ann_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='分块向量 ANN 索引')
+    parser.add_argument('--rebuild', action='store_true', help='从向量存储训练并重建索引')
+    parser.add_argument('--nlist', type=int, default=ANN_NLIST, help='倒排列表数 (建议约 4 * sqrt(向量数))')
+    parser.add_argument('--pq-m', type=int, default=ANN_PQ_M, help='PQ 子空间数，0 表示 float16 存储')
+    args = parser.parse_args()
+    if args.rebuild:
+        from vector_store import get_vector_store
+        rows = build_from_vector_store(get_ann_index(), get_vector_store(), nlist=args.nlist, pq_m=args.pq_m)
+        logging.info(f"ANN 索引重建完成: {rows} 行")
+    else:
+        logging.info(f"ANN 索引: {len(get_ann_index())} 行")
@@ -0,0 +1,271 @@
+"""
+压缩包展开模块
+上传 zip / tar / tar.gz 时在服务端展开: 顺序流式读取成员，按成员路径用 insert_folder 建立对应的文件夹结构，
+成员内容在线程池中并发上传到 MinIO，上传成功的文件按批插入 files 记录.
+
+为防范压缩炸弹，展开时限制成员数、单个成员大小、展开总大小、压缩比与路径深度; 超过单个成员限制的成员
+被跳过并记为失败，超过总量限制时停止展开. 嵌套的压缩包作为普通文件保存，不递归展开.
+内存占用不超过 ARCHIVE_MAX_INFLIGHT_BYTES 加上一个成员的大小.
+"""
+import io
+import logging
+import mimetypes
+import os
+import tarfile
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
+
+import minio_config
+from db_utils import insert_folder, insert_files
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ARCHIVE_MAX_MEMBERS = int(os.getenv('ARCHIVE_MAX_MEMBERS', 10000))
+ARCHIVE_MAX_MEMBER_SIZE = int(os.getenv('ARCHIVE_MAX_MEMBER_SIZE', 100 * 1024 * 1024))
+ARCHIVE_MAX_TOTAL_SIZE = int(os.getenv('ARCHIVE_MAX_TOTAL_SIZE', 1024 * 1024 * 1024))
+ARCHIVE_MAX_RATIO = int(os.getenv('ARCHIVE_MAX_RATIO', 100))
+ARCHIVE_MAX_DEPTH = int(os.getenv('ARCHIVE_MAX_DEPTH', 32))
+ARCHIVE_UPLOAD_WORKERS = int(os.getenv('ARCHIVE_UPLOAD_WORKERS', 8))
+ARCHIVE_MAX_INFLIGHT_BYTES = int(os.getenv('ARCHIVE_MAX_INFLIGHT_BYTES', 64 * 1024 * 1024))
+ARCHIVE_INSERT_BATCH_SIZE = int(os.getenv('ARCHIVE_INSERT_BATCH_SIZE', 200))
+
+# 小于该大小的成员不检查压缩比 (小文本文件的压缩比本身就可能很高)
+_RATIO_CHECK_MIN_SIZE = 1024 * 1024
+_ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar', '.zip')
+# 打包工具生成的元数据，不作为文件保存
+_IGNORED_NAMES = {'.DS_Store', 'Thumbs.db', 'desktop.ini'}
+
+
+class ArchiveError(Exception):
+    """压缩包无法展开 (格式不支持或文件已损坏)."""
+
+
+def is_expandable(filename):
+    """文件名是否为可在服务端展开的压缩包格式."""
+    return filename.lower().endswith(_ARCHIVE_SUFFIXES)
+
+
+def archive_stem(filename):
+    """去掉压缩包扩展名，作为展开后的根文件夹名."""
+    for suffix in _ARCHIVE_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)] or filename
+    return filename
+
+
+def _zip_member_name(info):
+    """未设置 UTF-8 标志的 zip 成员名按 cp437 解码，Windows 中文环境打包的实际为 GBK."""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def _open_archive(fileobj, filename):
+    """打开压缩包 (tar 为流模式)，格式无效时抛出 ArchiveError."""
+    try:
+        if filename.lower().endswith('.zip'):
+            return zipfile.ZipFile(fileobj)
+        return tarfile.open(fileobj=fileobj, mode='r|*')
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ArchiveError(f"不是有效的压缩包: {e}")
+
+
+def _iter_members(archive):
+    """
+    依次产出压缩包中的普通文件成员: (路径, 声明大小, 压缩后大小或 None, 打开函数; 加密成员为 None)
+    tar 以流模式读取，打开函数必须在取下一个成员之前调用. 非普通文件 (目录、链接、设备) 不产出.
+    """
+    if isinstance(archive, zipfile.ZipFile):
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            open_member = None if info.flag_bits & 0x1 else (lambda info=info: archive.open(info))
+            yield _zip_member_name(info), info.file_size, info.compress_size, open_member
+    else:
+        for member in archive:
+            if member.isfile():
+                yield member.name, member.size, None, lambda member=member: archive.extractfile(member)
+
+
+def _split_path(path):
+    """拆分成员路径并去掉 ''、'.'、'..'，避免越出根文件夹."""
+    return [part for part in path.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+
+
+def _put_object(object_name, data, content_type, metadata):
+    try:
+        minio_config.minio_client.put_object(
+            minio_config.bucket_name, object_name, io.BytesIO(data), len(data),
+            content_type=content_type, metadata=metadata
+        )
+        return True
+    except Exception as e:
+        logging.error(f"展开压缩包时上传对象失败: {object_name}, {e}")
+        return False
+
+
+def expand_archive(fileobj, filename, folder_id=None, created_by=None, allowed_file=None):
+    """
+    展开上传的压缩包: 在 folder_id 下创建以压缩包命名的根文件夹，按成员路径建立子文件夹并保存成员文件
+
+    Args:
+        fileobj (file-like): 压缩包内容 (zip 需可 seek)
+        filename (str): 压缩包文件名 (用于判断格式与根文件夹名)
+        folder_id (str, optional): 目标父文件夹 ID
+        created_by (str, optional): 创建者 ID
+        allowed_file (callable, optional): 成员文件名是否允许保存 (filename -> bool)
+
+    Returns:
+        dict: 展开结果 (根文件夹、保存的文件数与字节数、失败成员、跳过数、提前停止的原因)
+
+    Raises:
+        ArchiveError: 格式不支持、压缩包损坏或无法创建根文件夹
+    """
+    if not is_expandable(filename):
+        raise ArchiveError(f"不支持展开的压缩包格式: {filename}")
+
+    archive = _open_archive(fileobj, filename)
+    root_name = archive_stem(filename)
+    root_id = insert_folder(root_name, parent_id=folder_id, created_by=created_by)
+    if not root_id:
+        archive.close()
+        raise ArchiveError("创建根文件夹失败")
+
+    report = {
+        'folder_id': root_id,
+        'folder_name': root_name,
+        'files': 0,
+        'bytes': 0,
+        'folders': 1,
+        'skipped': 0,
+        'failed': [],
+        'truncated': None
+    }
+    folders = {(): root_id}
+    pending = deque()
+    batch = []
+    state = {'inflight': 0}
+
+    def ensure_folder(parts):
+        key = ()
+        for part in parts:
+            parent_id, key = folders[key], key + (part,)
+            if key not in folders:
+                created = insert_folder(part, parent_id=parent_id, created_by=created_by)
+                if not created:
+                    return None
+                folders[key] = created
+                report['folders'] += 1
+        return folders[key]
+
+    def flush():
+        if not batch:
+            return
+        if insert_files(batch, created_by=created_by):
+            report['files'] += len(batch)
+            report['bytes'] += sum(record['size'] for record in batch)
+        else:
+            minio_config.delete_files_from_minio([record['location'] for record in batch])
+            report['failed'].extend({'name': record['path'], 'reason': '保存到数据库失败'} for record in batch)
+        batch.clear()
+
+    def collect():
+        record, future = pending.popleft()
+        state['inflight'] -= record['size']
+        if future.result():
+            batch.append(record)
+            if len(batch) >= ARCHIVE_INSERT_BATCH_SIZE:
+                flush()
+        else:
+            report['failed'].append({'name': record['path'], 'reason': '上传到 MinIO 失败'})
+
+    members, expanded = 0, 0
+    with archive, ThreadPoolExecutor(max_workers=ARCHIVE_UPLOAD_WORKERS, thread_name_prefix='archive-upload') as pool:
+        try:
+            for path, size, compress_size, open_member in _iter_members(archive):
+                members += 1
+                expanded += size
+                if members > ARCHIVE_MAX_MEMBERS:
+                    report['truncated'] = f"成员数超过上限 {ARCHIVE_MAX_MEMBERS}"
+                    break
+                if expanded > ARCHIVE_MAX_TOTAL_SIZE:
+                    report['truncated'] = f"展开总大小超过上限 {ARCHIVE_MAX_TOTAL_SIZE} 字节"
+                    break
+
+                parts = _split_path(path)
+                if not parts or parts[-1] in _IGNORED_NAMES or parts[0] == '__MACOSX':
+                    report['skipped'] += 1
+                    continue
+                name = parts[-1]
+                if len(parts) > ARCHIVE_MAX_DEPTH:
+                    report['failed'].append({'name': path, 'reason': f'路径层级超过上限 {ARCHIVE_MAX_DEPTH}'})
+                    continue
+                if allowed_file is not None and not allowed_file(name):
+                    report['failed'].append({'name': path, 'reason': '不支持的文件类型'})
+                    continue
+                if open_member is None:
+                    report['failed'].append({'name': path, 'reason': '加密的文件'})
+                    continue
+                if size > ARCHIVE_MAX_MEMBER_SIZE:
+                    report['failed'].append({'name': path, 'reason': f'文件大小超过上限 {ARCHIVE_MAX_MEMBER_SIZE} 字节'})
+                    continue
+                if compress_size is not None and size > _RATIO_CHECK_MIN_SIZE and size > ARCHIVE_MAX_RATIO * max(compress_size, 1):
+                    report['failed'].append({'name': path, 'reason': f'压缩比超过上限 {ARCHIVE_MAX_RATIO}'})
+                    continue
+
+                target_folder_id = ensure_folder(parts[:-1])
+                if not target_folder_id:
+                    report['failed'].append({'name': path, 'reason': '创建文件夹失败'})
+                    continue
+
+                try:
+                    with open_member() as member:
+                        # 按声明大小读取并多读 1 字节，不信任头部中的大小
+                        data = member.read(size + 1)
+                except Exception as e:
+                    logging.error(f"读取压缩包成员失败: {path}, {e}")
+                    report['failed'].append({'name': path, 'reason': f'读取失败: {e}'})
+                    continue
+                if len(data) != size:
+                    report['failed'].append({'name': path, 'reason': '实际大小与声明不符'})
+                    continue
+
+                while pending and state['inflight'] + size > ARCHIVE_MAX_INFLIGHT_BYTES:
+                    collect()
+                file_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                object_name = f"{target_folder_id}/{uuid.uuid4().hex}_{secure_filename(name)}"
+                metadata = {
+                    'filename': secure_filename(name),
+                    'folder_id': target_folder_id,
+                    'upload_date': datetime.now().isoformat()
+                }
+                record = {'id': uuid.uuid4().hex, 'name': name, 'path': path, 'location': object_name,
+                          'size': size, 'type': file_type, 'folder_id': target_folder_id}
+                pending.append((record, pool.submit(_put_object, object_name, data, file_type, metadata)))
+                state['inflight'] += size
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+            logging.error(f"读取压缩包失败: {filename}, {e}")
+            report['truncated'] = f"压缩包已损坏: {e}"
+        finally:
+            while pending:
+                collect()
+            flush()
+
+    logging.info(
+        f"压缩包展开完成: {filename}, 文件 {report['files']} 个 ({report['bytes']} 字节), "
+        f"文件夹 {report['folders']} 个, 失败 {len(report['failed'])} 个, 跳过 {report['skipped']} 个"
+        + (f", 提前停止: {report['truncated']}" if report['truncated'] else '')
+    )
+    return report
@@ -0,0 +1,156 @@
+"""
+近重复分块去重基准测试
+生成带模板页眉、免责声明等重复段落的合成 Markdown 语料，分别在不去重和去重 (MinHash + LSH)
+两种情况下建立分块全文索引与向量索引，报告索引分块数、磁盘占用、去重耗时、查询延迟，
+以及 top-10 结果中与排在前面的结果近重复的冗余结果比例.
+
+用法 (在 src 目录下): python -m benchmarks.dedup_benchmark --docs 2000
+"""
+import os
+
+# 单核测量: 必须在导入 numpy 之前限制 BLAS 线程数
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import io
+import logging
+import re
+import tempfile
+import time
+import numpy as np
+
+from chunker import iter_markdown_chunks
+from dedup_index import DedupIndex
+from embedding_service import HashingEmbedder
+from search_index import SearchIndexStore
+from vector_store import VectorStore
+
+BOILERPLATE = [
+    "## 免责声明\n\n本文件所载信息仅供 {company} 内部参考，不构成任何投资建议或法律意见。"
+    "未经书面许可，任何单位和个人不得复制、转载或以其他方式使用本文件的全部或部分内容。"
+    "文件编号 {number}，如有疑问请联系合规部门。",
+    "## 保密条款\n\n接收方应对本文件内容严格保密，仅可用于评估与 {company} 合作事宜之目的。"
+    "接收方应采取不低于保护自身机密信息的措施保护本文件，并在合作终止后销毁全部副本。"
+    "本条款自 {date} 起生效。",
+    "## 修订记录\n\n| 版本 | 日期 | 说明 |\n|---|---|---|\n| 1.0 | {date} | 初稿 |\n| 1.1 | {date} | 根据评审意见修订 |\n"
+    "| 2.0 | {date} | 正式发布，适用于 {company} 全部业务部门 |",
+]
+HEADER = "# {title}\n\n{company} 文档中心 · 内部资料 · 请勿外传 · 生成日期 {date} · 页码 1\n"
+_BODY_WORD_RE = re.compile(r'\bw\d+\b')
+
+
+def make_corpus(docs, sections, words, seed=0):
+    """
+    生成合成语料: 每篇文档 = 模板页眉 + 若干正文章节 (随机词) + 模板段落 (只替换公司名、日期、编号)
+
+    Returns:
+        list: [(file_id, markdown_text), ...]
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [f'w{i}' for i in range(words)]
+    corpus = []
+    for doc in range(docs):
+        fields = {
+            'title': f'报告 {doc}',
+            'company': f'公司{rng.integers(0, 20)}',
+            'date': f'2024-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}',
+            'number': f'DOC-{doc:06d}'
+        }
+        parts = [HEADER.format(**fields)]
+        for section in range(sections):
+            body = ' '.join(rng.choice(vocabulary, size=int(rng.integers(120, 240))))
+            parts.append(f"## 第 {section + 1} 节\n\n{body}\n")
+        parts.extend(template.format(**fields) + '\n' for template in BOILERPLATE)
+        corpus.append((f'{doc:032d}', '\n'.join(parts)))
+    return corpus
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build(chunks, path, embedder):
+    """建立全文索引与向量索引，返回 (全文索引, 向量存储)."""
+    bm25 = SearchIndexStore(os.path.join(path, 'bm25'), compact_threshold=len(chunks) + 1)
+    bm25.add_documents((f'{file_id}/{chunk_id}', text) for chunk_id, file_id, text in chunks)
+    bm25.compact()
+    store = VectorStore(os.path.join(path, 'vectors'), dim=embedder.dim, dtype='float32')
+    for start in range(0, len(chunks), 1024):
+        batch = chunks[start:start + 1024]
+        store.add(embedder.embed([text for _, _, text in batch]),
+                  [chunk_id for chunk_id, _, _ in batch], [file_id for _, file_id, _ in batch])
+    return bm25, store
+
+
+def measure(name, chunks, path, embedder, queries, cluster_of, k=10):
+    bm25, store = build(chunks, path, embedder)
+    query_vectors = embedder.embed(queries)
+    latencies = {'bm25': [], 'dense': []}
+    redundant = 0
+    for query, vector in zip(queries, query_vectors):
+        started = time.perf_counter()
+        lexical = bm25.search(query, top_k=k)
+        latencies['bm25'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        store.search(vector, top_k=k)
+        latencies['dense'].append(time.perf_counter() - started)
+        clusters = [cluster_of(key.split('/', 1)[1]) for key, _ in lexical]
+        redundant += len(clusters) - len(set(clusters))
+    print(f"{name:>6} {len(chunks):>10} {directory_size(path) / 2 ** 20:>10.1f} "
+          f"{np.median(latencies['bm25']) * 1000:>10.2f} {np.median(latencies['dense']) * 1000:>10.2f} "
+          f"{redundant / (len(queries) * k):>10.1%}")
+
+
+def run(docs, sections, words, num_queries):
+    corpus = make_corpus(docs, sections, words)
+    chunks = []
+    boilerplate_ids = set()
+    for file_id, text in corpus:
+        for chunk in iter_markdown_chunks(io.BytesIO(text.encode('utf-8'))):
+            chunk_id = f'{len(chunks):032d}'
+            chunks.append((chunk_id, file_id, chunk['text']))
+            if not _BODY_WORD_RE.search(chunk['text']):
+                boilerplate_ids.add(chunk_id)
+    rng = np.random.default_rng(1)
+    # 查询: 正文中的几个词 + 常见模板词 (模拟用户问题中混入的高频词)
+    queries = []
+    for _ in range(num_queries):
+        _, _, text = chunks[int(rng.integers(0, len(chunks)))]
+        words_in_chunk = text.split()
+        queries.append(' '.join(rng.choice(words_in_chunk, size=min(4, len(words_in_chunk)))) + ' 文件 内部')
+
+    embedder = HashingEmbedder(256)
+    print(f"语料: {docs} 篇文档, {len(chunks)} 个分块 (模板分块 {len(boilerplate_ids)}), 查询 {num_queries}")
+    with tempfile.TemporaryDirectory() as path:
+        dedup = DedupIndex(os.path.join(path, 'dedup'))
+        started = time.perf_counter()
+        duplicates = {}
+        by_file = {}
+        for chunk in chunks:
+            by_file.setdefault(chunk[1], []).append(chunk)
+        for file_chunks in by_file.values():
+            duplicates.update(dedup.assign(file_chunks))
+        seconds = time.perf_counter() - started
+        false_positives = sum(chunk_id not in boilerplate_ids for chunk_id in duplicates)
+        print(f"去重: {seconds:.2f}s ({len(chunks) / seconds:.0f} 分块/s), 近重复 {len(duplicates)}, "
+              f"误判 {false_positives}, 簇 {dedup.stats()['clusters']}")
+
+        def cluster_of(chunk_id):
+            return duplicates.get(chunk_id, chunk_id)
+
+        print(f"\n{'':>6} {'分块数':>10} {'磁盘 MiB':>10} {'BM25 p50':>10} {'向量 p50':>10} {'冗余结果':>10}")
+        measure('不去重', chunks, os.path.join(path, 'baseline'), embedder, queries, cluster_of)
+        representatives = [chunk for chunk in chunks if chunk[0] not in duplicates]
+        measure('去重', representatives, os.path.join(path, 'dedup-index'), embedder, queries, cluster_of)
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description='近重复分块去重基准测试')
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=4, help='每篇文档的正文章节数')
+    parser.add_argument('--words', type=int, default=20000, help='正文词汇量')
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+    run(args.docs, args.sections, args.words, args.queries)
@@ -0,0 +1,167 @@
+"""
+基准测试用的本地后端
+在内存中实现文件上传、分块与检索路径用到的 minio_config / db_utils 接口 (对象存储与 files / folders /
+chunks 表)，使基准测试不依赖 MinIO 和 MySQL 即可运行. 只能在导入 chunk_indexer、retrieval 等模块之前
+调用 install()，不能用于服务进程.
+"""
+import io
+import sys
+import threading
+import types
+import uuid
+from datetime import datetime
+
+
+class _ObjectResponse(io.BytesIO):
+    """get_object 的返回值 (与 urllib3 响应一样支持 read / close / release_conn)."""
+
+    def release_conn(self):
+        pass
+
+
+class LocalObjectStore:
+    """内存对象存储，接口与 Minio 客户端中用到的部分一致."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, bucket_name, object_name, data, length=-1, content_type=None, metadata=None, **kwargs):
+        content = data.read() if length is None or length < 0 else data.read(length)
+        with self._lock:
+            self.objects[object_name] = content
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, **kwargs):
+        content = self.objects[object_name]
+        return _ObjectResponse(content[offset:offset + length] if length else content[offset:])
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        return types.SimpleNamespace(object_name=object_name, size=len(self.objects[object_name]))
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        with self._lock:
+            self.objects.pop(object_name, None)
+
+
+class LocalBackend:
+    """内存中的 files / folders / chunks 表与对象存储."""
+
+    def __init__(self):
+        self.minio = LocalObjectStore()
+        self.files = {}
+        self.folders = {}
+        self.chunks = {}
+        self._lock = threading.Lock()
+
+    # ---- minio_config ----
+
+    def upload_file_to_minio(self, file_data, object_name, target_bucket_name=None, content_type=None, metadata=None, file_size=None):
+        data = file_data if hasattr(file_data, 'read') else io.BytesIO(file_data)
+        self.minio.put_object('local', object_name, data, file_size if file_size is not None else -1)
+        return True
+
+    def delete_file_from_minio(self, object_name, target_bucket_name=None):
+        self.minio.remove_object('local', object_name)
+        return True
+
+    # ---- db_utils ----
+
+    def insert_folder(self, name, parent_id=None, created_by=None):
+        folder_id = uuid.uuid4().hex
+        with self._lock:
+            self.folders[folder_id] = {'id': folder_id, 'name': name, 'parent_id': parent_id, 'created_by': created_by}
+        return folder_id
+
+    def insert_file(self, id, name, location, size, file_type, folder_id=None, created_by=None, derived_from_file_id=None):
+        with self._lock:
+            self.files[id] = {
+                'id': id, 'name': name, 'location': location, 'size': size, 'type': file_type,
+                'folder_id': folder_id, 'upload_date': datetime.now(), 'created_by': created_by,
+                'derived_from_file_id': derived_from_file_id
+            }
+        return id
+
+    def get_file_by_id(self, file_id):
+        file_details = self.files.get(file_id)
+        return dict(file_details) if file_details else None
+
+    def replace_file_chunks(self, file_id, derived_from_file_id, chunks, batch_size=500):
+        now = datetime.now()
+        with self._lock:
+            for chunk_id in [chunk_id for chunk_id, chunk in self.chunks.items() if chunk['file_id'] == file_id]:
+                del self.chunks[chunk_id]
+            for chunk in chunks:
+                chunk_id = chunk.get('id') or uuid.uuid4().hex
+                self.chunks[chunk_id] = dict(chunk, id=chunk_id, file_id=file_id,
+                                             derived_from_file_id=derived_from_file_id, created_at=now)
+        return True
+
+    def get_file_chunks(self, file_id):
+        with self._lock:
+            rows = [dict(chunk) for chunk in self.chunks.values() if chunk['file_id'] == file_id]
+        return sorted(rows, key=lambda chunk: chunk['chunk_index'])
+
+    def delete_file_chunks(self, file_id):
+        with self._lock:
+            chunk_ids = [chunk_id for chunk_id, chunk in self.chunks.items() if chunk['file_id'] == file_id]
+            for chunk_id in chunk_ids:
+                del self.chunks[chunk_id]
+        return len(chunk_ids)
+
+    def get_chunks_by_ids(self, chunk_ids):
+        result = {}
+        for chunk_id in chunk_ids:
+            chunk = self.chunks.get(chunk_id)
+            if chunk is None:
+                continue
+            file_details = self.files[chunk['file_id']]
+            result[chunk_id] = dict(chunk, file_name=file_details['name'], location=file_details['location'],
+                                    folder_id=file_details['folder_id'])
+        return result
+
+    def get_folder_subtree_ids(self, folder_id):
+        subtree, frontier = [folder_id], [folder_id]
+        while frontier:
+            frontier = [f['id'] for f in self.folders.values() if f['parent_id'] in frontier]
+            subtree.extend(frontier)
+        return subtree
+
+    def get_folder_ancestor_ids(self, folder_id):
+        ancestors = []
+        while folder_id is not None:
+            ancestors.append(folder_id)
+            folder_id = self.folders.get(folder_id, {}).get('parent_id')
+        return ancestors
+
+    def get_file_ids(self, folder_ids=None, file_ids=None, created_by=None):
+        folder_ids = set(folder_ids) if folder_ids is not None else None
+        file_ids = set(file_ids) if file_ids is not None else None
+        return [
+            file_id for file_id, f in self.files.items()
+            if (folder_ids is None or f['folder_id'] in folder_ids)
+            and (file_ids is None or file_id in file_ids)
+            and (created_by is None or f['created_by'] == created_by)
+        ]
+
+    def install(self):
+        """以 minio_config / db_utils 模块的形式注册到 sys.modules."""
+        minio_config = types.ModuleType('minio_config')
+        minio_config.minio_client = self.minio
+        minio_config.bucket_name = 'local'
+        minio_config.init_minio_client = lambda: True
+        minio_config.upload_file_to_minio = self.upload_file_to_minio
+        minio_config.delete_file_from_minio = self.delete_file_from_minio
+        minio_config.get_file_url = lambda object_name, target_bucket_name=None, expires=604800: f'local://{object_name}'
+
+        db_utils = types.ModuleType('db_utils')
+        db_utils.generate_uuid = lambda: uuid.uuid4().hex
+        db_utils.init_db_connection_pool = lambda: True
+        for name in ('insert_folder', 'insert_file', 'get_file_by_id', 'replace_file_chunks', 'get_file_chunks',
+                     'delete_file_chunks', 'get_chunks_by_ids', 'get_folder_subtree_ids', 'get_folder_ancestor_ids',
+                     'get_file_ids'):
+            setattr(db_utils, name, getattr(self, name))
+
+        for name, module in (('minio_config', minio_config), ('db_utils', db_utils)):
+            if name in sys.modules and sys.modules[name] is not module:
+                raise RuntimeError(f"{name} 已被导入，必须在导入索引模块之前安装本地后端")
+            sys.modules[name] = module
@@ -0,0 +1,111 @@
+"""
+文件名检索基准测试
+生成中英文混合的合成文件名，重建 n-gram 文件名索引后，测量不同选择度查询的首页与翻页延迟，
+并与逐行子串匹配 (相当于 LIKE '%x%' 全表扫描) 对比.
+
+用法 (在 src 目录下): python -m benchmarks.name_search_benchmark --files 1000000
+"""
+import os
+
+# 单核测量: 必须在导入 numpy 之前限制 BLAS 线程数
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import logging
+import tempfile
+import time
+import numpy as np
+
+from name_index import NameIndexStore, normalize_name
+
+_ZH_WORDS = ['合同', '报告', '年度', '财务', '预算', '会议纪要', '项目', '计划书', '设计方案', '测试用例', '数据分析',
+             '采购', '审批', '季度', '总结', '客户', '培训', '制度', '发票', '说明书']
+_EN_WORDS = ['report', 'budget', 'plan', 'final', 'draft', 'meeting', 'notes', 'invoice', 'design', 'spec',
+             'summary', 'contract', 'review', 'roadmap', 'manual', 'backup', 'export', 'proposal', 'minutes', 'data']
+_EXTENSIONS = ['.pdf', '.docx', '.xlsx', '.md', '.pptx', '.txt', '.csv', '.png']
+
+# (说明, 查询)
+QUERIES = [
+    ('高选择度 (编号)', 'INV-{number}'),
+    ('中文词组', '设计方案 2023'),
+    ('中文单字 (前缀扫描)', '纪'),
+    ('英文子串', 'ropos'),
+    ('常见扩展名 (低选择度)', '.pdf'),
+]
+
+
+def make_names(count, seed=0):
+    rng = np.random.default_rng(seed)
+    zh = rng.integers(0, len(_ZH_WORDS), size=(count, 2))
+    en = rng.integers(0, len(_EN_WORDS), size=(count, 2))
+    years = rng.integers(2015, 2026, size=count)
+    extensions = rng.integers(0, len(_EXTENSIONS), size=count)
+    styles = rng.integers(0, 3, size=count)
+    names = []
+    for i in range(count):
+        if styles[i] == 0:
+            stem = f'{_ZH_WORDS[zh[i, 0]]}{_ZH_WORDS[zh[i, 1]]}_{years[i]}'
+        elif styles[i] == 1:
+            stem = f'{_EN_WORDS[en[i, 0]]}-{_EN_WORDS[en[i, 1]]}-{years[i]}-INV-{i:07d}'
+        else:
+            stem = f'{years[i]} {_ZH_WORDS[zh[i, 0]]} {_EN_WORDS[en[i, 0]]} v{i % 9}'
+        names.append(stem + _EXTENSIONS[extensions[i]])
+    return names
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+    return result, np.asarray(latencies) * 1000
+
+
+def run(count, page_size, repeat):
+    names = make_names(count)
+    file_ids = [f'{i:032x}' for i in range(count)]
+    normalized = [normalize_name(name) for name in names]
+    number = next(name for name in normalized[count // 2:] if '-inv-' in name).split('-inv-')[1][:7]
+    print(f"文件数 {count}, 每页 {page_size}")
+    with tempfile.TemporaryDirectory() as path:
+        store = NameIndexStore(path)
+        started = time.perf_counter()
+        store.rebuild(zip(file_ids, names))
+        print(f"重建索引: {time.perf_counter() - started:.1f}s, 磁盘 {directory_size(path) / 2 ** 20:.1f} MiB")
+
+        print(f"\n{'查询':<24} {'匹配数':>10} {'首页 p50':>10} {'首页 p99':>10} {'第 5 页 p50':>12} {'全表扫描':>10} (ms)")
+        for label, query in QUERIES:
+            query = query.format(number=number)
+            (hits, total, next_key), first = timed(lambda: store.search(query, limit=page_size), repeat)
+            cursor = next_key
+            for _ in range(3):
+                if cursor:
+                    cursor = store.search(query, limit=page_size, after=cursor)[2]
+            _, later = timed(lambda: store.search(query, limit=page_size, after=cursor), repeat) if cursor else (None, [0.0])
+            terms = normalize_name(query).split()
+            scan_total, scan = timed(lambda: sum(all(term in name for term in terms) for name in normalized), 1)
+            assert scan_total == total, (query, scan_total, total)
+            print(f"{label:<24} {total:>10} {np.median(first):>10.2f} {np.percentile(first, 99):>10.2f} "
+                  f"{np.median(later):>12.2f} {scan[0]:>10.1f}")
+
+        # 写入: 在已有基础段上追加
+        started = time.perf_counter()
+        for i in range(1000):
+            store.add(f'{count + i:032x}', f'新增文件 {i}.md')
+        print(f"\n增量写入 1000 个文件名: {(time.perf_counter() - started) / 1000 * 1000:.2f} ms/个 (含日志 fsync)")
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description='文件名 n-gram 检索基准测试')
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    run(args.files, args.page_size, args.repeat)
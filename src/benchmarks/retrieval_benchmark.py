@@ -0,0 +1,322 @@
+"""
+检索质量与延迟基准测试
+生成 (或从目录载入) 中英双语 Markdown 语料，经与 file_api 上传路径相同的步骤 (上传对象 -> 写入文件记录)
+写入本地后端 (参见 benchmarks/local_backend.py)，建立分块索引后运行带标注的查询集，
+以 JSON 输出各检索方式 (hybrid / lexical / dense) 的 recall@k、MRR、p50/p95/p99 延迟和索引构建耗时，
+便于在不同提交之间对比.
+
+查询集为 JSON Lines，每行 {"query", "file" (文件名), "heading" (可选，分块标题路径的后缀), "lang" (可选)}；
+检索结果中属于该文件且标题匹配的分块视为相关.
+
+用法 (在 src 目录下):
+    python -m benchmarks.retrieval_benchmark --docs 300 --output result.json
+    python -m benchmarks.retrieval_benchmark --corpus ./docs --queries ./queries.jsonl
+"""
+import os
+
+# 单核测量: 必须在导入 numpy 之前限制 BLAS 线程数
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import io
+import json
+import logging
+import mimetypes
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+
+from benchmarks.local_backend import LocalBackend
+
+# 索引目录与缓存都放在临时工作目录中 (必须在导入索引模块之前设置)
+_INDEX_DIRS = {
+    'SEARCH_INDEX_DIR': 'search_index',
+    'CHUNK_SEARCH_INDEX_DIR': 'chunk_index',
+    'VECTOR_STORE_DIR': 'vector_store',
+    'ANN_INDEX_DIR': 'ann_index',
+    'EMBED_CACHE_DIR': 'embedding_cache',
+    'QUERY_CACHE_DIR': 'query_cache',
+    'DEDUP_DIR': 'dedup',
+    'CHUNK_STORE_DIR': 'chunk_store',
+}
+
+_ZH_CHARS = (
+    '数据模型训练推理服务部署配置存储索引检索向量文本分析报告用户权限日志监控网络缓存队列任务调度接口'
+    '安全备份恢复迁移版本测试性能优化集群节点容器镜像负载均衡消息通知审批流程合同财务采购库存订单客户'
+)
+_ZH_FILLER = [
+    '本节介绍相关功能的使用方法和注意事项。', '在实际使用中需要结合业务场景进行调整。',
+    '如果遇到问题，请先检查系统日志并确认配置是否正确。', '下面给出一个典型的操作示例。',
+    '该功能在最近的版本中进行了改进。', '请注意不同环境之间的差异。', '更多细节可以参考附录中的说明。',
+]
+_EN_SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'vex', 'qui', 'zan', 'pol', 'dri', 'mus', 'fen',
+                 'sal', 'bri', 'gon', 'tel', 'nax', 'oru', 'pim', 'syl', 'wek', 'yar', 'cor', 'hul']
+_EN_FILLER = [
+    'This section describes how the feature works and what to watch out for.',
+    'In practice the settings should be adjusted to the workload.',
+    'If something goes wrong, check the service logs and verify the configuration first.',
+    'A typical example is shown below.', 'The behaviour was improved in a recent release.',
+    'Keep in mind that environments can differ.', 'See the appendix for more details.',
+]
+_ZH_QUESTION = ['如何', '怎么', '为什么', '哪里']
+_EN_QUESTION = ['how to', 'why does', 'where is', 'what is']
+
+
+def _key_term(rng, lang):
+    if lang == 'zh':
+        return ''.join(rng.choice(list(_ZH_CHARS), size=3))
+    return ''.join(rng.choice(_EN_SYLLABLES, size=3))
+
+
+def make_corpus(docs, sections=6, seed=0):
+    """
+    生成合成语料: 中文、英文与中英混合 (中文正文 + 英文术语) 文档各占三分之一.
+    每个章节含 3 个随机生成的专有术语，查询由其中 2 个术语和疑问词组成.
+
+    Returns:
+        tuple: ([(文件名, Markdown 文本), ...], [查询标注 dict, ...])
+    """
+    rng = np.random.default_rng(seed)
+    corpus, queries = [], []
+    for doc in range(docs):
+        lang = ('zh', 'en', 'mixed')[doc % 3]
+        filler = _EN_FILLER if lang == 'en' else _ZH_FILLER
+        term_lang = 'zh' if lang == 'zh' else 'en'
+        name = f'doc-{doc:05d}.md'
+        # 引言不少于 CHUNK_MIN_TOKENS 个词元，使其自成一块，第 1 节不会并入文档标题下的分块
+        intro = ' '.join(rng.choice(filler, size=12))
+        parts = [f"# {'Document' if lang == 'en' else '文档'} {doc}\n\n{intro}\n"]
+        for section in range(sections):
+            heading = f'Section {section + 1}' if lang == 'en' else f'第 {section + 1} 节'
+            terms = [_key_term(rng, term_lang) for _ in range(3)]
+            sentences = []
+            for _ in range(int(rng.integers(8, 14))):
+                sentence = str(rng.choice(filler))
+                if rng.random() < 0.5:
+                    sentence = f'{rng.choice(terms)} {sentence}'
+                sentences.append(sentence)
+            sentences.extend(terms)
+            parts.append(f"## {heading}\n\n{' '.join(sentences)}\n")
+            question = _EN_QUESTION if term_lang == 'en' else _ZH_QUESTION
+            queries.append({
+                'query': f"{rng.choice(question)} {' '.join(rng.choice(terms, size=2, replace=False))}",
+                'file': name,
+                'heading': heading,
+                'lang': lang,
+            })
+        corpus.append((name, '\n'.join(parts)))
+    order = rng.permutation(len(queries))
+    return corpus, [queries[i] for i in order]
+
+
+def load_corpus(directory, queries_path):
+    """从目录载入 *.md 语料与 JSON Lines 查询集."""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.md'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                corpus.append((name, f.read()))
+    with open(queries_path, encoding='utf-8') as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    return corpus, queries
+
+
+def upload(name, content, folder_id=None):
+    """与 file_api 上传接口相同的步骤: 上传对象，再写入文件记录. 返回文件 ID."""
+    from db_utils import generate_uuid, insert_file
+    from minio_config import upload_file_to_minio
+
+    data = content.encode('utf-8')
+    object_name = f"{uuid.uuid4().hex}_{name}"
+    if folder_id:
+        object_name = f"{folder_id}/{object_name}"
+    file_type = mimetypes.guess_type(name)[0] or 'text/markdown'
+    if not upload_file_to_minio(io.BytesIO(data), object_name, content_type=file_type,
+                                metadata={'filename': name}, file_size=len(data)):
+        raise RuntimeError(f'上传失败: {name}')
+    file_id = generate_uuid()
+    if not insert_file(id=file_id, name=name, location=object_name, size=len(data),
+                       file_type=file_type, folder_id=folder_id):
+        raise RuntimeError(f'写入文件记录失败: {name}')
+    return file_id
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _percentiles(latencies):
+    values = np.asarray(latencies) * 1000
+    return {
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def _quality(ranks, ks):
+    """ranks: 每个查询第一个相关结果的名次 (从 1 开始，未命中为 None)."""
+    metrics = {f'recall@{k}': round(sum(r is not None and r <= k for r in ranks) / len(ranks), 4) for k in ks}
+    metrics['mrr'] = round(sum(1.0 / r for r in ranks if r is not None) / len(ranks), 4)
+    return metrics
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(corpus, queries, ks=(1, 5, 10), candidates=None, ann=False, work_dir=None):
+    """
+    上传语料、建立索引并评测
+
+    Returns:
+        dict: 基准测试报告
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix='retrieval-bench-')
+    for name, subdirectory in _INDEX_DIRS.items():
+        os.environ[name] = os.path.join(work_dir, subdirectory)
+    os.environ['QUERY_CACHE_SIZE'] = '0'  # 测量未缓存的检索
+    backend = LocalBackend()
+    backend.install()
+
+    from ann_index import build_from_vector_store, get_ann_index
+    from chunk_indexer import index_file
+    from embedding_service import embed_texts
+    from retrieval import dense_search, lexical_search, search_chunks
+    from vector_store import get_vector_store
+
+    started = time.perf_counter()
+    file_ids = {name: upload(name, content) for name, content in corpus}
+    upload_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for file_id in file_ids.values():
+        result = index_file(file_id)
+        if not result['success']:
+            raise RuntimeError(f"索引失败: {result['message']}")
+    index_seconds = time.perf_counter() - started
+    build = {
+        'upload_seconds': round(upload_seconds, 3),
+        'index_seconds': round(index_seconds, 3),
+        'chunks': len(backend.chunks),
+        'chunks_per_second': round(len(backend.chunks) / index_seconds, 1),
+    }
+    if ann:
+        started = time.perf_counter()
+        build_from_vector_store(get_ann_index(), get_vector_store(), nlist=max(int(np.sqrt(len(backend.chunks))), 1))
+        build['ann_train_seconds'] = round(time.perf_counter() - started, 3)
+    build['index_bytes'] = {
+        subdirectory: directory_size(os.environ[name]) for name, subdirectory in _INDEX_DIRS.items()
+        if os.path.isdir(os.environ[name]) and subdirectory not in ('query_cache', 'search_index')
+    }
+
+    # 查询向量预先批量计算 (报告单独计时)，各检索方式的延迟不含 embedding 服务的攒批等待，互相可比
+    started = time.perf_counter()
+    embed_texts([label['query'] for label in queries])
+    build['query_embed_seconds'] = round(time.perf_counter() - started, 3)
+
+    limit = max(ks)
+
+    stages = {}
+
+    def hybrid(query):
+        result = search_chunks(query, top_k=limit, candidates=candidates)
+        for name, value in result['timings'].items():
+            stages.setdefault(name, []).append(value)
+        return [(item['chunk_id'], item['file_id'], item['heading']) for item in result['items']]
+
+    def single(fn):
+        def search(query):
+            hits = fn(query, limit)
+            chunks = backend.get_chunks_by_ids([chunk_id for chunk_id, _, _ in hits])
+            return [(chunk_id, chunks[chunk_id]['file_id'], chunks[chunk_id]['heading'])
+                    for chunk_id, _, _ in hits if chunk_id in chunks]
+        return search
+
+    modes = {'hybrid': hybrid, 'lexical': single(lexical_search), 'dense': single(dense_search)}
+    results = {}
+    for mode, search in modes.items():
+        search(queries[0]['query'])  # 预热 (建立 mmap、线程池)
+        latencies, ranks, by_lang = [], [], {}
+        for label in queries:
+            target = file_ids.get(label['file'])
+            started = time.perf_counter()
+            hits = search(label['query'])
+            latencies.append(time.perf_counter() - started)
+            rank = next((position for position, (_, file_id, heading) in enumerate(hits, start=1)
+                         if file_id == target and (not label.get('heading') or (heading or '').endswith(label['heading']))),
+                        None)
+            ranks.append(rank)
+            by_lang.setdefault(label.get('lang') or 'all', []).append(rank)
+        results[mode] = dict(_quality(ranks, ks), latency_ms=_percentiles(latencies),
+                             by_lang={lang: _quality(lang_ranks, ks) for lang, lang_ranks in sorted(by_lang.items())})
+    # search_chunks 各阶段的平均耗时 (ms)
+    results['hybrid']['stages_ms'] = {name: round(float(np.mean(values)), 3) for name, values in stages.items()}
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'embedding_url': os.getenv('EMBEDDING_URL', 'stub'),
+            'ann': ann,
+        },
+        'corpus': {
+            'documents': len(corpus),
+            'bytes': sum(len(content.encode('utf-8')) for _, content in corpus),
+            'queries': len(queries),
+        },
+        'build': build,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    # 索引模块在 run() 中才导入，先配置根日志器，使其模块级的 basicConfig 不再生效
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='检索质量 (recall@k / MRR) 与延迟基准测试，输出 JSON')
+    parser.add_argument('--docs', type=int, default=300, help='生成的文档数 (未指定 --corpus 时)')
+    parser.add_argument('--sections', type=int, default=6, help='每篇生成文档的章节数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus', help='Markdown 语料目录 (需同时指定 --queries)')
+    parser.add_argument('--queries', help='查询集 JSON Lines')
+    parser.add_argument('--max-queries', type=int, default=None)
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--candidates', type=int, default=None, help='每一路检索的候选数')
+    parser.add_argument('--ann', action='store_true', help='训练 ANN 索引，稠密检索走 ANN')
+    parser.add_argument('--output', help='JSON 输出文件 (默认输出到标准输出)')
+    parser.add_argument('--keep', action='store_true', help='保留临时索引目录')
+    args = parser.parse_args()
+
+    if args.corpus:
+        if not args.queries:
+            parser.error('--corpus 需要同时指定 --queries')
+        corpus, queries = load_corpus(args.corpus, args.queries)
+    else:
+        corpus, queries = make_corpus(args.docs, args.sections, args.seed)
+    queries = queries[:args.max_queries] if args.max_queries else queries
+
+    work_dir = tempfile.mkdtemp(prefix='retrieval-bench-')
+    try:
+        report = run(corpus, queries, ks=sorted(set(args.k)), candidates=args.candidates, ann=args.ann, work_dir=work_dir)
+        report['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'keep')}
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
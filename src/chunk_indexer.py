@@ -0,0 +1,205 @@
+"""
+分块索引模块
+对 Markdown 文件分块后，为每个分块建立全文索引 (BM25) 和向量索引 (向量存储 + ANN)，
+文件删除或重新分块时同步清理旧分块的索引. 编辑后重新分块只为内容变化的分块重建索引.
+近重复分块 (参见 dedup_index) 只为每簇的代表分块建立索引.
+分块文本同时写入本地列式分块存储 (参见 chunk_store)，检索时不必再从 MinIO 读取.
+
+用法: python chunk_indexer.py <file_id> [<file_id> ...] --workers 4
+"""
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+
+from ann_index import get_ann_index
+from chunk_store import ChunkBatch, get_chunk_store
+from chunker import CHUNK_WORKERS, _init_chunk_worker, chunk_file, chunk_files
+from db_utils import delete_file_chunks, generate_uuid, get_chunks_by_ids, get_file_by_id, get_file_chunks
+from dedup_index import get_dedup_index
+from embedding_service import embed_texts
+from query_cache import invalidate_folders
+from search_index import get_chunk_index
+from vector_store import get_vector_store
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHUNK_INDEX_BATCH_SIZE = int(os.getenv('CHUNK_INDEX_BATCH_SIZE', 256))
+
+
+def chunk_key(file_id, chunk_id):
+    """分块在全文索引中的 key，前缀为文件 ID 以便按文件过滤."""
+    return f'{file_id}/{chunk_id}'
+
+
+def _index_chunks(file_id, chunks):
+    """为分块建立全文索引和向量索引."""
+    if not chunks:
+        return
+    get_chunk_index().add_documents((chunk_key(file_id, chunk_id), text) for chunk_id, text in chunks)
+    # embedding 服务负责分批调用 embedder，未修改的分块直接命中缓存
+    chunk_ids = [chunk_id for chunk_id, _ in chunks]
+    vectors = embed_texts([text for _, text in chunks])
+    get_vector_store().add(vectors, chunk_ids, [file_id] * len(chunks))
+    ann = get_ann_index()
+    if ann.is_trained:
+        ann.add(vectors, chunk_ids, [file_id] * len(chunks))
+
+
+def add_chunk_index(file_id, chunks, exclude=None):
+    """
+    为分块建立全文索引和向量索引. 与已有分块近重复的分块只记录到去重簇，不建立索引
+
+    Args:
+        file_id (str): Markdown 文件 ID
+        chunks (list): [(chunk_id, text), ...]
+        exclude (set, optional): 不能作为去重代表的分块 ID (即将被删除的旧分块)
+
+    Returns:
+        int: 建立索引的分块数
+    """
+    dedup = get_dedup_index()
+    if dedup is not None and chunks:
+        duplicates = dedup.assign([(chunk_id, file_id, text) for chunk_id, text in chunks], exclude)
+        chunks = [(chunk_id, text) for chunk_id, text in chunks if chunk_id not in duplicates]
+    _index_chunks(file_id, chunks)
+    return len(chunks)
+
+
+def _index_promoted(promotions):
+    """为接替代表的近重复分块建立索引 (分块文本从 MinIO 按字节区间读取)."""
+    from retrieval import load_chunk_texts
+
+    chunks = get_chunks_by_ids([chunk_id for chunk_id, _, _ in promotions])
+    items = [dict(chunk, chunk_id=chunk_id) for chunk_id, chunk in chunks.items()]
+    load_chunk_texts(items)
+    by_file = {}
+    for item in items:
+        if item['text'] is None:
+            logging.error(f"近重复分块接替代表后无法建立索引: {item['chunk_id']}")
+            continue
+        by_file.setdefault(item['file_id'], []).append((item['chunk_id'], item['text']))
+    for file_id, chunks in by_file.items():
+        _index_chunks(file_id, chunks)
+
+
+def remove_chunk_index(file_id, chunk_ids):
+    """
+    从全文索引和向量索引中删除指定分块.
+    被删除的去重代表由簇内其他分块接替，接替的分块补建索引.
+    """
+    if not chunk_ids:
+        return
+    dedup = get_dedup_index()
+    promotions = dedup.remove(chunk_ids) if dedup is not None else []
+    if promotions:
+        _index_promoted(promotions)
+    get_chunk_index().delete_documents([chunk_key(file_id, chunk_id) for chunk_id in chunk_ids])
+    get_vector_store().delete_chunks(chunk_ids)
+    get_ann_index().delete_chunks(chunk_ids)
+
+
+def index_file(file_id):
+    """
+    重新分块文件并增量更新分块索引.
+    新分块按 content_hash 与旧分块比对: 内容未变的分块沿用原 ID 和已有索引 (偏移随编辑平移)，
+    只有新增或修改的分块需要向量化和写入索引，被替换的旧分块从索引中删除.
+    分块每攒够 CHUNK_INDEX_BATCH_SIZE 个就写入分块存储并建立索引，内存中不保留整个文件的分块文本.
+    新分块的索引建立之后才删除旧分块的索引，检索不会出现空窗; 分块失败时撤销已写入的新分块.
+
+    Args:
+        file_id (str): Markdown 文件 ID
+
+    Returns:
+        dict: chunk_file 的结果，附加 reused / added / removed 分块数
+    """
+    old_chunks = get_file_chunks(file_id)
+    reusable = {}  # content_hash -> 可沿用的旧分块 ID (按原顺序)
+    for chunk in old_chunks:
+        reusable.setdefault(chunk['content_hash'], []).append(chunk['id'])
+    # 尚未被沿用的旧分块，分块结束后即被删除
+    unclaimed = {chunk['id'] for chunk in old_chunks}
+    chunk_ids, added_ids = [], []
+    pending = {'batch': ChunkBatch(), 'added': []}
+    stats = {'indexed': 0}
+    store = get_chunk_store()
+
+    def flush():
+        store.append_file(file_id, pending['batch'])
+        # 修改后的分块与自身旧版本近重复，不能归入即将删除的旧分块的簇
+        stats['indexed'] += add_chunk_index(file_id, pending['added'], exclude=unclaimed)
+        pending['batch'], pending['added'] = ChunkBatch(), []
+
+    def collect(file_details, chunk):
+        candidates = reusable.get(chunk['content_hash'])
+        if candidates:
+            chunk['id'] = candidates.pop(0)
+            unclaimed.discard(chunk['id'])
+        else:
+            chunk['id'] = generate_uuid()
+            added_ids.append(chunk['id'])
+            pending['added'].append((chunk['id'], chunk['text']))
+        chunk_ids.append(chunk['id'])
+        pending['batch'].append(chunk['id'], chunk)
+        if len(pending['batch']) >= CHUNK_INDEX_BATCH_SIZE:
+            flush()
+
+    result = chunk_file(file_id, consumer=collect)
+    if result['success']:
+        try:
+            flush()
+        except Exception as e:
+            logging.error(f"文件 {file_id} 分块索引写入失败: {e}")
+            result.update(success=False, message=str(e))
+    if not result['success']:
+        # 撤销已分批写入的新分块，旧分块与其索引保持不变
+        remove_chunk_index(file_id, added_ids)
+        store.revert_file(file_id, chunk_ids)
+        return result
+    store.prune_file(file_id, chunk_ids)
+    removed = [chunk['id'] for chunk in old_chunks if chunk['id'] in unclaimed]
+    remove_chunk_index(file_id, removed)
+    # 沿用的分块偏移也可能变化，缓存的检索结果一律失效
+    file_details = get_file_by_id(file_id)
+    invalidate_folders([file_details.get('folder_id') if file_details else None])
+    reused, added, indexed = len(chunk_ids) - len(added_ids), len(added_ids), stats['indexed']
+    result.update(reused=reused, added=added, removed=len(removed), deduplicated=added - indexed)
+    logging.info(f"文件 {file_id} 分块索引已更新: 沿用 {reused}, 新增 {added} (近重复 {added - indexed}), 删除 {len(removed)}")
+    return result
+
+
+def remove_file_index(file_id, folder_id=None):
+    """
+    删除文件的全部分块记录和分块索引
+
+    Args:
+        file_id (str): Markdown 文件 ID
+        folder_id (str, optional): 文件所在文件夹 (文件记录可能已删除，由调用方提供)，用于使检索缓存失效
+
+    Returns:
+        int: 删除的分块数
+    """
+    remove_chunk_index(file_id, [chunk['id'] for chunk in get_file_chunks(file_id)])
+    get_chunk_store().delete_files([file_id])
+    deleted = delete_file_chunks(file_id)
+    invalidate_folders([folder_id])
+    return deleted
+
+
+def index_files(file_ids, workers=None):
+    """使用进程池并行对多个文件执行 index_file."""
+    return chunk_files(file_ids, workers=workers, target=index_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='对 Markdown 文件分块并建立分块索引')
+    parser.add_argument('file_ids', nargs='+', help='Markdown 文件 ID')
+    parser.add_argument('--workers', type=int, default=CHUNK_WORKERS, help='并行进程数')
+    args = parser.parse_args()
+    _init_chunk_worker()
+    for result in index_files(args.file_ids, args.workers):
+        logging.info(result)
@@ -0,0 +1,482 @@
+"""
+分块列式存储模块
+在本地保存分块元数据和文本的列式副本，检索时直接按字节区间切片读取分块文本，
+不必逐个向 MinIO 发起区间读取，也不必把分块保存为 dict 列表 (每个分块数百字节的对象开销).
+
+文件 ID 驻留为整数序号；偏移、词元数等保存为定长列；全部分块文本拼接为一个 UTF-8 缓冲区，
+另存每行的结束偏移. 所有列都通过 mmap 访问，读取分块文本是对缓冲区的零拷贝 memoryview 切片.
+MySQL chunks 表仍是分块记录的权威来源，本存储缺失或过期的分块由调用方回退到 MinIO 读取.
+
+磁盘布局 (CHUNK_STORE_DIR):
+    CURRENT                     当前代号
+    gen-<代号>/files            驻留的文件 ID 表 (每条 32 字节，下标即文件序号，只追加)
+    gen-<代号>/fid              每行的文件序号 (uint32)
+    gen-<代号>/chunk_index      分块序号 (uint32)
+    gen-<代号>/tokens           词元数 (uint32)
+    gen-<代号>/start, end       分块在 Markdown 文件中的字节区间 (int64)
+    gen-<代号>/hash             分块文本的 SHA-256 (32 字节)
+    gen-<代号>/text             全部分块文本的 UTF-8 连续缓冲区
+    gen-<代号>/text_end         每行文本在 text 中的结束偏移 (int64，起点为上一行的结束偏移)
+    gen-<代号>/heading, heading_end   标题缓冲区与结束偏移，同上
+    gen-<代号>/cid              分块 ID (每条 32 字节，最后写入: 其大小决定读者可见的行数)
+    gen-<代号>/tombstones       已删除的行号 (int64，只追加)
+    LOCK                        fcntl 文件锁，多进程 (API / worker) 写入互斥
+
+替换一个文件的分块时旧行打墓碑、新行追加到末尾 (大文件分批追加，写完后再清除旧行)；墓碑比例超过 CHUNK_STORE_COMPACT_DEAD_RATIO 时
+把存活行重写为新一代文件.
+"""
+import logging
+import mmap
+import os
+import shutil
+import threading
+from array import array
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+from vector_store import ID_WIDTH, _encode_ids
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHUNK_STORE_DIR = os.getenv('CHUNK_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'chunk_store'))
+CHUNK_STORE_COMPACT_DEAD_RATIO = float(os.getenv('CHUNK_STORE_COMPACT_DEAD_RATIO', 0.3))
+CHUNK_STORE_COMPACT_MIN_ROWS = int(os.getenv('CHUNK_STORE_COMPACT_MIN_ROWS', 10000))
+
+_ID_DTYPE = np.dtype(f'S{ID_WIDTH}')
+_HASH_SIZE = 32
+# 定长列: 名称 -> (dtype, 每行的元素形状)；cid 必须最后写入
+_COLUMNS = {
+    'fid': (np.dtype(np.uint32), ()),
+    'chunk_index': (np.dtype(np.uint32), ()),
+    'tokens': (np.dtype(np.uint32), ()),
+    'start': (np.dtype(np.int64), ()),
+    'end': (np.dtype(np.int64), ()),
+    'hash': (np.dtype(np.uint8), (_HASH_SIZE,)),
+    'text_end': (np.dtype(np.int64), ()),
+    'heading_end': (np.dtype(np.int64), ()),
+    'cid': (_ID_DTYPE, ()),
+}
+_BUFFERS = {'text': 'text_end', 'heading': 'heading_end'}
+_RESORT_MIN_ROWS = 4096  # 未排序的尾部行超过该数 (且超过已排序行的 1/8) 时重建分块 ID 排序
+
+
+class ChunkBatch:
+    """
+    一个文件的分块的列式写入缓冲 (逐个追加分块，不保留 dict).
+    """
+
+    def __init__(self):
+        self.chunk_ids = bytearray()
+        self.chunk_index = array('I')
+        self.tokens = array('I')
+        self.start = array('q')
+        self.end = array('q')
+        self.hashes = bytearray()
+        self.text = bytearray()
+        self.text_end = array('q')
+        self.heading = bytearray()
+        self.heading_end = array('q')
+
+    def __len__(self):
+        return len(self.chunk_index)
+
+    def append(self, chunk_id, chunk):
+        """
+        追加一个分块
+
+        Args:
+            chunk_id (str): 分块 ID
+            chunk (dict): chunker 生成的分块 (chunk_index, start_offset, end_offset, token_count, heading, text, content_hash)
+        """
+        self.chunk_ids += _encode_ids([chunk_id]).tobytes()
+        self.chunk_index.append(chunk['chunk_index'])
+        self.tokens.append(chunk['token_count'])
+        self.start.append(chunk['start_offset'])
+        self.end.append(chunk['end_offset'])
+        self.hashes += bytes.fromhex(chunk['content_hash'])
+        self.text += chunk['text'].encode('utf-8')
+        self.text_end.append(len(self.text))
+        self.heading += (chunk.get('heading') or '').encode('utf-8')
+        self.heading_end.append(len(self.heading))
+
+
+def _map_buffer(path, size):
+    """只读 mmap 整个缓冲区文件 (前 size 字节有效)."""
+    if not size:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    """
+    基于内存映射列文件的分块存储，可被多个进程同时读写.
+    """
+
+    def __init__(self, path, compact_dead_ratio=None):
+        self.path = path
+        self.compact_dead_ratio = CHUNK_STORE_COMPACT_DEAD_RATIO if compact_dead_ratio is None else compact_dead_ratio
+        self._lock = threading.RLock()
+        self._lock_path = os.path.join(path, 'LOCK')
+        self._current_path = os.path.join(path, 'CURRENT')
+        os.makedirs(path, exist_ok=True)
+        self._generation = None
+
+    def _read_generation(self):
+        try:
+            with open(self._current_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _file(self, name, generation=None):
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.path, f'gen-{generation:06d}', name)
+
+    def _reset(self, generation):
+        self._generation = generation
+        os.makedirs(os.path.dirname(self._file('cid')), exist_ok=True)
+        self._rows = 0
+        self._columns = {name: np.zeros((0,) + shape, dtype=dtype) for name, (dtype, shape) in _COLUMNS.items()}
+        self._buffers = {name: b'' for name in _BUFFERS}
+        self._files = []
+        self._file_ordinals = {}
+        self._files_size = 0
+        self._alive_buffer = np.ones(0, dtype=bool)  # 按容量倍增，追加行时不必每次复制
+        self._alive = self._alive_buffer[:0]
+        self._dead = 0
+        self._tombstone_size = 0
+        self._order = np.zeros(0, dtype=np.int64)  # 前 len(_order) 行按分块 ID 排序后的行号
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(self._file(name))
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        """同步磁盘状态: 新一代文件、其他进程追加的文件 ID、行和墓碑."""
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._reset(generation)
+
+        size = self._size('files')
+        if size > self._files_size:
+            with open(self._file('files'), 'rb') as f:
+                f.seek(self._files_size)
+                data = f.read(size - size % ID_WIDTH - self._files_size)
+            for file_id in np.frombuffer(data, dtype=_ID_DTYPE):
+                self._file_ordinals[file_id.decode('ascii')] = len(self._files)
+                self._files.append(file_id.decode('ascii'))
+            self._files_size += len(data)
+
+        rows = self._size('cid') // ID_WIDTH
+        if rows != self._rows:
+            for name, (dtype, shape) in _COLUMNS.items():
+                self._columns[name] = np.memmap(self._file(name), dtype=dtype, mode='r', shape=(rows,) + shape) \
+                    if rows else np.zeros((0,) + shape, dtype=dtype)
+            for name, ends in _BUFFERS.items():
+                self._buffers[name] = _map_buffer(self._file(name), int(self._columns[ends][-1]) if rows else 0)
+            if rows > len(self._alive_buffer):
+                grown = np.ones(max(rows, 2 * len(self._alive_buffer), 1024), dtype=bool)
+                grown[:self._rows] = self._alive
+                self._alive_buffer = grown
+            self._alive = self._alive_buffer[:rows]
+            self._rows = rows
+
+        size = self._size('tombstones')
+        if size > self._tombstone_size:
+            with open(self._file('tombstones'), 'rb') as f:
+                f.seek(self._tombstone_size)
+                data = f.read(size - size % 8 - self._tombstone_size)
+            dead = np.frombuffer(data, dtype=np.int64)
+            dead = dead[dead < self._rows]
+            self._dead += int(np.count_nonzero(self._alive[dead]))
+            self._alive[dead] = False
+            self._tombstone_size += len(data)
+
+    # ---- 查找 ----
+
+    def _find(self, chunk_ids):
+        """分块 ID -> 存活行号 (同一 ID 有多行时取最新的一行)."""
+        cids = self._columns['cid']
+        sorted_rows = len(self._order)
+        if self._rows - sorted_rows > max(_RESORT_MIN_ROWS, sorted_rows // 8):
+            self._order = np.argsort(cids, kind='stable')
+            sorted_rows = self._rows
+        keys = _encode_ids(chunk_ids)
+        found = {}
+        sorted_part = cids[:sorted_rows]
+        lefts = np.searchsorted(sorted_part, keys, side='left', sorter=self._order)
+        rights = np.searchsorted(sorted_part, keys, side='right', sorter=self._order)
+        tail = cids[sorted_rows:self._rows]
+        for chunk_id, key, left, right in zip(chunk_ids, keys, lefts, rights):
+            candidates = np.concatenate([self._order[left:right], np.flatnonzero(tail == key) + sorted_rows])
+            candidates = candidates[self._alive[candidates]]
+            if len(candidates):
+                found[chunk_id] = int(candidates.max())
+        return found
+
+    def _slice(self, name, row):
+        ends = self._columns[_BUFFERS[name]]
+        start = int(ends[row - 1]) if row else 0
+        return memoryview(self._buffers[name])[start:int(ends[row])]
+
+    def _file_rows(self, file_id):
+        ordinal = self._file_ordinals.get(file_id)
+        if ordinal is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero((self._columns['fid'] == ordinal) & self._alive)
+
+    def get(self, chunk_ids, text=False):
+        """
+        按分块 ID 读取分块
+
+        Args:
+            chunk_ids (list): 分块 ID 列表
+            text (bool): 是否附带分块文本 (memoryview，零拷贝切片; 用 str(view, 'utf-8') 解码)
+
+        Returns:
+            dict: chunk_id -> {file_id, chunk_index, start_offset, end_offset, token_count, heading, content_hash[, text]}，
+                  不存在的分块不在其中
+        """
+        if not chunk_ids:
+            return {}
+        with self._lock:
+            self._refresh()
+            columns = self._columns
+            result = {}
+            for chunk_id, row in self._find(chunk_ids).items():
+                chunk = {
+                    'file_id': self._files[int(columns['fid'][row])],
+                    'chunk_index': int(columns['chunk_index'][row]),
+                    'start_offset': int(columns['start'][row]),
+                    'end_offset': int(columns['end'][row]),
+                    'token_count': int(columns['tokens'][row]),
+                    'heading': str(self._slice('heading', row), 'utf-8'),
+                    'content_hash': columns['hash'][row].tobytes().hex(),
+                }
+                if text:
+                    chunk['text'] = self._slice('text', row)
+                result[chunk_id] = chunk
+            return result
+
+    def text(self, chunk_id):
+        """分块文本的零拷贝 memoryview，不存在时返回 None."""
+        with self._lock:
+            self._refresh()
+            row = self._find([chunk_id]).get(chunk_id)
+            return self._slice('text', row) if row is not None else None
+
+    def file_chunk_ids(self, file_id):
+        """文件的全部分块 ID (按 chunk_index 排序)."""
+        with self._lock:
+            self._refresh()
+            rows = self._file_rows(file_id)
+            rows = rows[np.argsort(self._columns['chunk_index'][rows], kind='stable')]
+            return [chunk_id.decode('ascii') for chunk_id in self._columns['cid'][rows]]
+
+    # ---- 写入 ----
+
+    def _append_tombstones(self, rows):
+        if len(rows):
+            with open(self._file('tombstones'), 'ab') as f:
+                f.write(np.asarray(rows, dtype=np.int64).tobytes())
+        return len(rows)
+
+    def _truncate_partial(self):
+        """截掉上次写入中断时残留的半行数据 (调用方需持有文件锁)."""
+        rows = self._rows
+        for name, (dtype, shape) in _COLUMNS.items():
+            expected = rows * dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            if self._size(name) > expected:
+                os.truncate(self._file(name), expected)
+        for name, ends in _BUFFERS.items():
+            expected = int(self._columns[ends][-1]) if rows else 0
+            if self._size(name) > expected:
+                os.truncate(self._file(name), expected)
+
+    def _append_batch(self, file_id, batch):
+        """追加一批分块的行 (调用方需持有文件锁)."""
+        self._truncate_partial()
+        if file_id not in self._file_ordinals:
+            with open(self._file('files'), 'ab') as f:
+                f.write(_encode_ids([file_id]).tobytes())
+            self._refresh()
+        ordinal = self._file_ordinals[file_id]
+        text_base = int(self._columns['text_end'][-1]) if self._rows else 0
+        heading_base = int(self._columns['heading_end'][-1]) if self._rows else 0
+        data = {
+            'text': batch.text,
+            'heading': batch.heading,
+            'fid': np.full(len(batch), ordinal, dtype=np.uint32),
+            'chunk_index': batch.chunk_index,
+            'tokens': batch.tokens,
+            'start': batch.start,
+            'end': batch.end,
+            'hash': batch.hashes,
+            'text_end': np.frombuffer(batch.text_end, dtype=np.int64) + text_base,
+            'heading_end': np.frombuffer(batch.heading_end, dtype=np.int64) + heading_base,
+            'cid': batch.chunk_ids,
+        }
+        for name, values in data.items():
+            with open(self._file(name), 'ab') as f:
+                f.write(values if isinstance(values, (bytes, bytearray)) else memoryview(values))
+
+    def _latest_rows(self, file_id):
+        """文件每个分块 ID 最新的存活行: (行号, 分块 ID) 数组."""
+        rows = self._file_rows(file_id)[::-1]
+        cids, first = np.unique(self._columns['cid'][rows], return_index=True)
+        return rows[first], cids
+
+    def replace_file(self, file_id, batch):
+        """
+        用新的分块替换文件的全部分块 (旧行打墓碑，新行追加)
+
+        Args:
+            file_id (str): Markdown 文件 ID
+            batch (ChunkBatch): 文件的全部分块
+        """
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            self._append_tombstones(self._file_rows(file_id))
+            if len(batch):
+                self._append_batch(file_id, batch)
+            self._refresh()
+            self._maybe_compact()
+
+    def append_file(self, file_id, batch):
+        """
+        追加文件的一批分块，不删除旧行. 同一分块 ID 有多行时读取最新的一行，
+        分批写完整个文件后用 prune_file 清除旧版本，中途失败时用 revert_file 撤销
+
+        Args:
+            file_id (str): Markdown 文件 ID
+            batch (ChunkBatch): 一批分块
+        """
+        if not len(batch):
+            return
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            self._append_batch(file_id, batch)
+            self._refresh()
+
+    def prune_file(self, file_id, chunk_ids):
+        """
+        只保留文件中 chunk_ids 内每个分块最新的一行，其余行打墓碑
+
+        Args:
+            file_id (str): Markdown 文件 ID
+            chunk_ids (iterable): 文件当前的全部分块 ID
+        """
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            rows = self._file_rows(file_id)
+            latest, cids = self._latest_rows(file_id)
+            keep = latest[np.isin(cids, _encode_ids(list(chunk_ids)))]
+            self._append_tombstones(rows[~np.isin(rows, keep)])
+            self._refresh()
+            self._maybe_compact()
+
+    def revert_file(self, file_id, chunk_ids):
+        """撤销未完成的 append_file: 删除 chunk_ids 中每个分块最新的一行 (沿用的分块恢复为旧行)."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            latest, cids = self._latest_rows(file_id)
+            self._append_tombstones(latest[np.isin(cids, _encode_ids(list(chunk_ids)))])
+            self._refresh()
+
+    def delete_files(self, file_ids):
+        """删除文件的全部分块 (打墓碑)，返回删除的行数."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            rows = [self._file_rows(file_id) for file_id in file_ids]
+            deleted = self._append_tombstones(np.concatenate(rows) if rows else [])
+            self._refresh()
+            self._maybe_compact()
+            return deleted
+
+    def _maybe_compact(self):
+        if self._dead >= CHUNK_STORE_COMPACT_MIN_ROWS and self._dead >= self._rows * self.compact_dead_ratio:
+            self._compact()
+
+    def compact(self):
+        """立即把存活行重写为新一代文件."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        """重写存活行 (调用方需持有文件锁). 旧一代文件被删除后，已打开的 mmap 仍然有效."""
+        old_generation = self._generation
+        generation = old_generation + 1
+        directory = os.path.dirname(self._file('cid', generation))
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        rows = np.flatnonzero(self._alive)
+        if self._files:
+            shutil.copyfile(self._file('files'), self._file('files', generation))
+
+        for name, ends_name in _BUFFERS.items():
+            ends = np.asarray(self._columns[ends_name])
+            starts = np.concatenate([[0], ends[:-1]])[rows]
+            stops = ends[rows]
+            # 连续存活的行在缓冲区中相邻，整段拷贝
+            breaks = np.flatnonzero(starts[1:] != stops[:-1]) + 1
+            buffer = memoryview(self._buffers[name])
+            with open(self._file(name, generation), 'wb') as f:
+                for first, last in zip(np.concatenate([[0], breaks]), np.concatenate([breaks, [len(rows)]])):
+                    if first < last:
+                        f.write(buffer[starts[first]:stops[last - 1]])
+            new_ends = np.cumsum(stops - starts, dtype=np.int64)
+            with open(self._file(ends_name, generation), 'wb') as f:
+                f.write(new_ends.tobytes())
+        for name in _COLUMNS:
+            if name in _BUFFERS.values():
+                continue
+            with open(self._file(name, generation), 'wb') as f:
+                f.write(np.ascontiguousarray(self._columns[name][rows]).tobytes())
+
+        tmp_current = self._current_path + '.tmp'
+        with open(tmp_current, 'w') as f:
+            f.write(str(generation))
+        os.replace(tmp_current, self._current_path)
+        shutil.rmtree(os.path.dirname(self._file('cid', old_generation)), ignore_errors=True)
+        purged = self._dead
+        self._refresh()
+        logging.info(f"分块存储压缩完成: 代号 {generation}, 存活 {self._rows} 行, 清除 {purged} 行")
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._rows - self._dead
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            directory = os.path.dirname(self._file('cid'))
+            return {
+                'generation': self._generation,
+                'rows': self._rows,
+                'dead_rows': self._dead,
+                'files': len(self._files),
+                'disk_bytes': sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            }
+
+
+_chunk_store = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store():
+    """获取分块存储 (进程内单例)."""
+    global _chunk_store
+    with _chunk_store_lock:
+        if _chunk_store is None:
+            _chunk_store = ChunkStore(CHUNK_STORE_DIR)
+        return _chunk_store
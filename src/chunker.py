@@ -0,0 +1,344 @@
+"""
+Markdown 分块模块
+从 MinIO 流式读取 Markdown 对象，按标题/段落/表格/代码块边界切分为带重叠的分块，
+分块的字节偏移与词元数写入 chunks 表. 多文档分块通过进程池并行执行.
+
+用法: python chunker.py <file_id> [<file_id> ...] --workers 4
+"""
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', 512))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 64))
+CHUNK_MIN_TOKENS = int(os.getenv('CHUNK_MIN_TOKENS', 64))
+CHUNK_WORKERS = int(os.getenv('CHUNK_WORKERS', max(os.cpu_count() or 1, 1)))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 词元估算: CJK 单字、拉丁词/数字、单个标点各计一个词元
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]')
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_LINE_BREAK_RE = re.compile(r'\n')
+_SENTENCE_END_RE = re.compile(r'[。！？；.!?;]')
+
+# kind: heading / paragraph / table / code; start, end 为 UTF-8 字节偏移 [start, end)
+Block = namedtuple('Block', ['kind', 'start', 'end', 'text', 'tokens', 'heading'])
+
+
+def count_tokens(text):
+    """估算文本词元数."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def iter_lines(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    从字节流中逐行读取
+
+    Args:
+        stream (file-like): 可读的字节流
+        chunk_size (int): 每次读取的字节数
+
+    Yields:
+        tuple: (行起始字节偏移, 行结束字节偏移 (含换行符), 行文本 (不含换行符))
+    """
+    offset = 0
+    pending = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            end = offset + len(line) + 1
+            yield offset, end, line.rstrip(b'\r').decode('utf-8', errors='replace')
+            offset = end
+    if pending:
+        yield offset, offset + len(pending), pending.rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+def iter_blocks(lines):
+    """
+    把行序列组合为 Markdown 结构块 (标题、段落、表格、代码块)
+
+    Args:
+        lines (iterable): iter_lines 的输出
+
+    Yields:
+        Block: 结构块，heading 为所在章节的标题路径
+    """
+    heading_path = []
+    kind = None
+    buf = []
+    start = end = 0
+    fence = None
+
+    def flush():
+        text = '\n'.join(buf)
+        return Block(kind, start, end, text, count_tokens(text), ' > '.join(heading_path))
+
+    for line_start, line_end, line in lines:
+        stripped = line.strip()
+
+        if fence:
+            buf.append(line)
+            end = line_end
+            if stripped.startswith(fence):
+                yield flush()
+                buf, kind, fence = [], None, None
+            continue
+
+        if stripped.startswith('```') or stripped.startswith('~~~'):
+            if buf:
+                yield flush()
+            fence = stripped[:3]
+            kind, buf, start, end = 'code', [line], line_start, line_end
+            continue
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            if buf:
+                yield flush()
+            level = len(heading.group(1))
+            heading_path[level - 1:] = [heading.group(2)]
+            kind, buf, start, end = 'heading', [line], line_start, line_end
+            yield flush()
+            buf, kind = [], None
+            continue
+
+        if not stripped:
+            if buf:
+                yield flush()
+            buf, kind = [], None
+            continue
+
+        line_kind = 'table' if stripped.startswith('|') else 'paragraph'
+        if buf and kind != line_kind:
+            yield flush()
+            buf = []
+        if not buf:
+            kind, start = line_kind, line_start
+        buf.append(line)
+        end = line_end
+
+    if buf:
+        yield flush()
+
+
+def _split_text(text, max_tokens):
+    """把超长文本依次按行、句末标点、词元细分，返回每段的字符区间 [(start, end), ...]."""
+    spans = [(0, len(text))]
+    for separator_re in (_LINE_BREAK_RE, _SENTENCE_END_RE):
+        refined = []
+        for start, end in spans:
+            if count_tokens(text[start:end]) <= max_tokens:
+                refined.append((start, end))
+                continue
+            position = start
+            for match in separator_re.finditer(text, start, end):
+                if match.end() > position:
+                    refined.append((position, match.end()))
+                    position = match.end()
+            if position < end:
+                refined.append((position, end))
+        spans = refined
+
+    result = []
+    for start, end in spans:
+        if count_tokens(text[start:end]) <= max_tokens:
+            result.append((start, end))
+            continue
+        # 仍然超长 (例如没有标点的长串): 按词元硬切
+        tokens = list(_TOKEN_RE.finditer(text, start, end))
+        for i in range(0, len(tokens), max_tokens):
+            window = tokens[i:i + max_tokens]
+            result.append((window[0].start(), window[-1].end()))
+    return result
+
+
+def split_block(block, max_tokens):
+    """把超过词元预算的块拆分为多个子块，保持字节偏移准确."""
+    pieces = []
+    for char_start, char_end in _split_text(block.text, max_tokens):
+        text = block.text[char_start:char_end]
+        if not text.strip():
+            continue
+        byte_start = block.start + len(block.text[:char_start].encode('utf-8'))
+        byte_end = block.end if char_end == len(block.text) else byte_start + len(text.encode('utf-8'))
+        pieces.append(block._replace(start=byte_start, end=byte_end, text=text, tokens=count_tokens(text)))
+    return pieces
+
+
+def _make_chunk(index, blocks, fresh_from):
+    # 按原文还原块之间的换行: 块的字节区间包含末行换行符而文本不包含；
+    # 同一块拆出的相邻子块首尾相接，直接拼接
+    parts = [blocks[0].text]
+    for previous, block in zip(blocks, blocks[1:]):
+        if previous.end - previous.start > len(previous.text.encode('utf-8')):
+            parts.append('\n')
+        if block.start > previous.end:
+            parts.append('\n')
+        parts.append(block.text)
+    text = ''.join(parts)
+    return {
+        'chunk_index': index,
+        'start_offset': blocks[0].start,
+        'end_offset': blocks[-1].end,
+        'token_count': sum(block.tokens for block in blocks),
+        'heading': blocks[fresh_from].heading[:255],
+        'text': text,
+        'content_hash': hashlib.sha256(text.encode('utf-8')).hexdigest()
+    }
+
+
+def chunk_blocks(blocks, max_tokens=None, overlap_tokens=None, min_tokens=None):
+    """
+    把结构块组装为词元预算内的分块.
+    新的标题会开启新分块 (当前分块已达到 min_tokens 时)，相邻分块之间保留
+    不超过 overlap_tokens 的尾部块作为重叠 (新章节开头不重叠).
+
+    Args:
+        blocks (iterable): iter_blocks 的输出
+        max_tokens (int, optional): 每个分块的词元上限
+        overlap_tokens (int, optional): 相邻分块的重叠词元上限
+        min_tokens (int, optional): 遇到标题时切分所需的最少词元数
+
+    Yields:
+        dict: 分块 (chunk_index, start_offset, end_offset, token_count, heading, text, content_hash)
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    min_tokens = CHUNK_MIN_TOKENS if min_tokens is None else min_tokens
+
+    current = []
+    tokens = 0
+    fresh_from = 0  # current 中第一个非重叠块的下标
+    index = 0
+    for block in blocks:
+        pieces = [block] if block.tokens <= max_tokens else split_block(block, max_tokens)
+        for piece in pieces:
+            starts_section = piece.kind == 'heading'
+            if fresh_from < len(current) and (
+                tokens + piece.tokens > max_tokens or (starts_section and tokens >= min_tokens)
+            ):
+                yield _make_chunk(index, current, fresh_from)
+                index += 1
+                overlap = []
+                if not starts_section:
+                    overlap_total = 0
+                    for previous in reversed(current):
+                        overlap_total += previous.tokens
+                        if overlap_total > overlap_tokens or overlap_total + piece.tokens > max_tokens:
+                            break
+                        overlap.insert(0, previous)
+                current = overlap
+                tokens = sum(b.tokens for b in current)
+                fresh_from = len(current)
+            current.append(piece)
+            tokens += piece.tokens
+    if fresh_from < len(current):
+        yield _make_chunk(index, current, fresh_from)
+
+
+def iter_markdown_chunks(stream, max_tokens=None, overlap_tokens=None, min_tokens=None):
+    """
+    流式切分 Markdown 字节流. 任意时刻内存中只保留当前分块涉及的块.
+
+    Args:
+        stream (file-like): 可读的字节流 (例如 MinIO get_object 的响应)
+
+    Yields:
+        dict: 分块，参见 chunk_blocks
+    """
+    return chunk_blocks(iter_blocks(iter_lines(stream)), max_tokens, overlap_tokens, min_tokens)
+
+
+def chunk_file(file_id, consumer=None):
+    """
+    对一个 Markdown 文件分块并写入 chunks 表
+
+    Args:
+        file_id (str): Markdown 文件 ID
+        consumer (callable, optional): consumer(file_details, chunk) 在每个分块生成后调用 (例如用于建立索引)
+
+    Returns:
+        dict: {'file_id', 'success', 'chunks', 'message'}
+    """
+    import minio_config
+    from db_utils import get_file_by_id, replace_file_chunks
+
+    file_details = get_file_by_id(file_id)
+    if not file_details:
+        return {'file_id': file_id, 'success': False, 'chunks': 0, 'message': f'文件ID {file_id} 未找到'}
+
+    response = None
+    stored = []
+    try:
+        response = minio_config.minio_client.get_object(minio_config.bucket_name, file_details['location'])
+        for chunk in iter_markdown_chunks(response):
+            if consumer:
+                consumer(file_details, chunk)
+            chunk.pop('text')
+            stored.append(chunk)
+    except Exception as e:
+        logging.error(f"文件 {file_id} 分块失败: {e}")
+        return {'file_id': file_id, 'success': False, 'chunks': 0, 'message': str(e)}
+    finally:
+        if response is not None:
+            response.close()
+            response.release_conn()
+
+    if not replace_file_chunks(file_id, file_details.get('derived_from_file_id'), stored):
+        return {'file_id': file_id, 'success': False, 'chunks': 0, 'message': '保存分块记录失败'}
+    logging.info(f"文件 {file_id} 分块完成: {len(stored)} 个分块")
+    return {'file_id': file_id, 'success': True, 'chunks': len(stored), 'message': '分块成功'}
+
+
+def _init_chunk_worker():
+    """进程池初始化: 每个子进程使用自己的数据库连接池."""
+    from db_utils import init_db_connection_pool
+    init_db_connection_pool(pool_size=1)
+
+
+def chunk_files(file_ids, workers=None, target=None):
+    """
+    使用进程池并行分块多个文件
+
+    Args:
+        file_ids (list): Markdown 文件 ID 列表
+        workers (int, optional): 进程数. Defaults to CHUNK_WORKERS from .env.
+        target (callable, optional): 每个文件执行的模块级函数 (需可 pickle). Defaults to chunk_file.
+
+    Returns:
+        list: 每个文件的 target 结果
+    """
+    target = target or chunk_file
+    workers = min(workers or CHUNK_WORKERS, max(len(file_ids), 1))
+    if workers <= 1:
+        return [target(file_id) for file_id in file_ids]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_chunk_worker) as executor:
+        return list(executor.map(target, file_ids))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='对 Markdown 文件分块')
+    parser.add_argument('file_ids', nargs='+', help='Markdown 文件 ID')
+    parser.add_argument('--workers', type=int, default=CHUNK_WORKERS, help='并行进程数')
+    args = parser.parse_args()
+    _init_chunk_worker()
+    for result in chunk_files(args.file_ids, args.workers):
+        logging.info(result)
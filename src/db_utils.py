@@ -9,6 +9,7 @@ import mysql.connector
 from mysql.connector import pooling
 import uuid
 from datetime import datetime
+from name_index import get_name_index
 
 # Load environment variables from .env file
 load_dotenv()
@@ -110,6 +111,195 @@ def execute_query(query, params=None, fetch=True):
         if connection:
             connection.close()
 
+def run_in_transaction(fn):
+    """
+    在单个事务中执行 fn(cursor)，成功则提交，失败回滚后重新抛出异常
+    
+    Args:
+        fn (callable): 接收 dictionary 游标的函数
+        
+    Returns:
+        fn 的返回值
+    """
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        result = fn(cursor)
+        connection.commit()
+        return result
+    except Exception:
+        if connection:
+            connection.rollback()
+        raise
+    finally:
+        if connection:
+            connection.close()
+
+def _discard_connection(connection):
+    """
+    断开连接池连接的底层 socket 后再归还: 不读取剩余结果 (大结果集排空需要把整张表传输一遍)，
+    连接池下次取出该连接时会检测到已断开并重新连接
+    """
+    try:
+        getattr(connection, '_cnx', connection).shutdown()
+    except Exception as e:
+        logging.warning(f"断开流式查询连接失败: {e}")
+    try:
+        connection.close()
+    except Exception:
+        # 归还时重置会话会因连接已断开而失败，连接此时已放回连接池
+        pass
+
+def iter_query(query, params=None, batch_size=1000):
+    """
+    以非缓冲游标流式执行查询 (服务端逐批返回，客户端每次只持有 batch_size 行)，
+    用于结果集可能很大的遍历. 生成器存续期间独占一个连接池连接，遍历结束或生成器关闭时归还;
+    提前关闭时不排空剩余结果，直接断开该连接
+    
+    Args:
+        query (str): SQL 查询语句
+        params (tuple or dict, optional): 查询参数
+        batch_size (int): 每次 fetchmany 的行数
+        
+    Yields:
+        dict: 查询结果行
+    """
+    connection = get_connection()
+    cursor = None
+    exhausted = False
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                exhausted = True
+                return
+            yield from rows
+    finally:
+        if not exhausted:
+            _discard_connection(connection)
+        else:
+            try:
+                cursor.close()
+            except mysql.connector.Error as e:
+                logging.warning(f"关闭流式查询游标失败: {e}")
+            connection.close()
+
+_FILE_AGGREGATE_COLUMNS = "folder_id, created_by, type, size, upload_date, derived_from_file_id"
+
+def adjust_file_aggregates(cursor, file_row, sign):
+    """
+    增量维护文件聚合统计 (file_facets 分面统计表与 folder_rollups 文件夹汇总)，需在修改 files 的同一事务中调用
+    
+    Args:
+        cursor: 事务中的数据库游标
+        file_row (dict): 文件记录 (至少包含 _FILE_AGGREGATE_COLUMNS 中的字段)
+        sign (int): 1 为新增该文件，-1 为移除该文件
+    """
+    _adjust_file_facets(cursor, _facet_key(file_row), sign, sign * (file_row['size'] or 0))
+    if file_row['folder_id']:
+        adjust_folder_rollups(cursor, file_row['folder_id'], file_row['created_by'],
+                              sign, sign * (file_row['size'] or 0), direct=True)
+
+def apply_file_aggregates(cursor, file_rows, sign):
+    """
+    批量计入或移除多个文件的聚合统计 (先按统计键合并，每个键只执行一次更新)，需在修改 files 的同一事务中调用
+    
+    Args:
+        cursor: 事务中的数据库游标
+        file_rows (list): 文件记录 (至少包含 _FILE_AGGREGATE_COLUMNS 中的字段)
+        sign (int): 1 为计入 (新增/恢复)，-1 为移除 (删除)
+    """
+    facets, rollups = {}, {}
+    for row in file_rows:
+        size = row['size'] or 0
+        count, total = facets.get(_facet_key(row), (0, 0))
+        facets[_facet_key(row)] = (count + 1, total + size)
+        if row['folder_id']:
+            count, total = rollups.get((row['folder_id'], row['created_by']), (0, 0))
+            rollups[(row['folder_id'], row['created_by'])] = (count + 1, total + size)
+    for key, (count, size) in facets.items():
+        _adjust_file_facets(cursor, key, sign * count, sign * size)
+    for (folder_id, created_by), (count, size) in rollups.items():
+        adjust_folder_rollups(cursor, folder_id, created_by, sign * count, sign * size, direct=True)
+
+def _facet_key(file_row):
+    return (
+        file_row['folder_id'] or '',
+        file_row['created_by'] or '',
+        file_row['type'] or '',
+        file_row['upload_date'].strftime('%Y-%m'),
+        1 if file_row['derived_from_file_id'] else 0
+    )
+
+def _adjust_file_facets(cursor, key, count, size):
+    cursor.execute("""
+    INSERT INTO file_facets (folder_id, created_by, type, month, is_derived, file_count, total_size)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE file_count = file_count + VALUES(file_count), total_size = total_size + VALUES(total_size)
+    """, key + (count, size))
+    if count < 0:
+        cursor.execute("""
+        DELETE FROM file_facets
+        WHERE folder_id = %s AND created_by = %s AND type = %s AND month = %s AND is_derived = %s AND file_count <= 0
+        """, key)
+
+def adjust_folder_rollups(cursor, folder_id, created_by, count, size, direct=False):
+    """
+    将文件数与字节数增量累加到文件夹及其全部祖先的汇总 (folder_rollups 表)，需在修改 files / folders
+    的同一事务中调用. INSERT ... SELECT 会对读到的祖先文件夹行加共享锁，与移动文件夹的事务互斥
+    
+    Args:
+        cursor: 事务中的数据库游标
+        folder_id (str): 起始文件夹 ID
+        created_by (str): 文件创建者 (按创建者分别汇总)
+        count (int): 文件数增量
+        size (int): 字节数增量
+        direct (bool): 是否同时计入起始文件夹的直属统计 (文件直接位于该文件夹时为 True)
+    """
+    direct_count, direct_size = (count, size) if direct else (0, 0)
+    cursor.execute("""
+    INSERT INTO folder_rollups (folder_id, created_by, direct_count, direct_size, total_count, total_size)
+    WITH RECURSIVE ancestors (id, parent_id, depth) AS (
+        SELECT id, parent_id, 0 FROM folders WHERE id = %s
+        UNION ALL
+        SELECT f.id, f.parent_id, a.depth + 1 FROM folders f JOIN ancestors a ON f.id = a.parent_id
+        WHERE a.depth < 100
+    )
+    SELECT id, %s, IF(depth = 0, %s, 0), IF(depth = 0, %s, 0), %s, %s FROM ancestors
+    ON DUPLICATE KEY UPDATE direct_count = direct_count + VALUES(direct_count),
+                            direct_size = direct_size + VALUES(direct_size),
+                            total_count = total_count + VALUES(total_count),
+                            total_size = total_size + VALUES(total_size)
+    """, (folder_id, created_by or '', direct_count, direct_size, count, size))
+
+def _move_folder_rollups(cursor, folder_id, parent_id, sign):
+    """将文件夹子树的汇总 (按创建者) 从 parent_id 起的祖先链上加上 (sign=1) 或减去 (sign=-1)."""
+    if not parent_id:
+        return
+    cursor.execute(
+        "SELECT created_by, total_count, total_size FROM folder_rollups WHERE folder_id = %s AND total_count <> 0",
+        (folder_id,)
+    )
+    for row in cursor.fetchall():
+        adjust_folder_rollups(cursor, parent_id, row['created_by'],
+                              sign * row['total_count'], sign * row['total_size'])
+
+def update_name_index(file_id, name=None):
+    """
+    更新文件名索引. name 为 None 时从索引中删除该文件.
+    索引失败只记录日志，不影响数据库操作本身 (可通过重建索引修复).
+    """
+    try:
+        if name is None:
+            get_name_index().delete([file_id])
+        else:
+            get_name_index().add(file_id, name)
+    except Exception as e:
+        logging.error(f"更新文件名索引失败: 文件 {file_id}, {e}")
+
 def generate_uuid():
     """
     生成 UUID（不带连字符）
@@ -195,8 +385,37 @@ def update_folder(folder_id, name=None, parent_id=None, updated_by=None):
     WHERE id = %s
     """
     
+    new_parent_id = parent_id if parent_id != "ROOT" else None
+
+    def update(cursor):
+        cursor.execute("SELECT parent_id FROM folders WHERE id = %s FOR UPDATE", (folder_id,))
+        folder = cursor.fetchone()
+        if not folder:
+            return 0
+        moved = parent_id is not None and folder['parent_id'] != new_parent_id
+        if moved and new_parent_id:
+            # 不能移动到自身或自身的子孙文件夹之下
+            cursor.execute("""
+            WITH RECURSIVE ancestors (id, parent_id, depth) AS (
+                SELECT id, parent_id, 0 FROM folders WHERE id = %s
+                UNION ALL
+                SELECT f.id, f.parent_id, a.depth + 1 FROM folders f JOIN ancestors a ON f.id = a.parent_id
+                WHERE a.depth < 100
+            )
+            SELECT COUNT(*) AS cycles FROM ancestors WHERE id = %s
+            """, (new_parent_id, folder_id))
+            if cursor.fetchone()['cycles']:
+                raise ValueError(f"不能将文件夹移动到其自身或子文件夹下: {new_parent_id}")
+        if moved: # 子树汇总从原祖先链转移到新祖先链
+            _move_folder_rollups(cursor, folder_id, folder['parent_id'], -1)
+        cursor.execute(query, tuple(params))
+        rowcount = cursor.rowcount
+        if moved:
+            _move_folder_rollups(cursor, folder_id, new_parent_id, 1)
+        return rowcount
+    
     try:
-        rowcount = execute_query(query, tuple(params), fetch=False)
+        rowcount = run_in_transaction(update)
         if rowcount > 0:
             logging.info(f"文件夹更新成功: ID {folder_id}")
             return True
@@ -233,14 +452,64 @@ def insert_file(id, name, location, size, file_type, folder_id=None, created_by=
     """
     params = (id, name, location, size, file_type, folder_id, now, created_by, derived_from_file_id)
     
+    file_row = {'folder_id': folder_id, 'created_by': created_by, 'type': file_type, 'size': size,
+                'upload_date': now, 'derived_from_file_id': derived_from_file_id}
+
+    def insert(cursor):
+        cursor.execute(query, params)
+        adjust_file_aggregates(cursor, file_row, 1)
+
     try:
-        execute_query(query, params, fetch=False)
+        run_in_transaction(insert)
         logging.info(f"文件记录创建成功: {name}, ID: {id}")
+        update_name_index(id, name)
         return id # 返回传入的ID
     except Exception as e:
         logging.error(f"文件记录创建失败: {e}")
         return None
 
+def insert_files(files, created_by=None):
+    """
+    批量插入文件记录 (单个事务，一条多行 INSERT)，并合并更新聚合统计与文件名索引
+
+    Args:
+        files (list): 文件 dict 列表 (id, name, location, size, type, folder_id)
+        created_by (str, optional): 创建者 ID
+
+    Returns:
+        bool: 成功返回 True，失败返回 False (整批均未插入)
+    """
+    if not files:
+        return True
+    now = datetime.now()
+    rows = [{'id': f['id'], 'name': f['name'], 'location': f['location'], 'size': f['size'], 'type': f['type'],
+             'folder_id': f.get('folder_id'), 'upload_date': now, 'created_by': created_by,
+             'derived_from_file_id': None} for f in files]
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for row in rows:
+        params.extend((row['id'], row['name'], row['location'], row['size'], row['type'], row['folder_id'],
+                       row['upload_date'], row['created_by'], row['derived_from_file_id']))
+
+    def insert(cursor):
+        cursor.execute(f"""
+        INSERT INTO files (id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id)
+        VALUES {placeholders}
+        """, tuple(params))
+        apply_file_aggregates(cursor, rows, 1)
+
+    try:
+        run_in_transaction(insert)
+    except Exception as e:
+        logging.error(f"批量创建文件记录失败: {len(rows)} 个, {e}")
+        return False
+    logging.info(f"批量创建文件记录成功: {len(rows)} 个")
+    try:
+        get_name_index().add_many((row['id'], row['name']) for row in rows)
+    except Exception as e:
+        logging.error(f"更新文件名索引失败: {len(rows)} 个文件, {e}")
+    return True
+
 def update_file(file_id, name=None, new_folder_id=None, new_location=None, updated_by=None):
     """
     更新文件元数据 (名称, 文件夹, MinIO位置).
@@ -282,13 +551,31 @@ def update_file(file_id, name=None, new_folder_id=None, new_location=None, updat
     query = f"""
     UPDATE files
     SET {', '.join(fields_to_update)}
-    WHERE id = %s
+    WHERE id = %s AND deleted_at IS NULL
     """
+
+    def update(cursor):
+        cursor.execute(
+            f"SELECT {_FILE_AGGREGATE_COLUMNS} FROM files WHERE id = %s AND deleted_at IS NULL FOR UPDATE", (file_id,)
+        )
+        old_row = cursor.fetchone()
+        if not old_row:
+            return 0
+        cursor.execute(query, tuple(params))
+        rowcount = cursor.rowcount
+        if new_folder_id is not None:
+            new_row = dict(old_row, folder_id=new_folder_id if new_folder_id != "ROOT" else None)
+            if new_row['folder_id'] != old_row['folder_id']: # 移动文件: 统计从原文件夹转到新文件夹
+                adjust_file_aggregates(cursor, old_row, -1)
+                adjust_file_aggregates(cursor, new_row, 1)
+        return rowcount
     
     try:
-        rowcount = execute_query(query, tuple(params), fetch=False)
+        rowcount = run_in_transaction(update)
         if rowcount > 0:
             logging.info(f"文件记录更新成功: ID {file_id}")
+            if name:
+                update_name_index(file_id, name)
             return True
         else:
             logging.warning(f"文件记录未找到或无更改: ID {file_id}")
@@ -305,21 +592,28 @@ def get_folders(parent_id=None, page=1, page_size=10, sort_by='name', sort_order
         parent_id (str, optional): 父文件夹 ID，如果为 None 则获取根文件夹
         page (int): 页码 (1-indexed).
         page_size (int): 每页数量.
-        sort_by (str): 排序字段 (name, created_at).
+        sort_by (str): 排序字段 (name, created_at, total_size, total_file_count).
         sort_order (str): 排序顺序 (ASC, DESC).
         
     Returns:
-        dict: 包含文件夹列表、总项目数、当前页码、每页数量和总页数的字典
+        dict: 包含文件夹列表 (含直属与递归的文件数、字节数)、总项目数、当前页码、每页数量和总页数的字典
     """
+    # 大小与文件数来自增量维护的 folder_rollups (按创建者分行，此处合计)
     query = """
-    SELECT id, name, parent_id, created_at, created_by
-    FROM folders
-    WHERE parent_id <=> %s  -- <=> handles NULL parent_id gracefully for root folders
+    SELECT f.id, f.name, f.parent_id, f.created_at, f.created_by,
+           CAST(COALESCE(SUM(r.direct_count), 0) AS SIGNED) AS file_count,
+           CAST(COALESCE(SUM(r.direct_size), 0) AS SIGNED) AS size,
+           CAST(COALESCE(SUM(r.total_count), 0) AS SIGNED) AS total_file_count,
+           CAST(COALESCE(SUM(r.total_size), 0) AS SIGNED) AS total_size
+    FROM folders f
+    LEFT JOIN folder_rollups r ON r.folder_id = f.id
+    WHERE f.parent_id <=> %s  -- <=> handles NULL parent_id gracefully for root folders
+    GROUP BY f.id
     """
     params = [parent_id]
 
     # Validate sort_by to prevent SQL injection
-    valid_sort_fields = ['name', 'created_at']
+    valid_sort_fields = ['name', 'created_at', 'total_size', 'total_file_count']
     if sort_by not in valid_sort_fields:
         sort_by = 'name' # Default sort field
     if sort_order.upper() not in ['ASC', 'DESC']:
@@ -370,6 +664,7 @@ def get_files(folder_id=None, page=1, page_size=10, sort_by='name', sort_order='
     SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id
     FROM files
     WHERE folder_id <=> %s -- <=> handles NULL folder_id gracefully
+      AND deleted_at IS NULL
     """
     params = [folder_id]
 
@@ -388,7 +683,7 @@ def get_files(folder_id=None, page=1, page_size=10, sort_by='name', sort_order='
     try:
         result = execute_query(query, tuple(params))
 
-        count_query = "SELECT COUNT(*) as total FROM files WHERE folder_id <=> %s"
+        count_query = "SELECT COUNT(*) as total FROM files WHERE folder_id <=> %s AND deleted_at IS NULL"
         count_params = (folder_id,)
         total_count_result = execute_query(count_query, count_params)
         total_items = total_count_result[0]['total'] if total_count_result else 0
@@ -404,6 +699,229 @@ def get_files(folder_id=None, page=1, page_size=10, sort_by='name', sort_order='
         logging.error(f"获取文件列表失败: {e}")
         return {'items': [], 'total_items': 0, 'page': page, 'page_size': page_size, 'total_pages': 0}
 
+def _month_floor(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def query_files(folder_id=None, types=None, min_size=None, max_size=None, uploaded_after=None, uploaded_before=None,
+                created_by=None, derived=None, page=1, page_size=20, sort_by='name', sort_order='ASC'):
+    """
+    按元数据过滤文件 (支持分页和排序)，并返回按类型、按上传月份的分面计数.
+    分面计数汇总自增量维护的 file_facets 表，不对 files 做 GROUP BY. 类型分面忽略类型过滤，
+    月份分面忽略日期过滤，其余过滤条件照常生效.
+    
+    Args:
+        folder_id (str, optional): 文件夹 ID，None 表示不限文件夹，"ROOT" 表示未分类文件
+        types (list, optional): 文件类型列表
+        min_size (int, optional): 最小文件大小 (字节，含)
+        max_size (int, optional): 最大文件大小 (字节，含)
+        uploaded_after (datetime, optional): 上传时间下界 (含)
+        uploaded_before (datetime, optional): 上传时间上界 (不含)
+        created_by (str, optional): 创建者
+        derived (bool, optional): True 只看衍生文件，False 只看原始文件，None 不限
+        page (int): 页码 (1-indexed).
+        page_size (int): 每页数量.
+        sort_by (str): 排序字段 (name, upload_date, size, type).
+        sort_order (str): 排序顺序 (ASC, DESC).
+
+    Returns:
+        dict: 包含文件列表、总项目数、分页信息、分面计数 (facets) 的字典. 大小过滤或日期不按月对齐时
+              分面表无法精确表达，分面按其余条件 (日期扩展到整月) 计算，facets_exact 为 False
+    """
+    conditions, params = ["deleted_at IS NULL"], []
+    facet_conditions = {}  # 分面维度 -> (条件, 参数)
+    facets_exact = True
+
+    if folder_id is not None:
+        if folder_id == "ROOT":
+            conditions.append("folder_id IS NULL")
+        else:
+            conditions.append("folder_id = %s")
+            params.append(folder_id)
+        facet_conditions['folder'] = ("folder_id = %s", [folder_id if folder_id != "ROOT" else ''])
+    if types:
+        conditions.append(f"type IN ({', '.join(['%s'] * len(types))})")
+        params.extend(types)
+        facet_conditions['type'] = (f"type IN ({', '.join(['%s'] * len(types))})", list(types))
+    if min_size is not None:
+        conditions.append("size >= %s")
+        params.append(min_size)
+        facets_exact = False
+    if max_size is not None:
+        conditions.append("size <= %s")
+        params.append(max_size)
+        facets_exact = False
+    month_conditions, month_params = [], []
+    if uploaded_after is not None:
+        conditions.append("upload_date >= %s")
+        params.append(uploaded_after)
+        month_conditions.append("month >= %s")
+        month_params.append(uploaded_after.strftime('%Y-%m'))
+        facets_exact = facets_exact and uploaded_after == _month_floor(uploaded_after)
+    if uploaded_before is not None:
+        conditions.append("upload_date < %s")
+        params.append(uploaded_before)
+        upper = _month_floor(uploaded_before)
+        if upper == uploaded_before:
+            month_conditions.append("month < %s")
+        else: # 上界落在月中: 该月整体计入
+            month_conditions.append("month <= %s")
+            facets_exact = False
+        month_params.append(upper.strftime('%Y-%m'))
+    if month_conditions:
+        facet_conditions['month'] = (" AND ".join(month_conditions), month_params)
+    if created_by is not None:
+        conditions.append("created_by = %s")
+        params.append(created_by)
+        facet_conditions['created_by'] = ("created_by = %s", [created_by])
+    if derived is not None:
+        conditions.append("derived_from_file_id IS NOT NULL" if derived else "derived_from_file_id IS NULL")
+        facet_conditions['derived'] = ("is_derived = %s", [1 if derived else 0])
+
+    def facet_where(exclude=None):
+        parts = [(sql, values) for name, (sql, values) in facet_conditions.items() if name != exclude]
+        where = " WHERE " + " AND ".join(sql for sql, _ in parts) if parts else ""
+        return where, tuple(value for _, values in parts for value in values)
+
+    where = " WHERE " + " AND ".join(conditions)
+
+    valid_sort_fields = ['name', 'upload_date', 'size', 'type']
+    if sort_by not in valid_sort_fields:
+        sort_by = 'name'
+    if sort_order.upper() not in ['ASC', 'DESC']:
+        sort_order = 'ASC'
+
+    query = f"""
+    SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id
+    FROM files{where}
+    ORDER BY {sort_by} {sort_order.upper()}, id {sort_order.upper()}
+    LIMIT %s OFFSET %s
+    """
+    offset = (page - 1) * page_size
+
+    try:
+        result = execute_query(query, tuple(params) + (page_size, offset))
+
+        if facets_exact:
+            facet_filter, facet_params = facet_where()
+            total_result = execute_query(
+                f"SELECT COALESCE(SUM(file_count), 0) AS total FROM file_facets{facet_filter}", facet_params
+            )
+        else:
+            total_result = execute_query(f"SELECT COUNT(*) AS total FROM files{where}", tuple(params))
+        total_items = int(total_result[0]['total']) if total_result else 0
+
+        facets = {}
+        for dimension, column, order in (('type', 'type', 'files DESC, value'), ('month', 'month', 'value')):
+            facet_filter, facet_params = facet_where(exclude=dimension)
+            rows = execute_query(f"""
+            SELECT {column} AS value, SUM(file_count) AS files, SUM(total_size) AS bytes
+            FROM file_facets{facet_filter}
+            GROUP BY {column}
+            HAVING files > 0
+            ORDER BY {order}
+            """, facet_params)
+            facets[dimension] = [
+                {'value': row['value'], 'count': int(row['files']), 'size': int(row['bytes'])} for row in rows
+            ]
+
+        return {
+            'items': result,
+            'total_items': total_items,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total_items + page_size - 1) // page_size if page_size > 0 else 0,
+            'facets': facets,
+            'facets_exact': facets_exact
+        }
+    except Exception as e:
+        logging.error(f"按条件查询文件失败: {e}")
+        return None
+
+def rebuild_file_facets():
+    """
+    从 files 表全量重建 file_facets 分面统计 (用于首次上线或修复统计漂移)
+    
+    Returns:
+        int: 重建后的统计行数，失败返回 None
+    """
+    def rebuild(cursor):
+        cursor.execute("DELETE FROM file_facets")
+        cursor.execute("""
+        INSERT INTO file_facets (folder_id, created_by, type, month, is_derived, file_count, total_size)
+        SELECT COALESCE(folder_id, ''), COALESCE(created_by, ''), COALESCE(type, ''),
+               DATE_FORMAT(upload_date, '%Y-%m'), derived_from_file_id IS NOT NULL, COUNT(*), COALESCE(SUM(size), 0)
+        FROM files
+        WHERE deleted_at IS NULL
+        GROUP BY COALESCE(folder_id, ''), COALESCE(created_by, ''), COALESCE(type, ''),
+                 DATE_FORMAT(upload_date, '%Y-%m'), derived_from_file_id IS NOT NULL
+        """)
+        return cursor.rowcount
+
+    try:
+        rowcount = run_in_transaction(rebuild)
+        logging.info(f"文件分面统计重建完成: {rowcount} 行")
+        return rowcount
+    except Exception as e:
+        logging.error(f"重建文件分面统计失败: {e}")
+        return None
+
+def get_folder_usage(folder_id):
+    """
+    获取文件夹 (含子文件夹) 按创建者汇总的文件数与字节数，用于配额统计
+    
+    Args:
+        folder_id (str): 文件夹 ID
+        
+    Returns:
+        list: [{created_by, file_count, size, total_file_count, total_size}]，按 total_size 降序；失败返回 None
+    """
+    query = """
+    SELECT created_by, direct_count AS file_count, direct_size AS size,
+           total_count AS total_file_count, total_size
+    FROM folder_rollups
+    WHERE folder_id = %s AND total_count <> 0
+    ORDER BY total_size DESC, created_by
+    """
+    try:
+        return execute_query(query, (folder_id,))
+    except Exception as e:
+        logging.error(f"获取文件夹用量失败: {folder_id}, {e}")
+        return None
+
+def rebuild_folder_rollups():
+    """
+    从 files / folders 表全量重建 folder_rollups 文件夹汇总 (用于首次上线或修复统计漂移)
+    
+    Returns:
+        int: 重建后的汇总行数，失败返回 None
+    """
+    def rebuild(cursor):
+        cursor.execute("DELETE FROM folder_rollups")
+        cursor.execute("""
+        INSERT INTO folder_rollups (folder_id, created_by, direct_count, direct_size, total_count, total_size)
+        WITH RECURSIVE chain (folder_id, ancestor_id, depth) AS (
+            SELECT id, id, 0 FROM folders
+            UNION ALL
+            SELECT c.folder_id, f.parent_id, c.depth + 1 FROM chain c JOIN folders f ON f.id = c.ancestor_id
+            WHERE f.parent_id IS NOT NULL AND c.depth < 100
+        )
+        SELECT c.ancestor_id, COALESCE(fi.created_by, ''),
+               SUM(c.depth = 0), COALESCE(SUM(IF(c.depth = 0, fi.size, 0)), 0),
+               COUNT(*), COALESCE(SUM(fi.size), 0)
+        FROM chain c
+        JOIN files fi ON fi.folder_id = c.folder_id AND fi.deleted_at IS NULL
+        GROUP BY c.ancestor_id, COALESCE(fi.created_by, '')
+        """)
+        return cursor.rowcount
+
+    try:
+        rowcount = run_in_transaction(rebuild)
+        logging.info(f"文件夹汇总重建完成: {rowcount} 行")
+        return rowcount
+    except Exception as e:
+        logging.error(f"重建文件夹汇总失败: {e}")
+        return None
+
 def get_file_by_id(file_id):
     """
     根据 ID 获取文件信息
@@ -417,7 +935,7 @@ def get_file_by_id(file_id):
     query = """
     SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id
     FROM files
-    WHERE id = %s
+    WHERE id = %s AND deleted_at IS NULL
     """
     params = (file_id,)
     
@@ -428,6 +946,201 @@ def get_file_by_id(file_id):
         logging.error(f"获取文件失败: {e}")
         return None
 
+def get_files_by_ids(file_ids):
+    """
+    批量获取文件信息
+    
+    Args:
+        file_ids (list): 文件 ID 列表
+        
+    Returns:
+        dict: 文件 ID -> 文件信息 (不存在的 ID 不出现)，失败则返回空 dict
+    """
+    if not file_ids:
+        return {}
+    query = f"""
+    SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id
+    FROM files
+    WHERE id IN ({', '.join(['%s'] * len(file_ids))}) AND deleted_at IS NULL
+    """
+    try:
+        return {row['id']: row for row in execute_query(query, tuple(file_ids))}
+    except Exception as e:
+        logging.error(f"批量获取文件失败: {e}")
+        return {}
+
+def iter_file_names(batch_size=5000):
+    """
+    按文件 ID 顺序分批 (keyset) 遍历全部文件的 ID 与名称，用于重建文件名索引
+    
+    Args:
+        batch_size (int): 每批读取的行数
+        
+    Yields:
+        tuple: (file_id, name)
+    """
+    last_id = ''
+    while True:
+        rows = execute_query(
+            "SELECT id, name FROM files WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s", (last_id, batch_size)
+        )
+        for row in rows:
+            yield row['id'], row['name']
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+def iter_file_locations(uploaded_before=None, prefix=None, batch_size=1000):
+    """
+    按存储位置的字节序 (与 MinIO 列举对象的顺序一致) 分批遍历未删除文件的存储位置，用于与 MinIO 归并对账.
+    服务端只排序一次，结果以非缓冲游标流式读取，遍历期间独占一个连接池连接 (见 iter_query)
+    
+    Args:
+        uploaded_before (datetime, optional): 只遍历早于该时间上传的文件
+        prefix (str, optional): 只遍历位置以该前缀开头的文件 (LIKE 前缀匹配，可使用 idx_files_location)
+        batch_size (int): 每批的行数
+        
+    Yields:
+        list: 每批文件记录 [{id, location, upload_date}]
+    """
+    query = "SELECT id, location, upload_date FROM files WHERE deleted_at IS NULL AND location IS NOT NULL AND location <> ''"
+    params = []
+    if prefix:
+        query += " AND location LIKE %s"
+        params.append(prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if uploaded_before is not None:
+        query += " AND upload_date < %s"
+        params.append(uploaded_before)
+    batch = []
+    for row in iter_query(query + " ORDER BY location COLLATE utf8mb4_bin", tuple(params), batch_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_referenced_locations(locations):
+    """
+    返回给定对象名称中被 files 记录引用的部分 (含回收站中的文件，其对象由垃圾回收负责)
+    
+    Args:
+        locations (list): 对象名称列表
+        
+    Returns:
+        set: 被引用的对象名称
+    """
+    if not locations:
+        return set()
+    query = f"SELECT location FROM files WHERE location IN ({', '.join(['%s'] * len(locations))})"
+    return {row['location'] for row in execute_query(query, tuple(locations))}
+
+def iter_folder_tree_files(folder_id, batch_size=500):
+    """
+    遍历文件夹子树中的全部文件，附带文件所在文件夹相对子树根的路径.
+    先用一次递归 CTE 取出子树的文件夹路径，再逐个文件夹按文件 ID 分批 (keyset) 读取文件;
+    每批都是独立的短查询，批次之间不占用连接 (调用方可能边读边向慢速客户端输出)
+    
+    Args:
+        folder_id (str): 子树根文件夹 ID
+        batch_size (int): 每批读取的行数
+        
+    Yields:
+        dict: 文件记录 (id, name, location, size, type, upload_date, folder_path)，
+              按 folder_path 分组、组内按 ID 排序; folder_path 为 '' 表示直接位于根文件夹
+    """
+    folders = execute_query("""
+    WITH RECURSIVE tree (id, folder_path, depth) AS (
+        SELECT id, CAST('' AS CHAR(4096)), 0 FROM folders WHERE id = %s
+        UNION ALL
+        SELECT f.id, CONCAT(t.folder_path, IF(t.depth = 0, '', '/'), f.name), t.depth + 1
+        FROM folders f JOIN tree t ON f.parent_id = t.id
+        WHERE t.depth < 100
+    )
+    SELECT id, folder_path FROM tree ORDER BY folder_path, id
+    """, (folder_id,))
+    for folder in folders:
+        last_id = ''
+        while True:
+            rows = execute_query("""
+            SELECT id, name, location, size, type, upload_date FROM files
+            WHERE folder_id = %s AND id > %s AND deleted_at IS NULL
+            ORDER BY id LIMIT %s
+            """, (folder['id'], last_id, batch_size))
+            for row in rows:
+                row['folder_path'] = folder['folder_path']
+                yield row
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1]['id']
+
+_SUBTREE_CTE = """
+    WITH RECURSIVE subtree (id) AS (
+        SELECT id FROM folders WHERE id = %s
+        UNION ALL
+        SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+    )
+"""
+
+def iter_export_folders(folder_id=None, created_by=None, batch_size=1000):
+    """
+    流式导出文件夹记录 (非缓冲游标，按 ID 排序)
+    导出期间独占一个连接池连接 (见 iter_query)，并发导出数需小于 DB_POOL_SIZE
+
+    Args:
+        folder_id (str, optional): 只导出该文件夹及其子孙文件夹
+        created_by (str, optional): 只导出该用户创建的文件夹
+        batch_size (int): 每次从服务端读取的行数
+
+    Yields:
+        dict: 文件夹记录 (id, name, parent_id, created_at, created_by)
+    """
+    conditions, params = [], []
+    if folder_id:
+        conditions.append("fo.id IN (SELECT id FROM subtree)")
+        params.append(folder_id)
+    if created_by:
+        conditions.append("fo.created_by = %s")
+        params.append(created_by)
+    query = f"""
+    {_SUBTREE_CTE if folder_id else ''}
+    SELECT fo.id, fo.name, fo.parent_id, fo.created_at, fo.created_by
+    FROM folders fo
+    {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+    ORDER BY fo.id
+    """
+    yield from iter_query(query, tuple(params), batch_size=batch_size)
+
+def iter_export_files(folder_id=None, created_by=None, batch_size=1000):
+    """
+    流式导出文件记录 (非缓冲游标，按 ID 排序，不含已软删除的文件)
+    导出期间独占一个连接池连接 (见 iter_query)，并发导出数需小于 DB_POOL_SIZE
+
+    Args:
+        folder_id (str, optional): 只导出该文件夹子树中的文件
+        created_by (str, optional): 只导出该用户上传的文件
+        batch_size (int): 每次从服务端读取的行数
+
+    Yields:
+        dict: 文件记录 (id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id)
+    """
+    conditions, params = ["fi.deleted_at IS NULL"], []
+    if folder_id:
+        conditions.append("fi.folder_id IN (SELECT id FROM subtree)")
+        params.append(folder_id)
+    if created_by:
+        conditions.append("fi.created_by = %s")
+        params.append(created_by)
+    query = f"""
+    {_SUBTREE_CTE if folder_id else ''}
+    SELECT fi.id, fi.name, fi.location, fi.size, fi.type, fi.folder_id, fi.upload_date, fi.created_by,
+           fi.derived_from_file_id
+    FROM files fi
+    WHERE {' AND '.join(conditions)}
+    ORDER BY fi.id
+    """
+    yield from iter_query(query, tuple(params), batch_size=batch_size)
+
 def get_folder_by_id(folder_id):
     """通过 ID 获取单个文件夹信息."""
     query = """
@@ -444,7 +1157,7 @@ def get_folder_by_id(folder_id):
 
 def delete_file(file_id):
     """
-    删除文件记录
+    删除文件记录 (软删除: 标记 deleted_at 后对列表与查询不可见，对象与记录由 purge_deleted_files 延迟清理)
     
     Args:
         file_id (str): 文件 ID
@@ -452,52 +1165,325 @@ def delete_file(file_id):
     Returns:
         bool: 删除成功返回 True，失败返回 False
     """
-    query = """
-    DELETE FROM files
-    WHERE id = %s
-    """
-    params = (file_id,)
-    
     try:
-        rowcount = execute_query(query, params, fetch=False)
-        success = rowcount > 0
-        if success:
-            logging.info(f"文件记录删除成功: {file_id}")
-        else:
-            logging.warning(f"文件记录未找到: {file_id}")
-        return success
-    except Exception as e:
-        logging.error(f"文件记录删除失败: {e}")
+        deleted, _ = delete_files([file_id])
+    except Exception:
         return False
+    if not deleted:
+        logging.warning(f"文件记录未找到: {file_id}")
+        return False
+    return True
 
-def delete_folder(folder_id):
+def delete_files(file_ids, batch_size=500):
     """
-    删除文件夹记录
+    在单个事务中批量软删除文件记录 (标记 deleted_at)，并批量更新聚合统计与文件名索引.
+    MinIO 对象与数据库记录在保留期后由 purge_deleted_files 清理，保留期内可通过 restore_files 恢复
     
     Args:
-        folder_id (str): 文件夹 ID
+        file_ids (list): 文件 ID 列表
+        batch_size (int): 每条 SQL 语句处理的 ID 数
         
     Returns:
-        bool: 删除成功返回 True，失败返回 False
+        tuple: (实际删除的文件记录列表 (供调用方清理索引), 已在回收站中的文件 ID 列表);
+               两者都不包含的 ID 为不存在的文件
+
+    Raises:
+        mysql.connector.Error: 数据库操作失败 (事务已回滚，没有记录被删除)
     """
-    # 先将该文件夹下的文件设置为无文件夹
-    update_query = """
-    UPDATE files
-    SET folder_id = NULL
-    WHERE folder_id = %s
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        return [], []
+    now = datetime.now()
+
+    def delete(cursor):
+        deleted, trashed = [], []
+        for start in range(0, len(file_ids), batch_size):
+            batch = file_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"""
+            SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id, deleted_at
+            FROM files
+            WHERE id IN ({placeholders})
+            FOR UPDATE
+            """, tuple(batch))
+            rows = []
+            for row in cursor.fetchall():
+                if row.pop('deleted_at') is None:
+                    rows.append(row)
+                else:
+                    trashed.append(row['id'])
+            if rows:
+                cursor.execute(
+                    f"UPDATE files SET deleted_at = %s WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                    (now,) + tuple(row['id'] for row in rows)
+                )
+                deleted.extend(rows)
+        apply_file_aggregates(cursor, deleted, -1)
+        return deleted, trashed
+
+    try:
+        deleted, trashed = run_in_transaction(delete)
+    except Exception as e:
+        logging.error(f"删除文件记录失败: {e}")
+        raise
+    logging.info(f"删除文件记录: 请求 {len(file_ids)} 个，删除 {len(deleted)} 个")
+    if deleted:
+        try:
+            get_name_index().delete([row['id'] for row in deleted])
+        except Exception as e:
+            logging.error(f"更新文件名索引失败: {e}")
+    return deleted, trashed
+
+def restore_files(file_ids, batch_size=500):
     """
+    恢复已软删除、尚未被清理的文件 (撤销删除)，重新计入聚合统计与文件名索引.
+    原文件夹已被删除时，delete_folder 已将其 folder_id 置空，恢复到未分类
     
-    # 然后删除文件夹
-    delete_query = """
-    DELETE FROM folders
-    WHERE id = %s
+    Args:
+        file_ids (list): 文件 ID 列表
+        batch_size (int): 每条 SQL 语句处理的 ID 数
+        
+    Returns:
+        list: 实际恢复的文件记录，失败返回 None
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        return []
+
+    def restore(cursor):
+        restored = []
+        for start in range(0, len(file_ids), batch_size):
+            batch = file_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"""
+            SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id
+            FROM files
+            WHERE id IN ({placeholders}) AND deleted_at IS NOT NULL
+            FOR UPDATE
+            """, tuple(batch))
+            rows = cursor.fetchall()
+            if rows:
+                cursor.execute(
+                    f"UPDATE files SET deleted_at = NULL WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                    tuple(row['id'] for row in rows)
+                )
+                restored.extend(rows)
+        apply_file_aggregates(cursor, restored, 1)
+        return restored
+
+    try:
+        restored = run_in_transaction(restore)
+        logging.info(f"恢复文件记录: 请求 {len(file_ids)} 个，恢复 {len(restored)} 个")
+        for row in restored:
+            update_name_index(row['id'], row['name'])
+        return restored
+    except Exception as e:
+        logging.error(f"恢复文件记录失败: {e}")
+        return None
+
+def get_deleted_files(created_by=None, page=1, page_size=10):
+    """
+    获取回收站中 (已软删除、尚未清理) 的文件列表，按删除时间倒序
+    
+    Args:
+        created_by (str, optional): 只看该创建者的文件
+        page (int): 页码 (1-indexed).
+        page_size (int): 每页数量.
+        
+    Returns:
+        dict: 包含文件列表、总项目数、当前页码、每页数量和总页数的字典
+    """
+    where = "WHERE deleted_at IS NOT NULL"
+    params = []
+    if created_by is not None:
+        where += " AND created_by = %s"
+        params.append(created_by)
+    query = f"""
+    SELECT id, name, location, size, type, folder_id, upload_date, created_by, derived_from_file_id, deleted_at
+    FROM files
+    {where}
+    ORDER BY deleted_at DESC, id
+    LIMIT %s OFFSET %s
+    """
+    try:
+        result = execute_query(query, tuple(params) + (page_size, (page - 1) * page_size))
+        total_count_result = execute_query(f"SELECT COUNT(*) as total FROM files {where}", tuple(params))
+        total_items = total_count_result[0]['total'] if total_count_result else 0
+        return {
+            'items': result,
+            'total_items': total_items,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total_items + page_size - 1) // page_size if page_size > 0 else 0
+        }
+    except Exception as e:
+        logging.error(f"获取回收站文件失败: {e}")
+        return {'items': [], 'total_items': 0, 'page': page, 'page_size': page_size, 'total_pages': 0}
+
+def purge_deleted_files(deleted_before, remove_objects, limit=1000):
+    """
+    清理一批删除时间早于 deleted_before 的软删除文件: 先删除 MinIO 对象，再删除对象已删除成功的记录.
+    整个过程在一个事务内持有这些行的锁 (FOR UPDATE SKIP LOCKED)，并发的恢复请求会等待清理结束，
+    多个清理进程之间互不阻塞
+    
+    Args:
+        deleted_before (datetime): 只清理早于该时间删除的文件
+        remove_objects (callable): 接收对象名称列表，返回删除失败的对象名称列表
+        limit (int): 本批最多清理的文件数
+        
+    Returns:
+        tuple: (清理的文件数, 对象删除失败的文件数)，失败返回 None
+    """
+    def purge(cursor):
+        cursor.execute("""
+        SELECT id, location
+        FROM files
+        WHERE deleted_at IS NOT NULL AND deleted_at < %s
+        ORDER BY deleted_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """, (deleted_before, limit))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, 0
+        failed_objects = set(remove_objects([row['location'] for row in rows if row['location']]))
+        purged = [row['id'] for row in rows if row['location'] not in failed_objects]
+        if purged:
+            cursor.execute(
+                f"DELETE FROM files WHERE id IN ({', '.join(['%s'] * len(purged))}) AND deleted_at IS NOT NULL",
+                tuple(purged)
+            )
+        return len(purged), len(rows) - len(purged)
+
+    try:
+        purged, failed = run_in_transaction(purge)
+        if purged or failed:
+            logging.info(f"清理已删除文件: {purged} 个，对象删除失败 {failed} 个")
+        return purged, failed
+    except Exception as e:
+        logging.error(f"清理已删除文件失败: {e}")
+        return None
+
+def get_file_lineage(file_id):
+    """
+    获取文件所在的完整衍生树 (一次递归 CTE 查询): 先沿 derived_from_file_id 向上找到原始文件，
+    再从原始文件向下展开全部衍生文件. 向下展开使用 files 表上 derived_from_file_id 的索引
+    
+    Args:
+        file_id (str): 衍生树中任意文件的 ID
+        
+    Returns:
+        list: 文件记录列表 (含 depth，原始文件 depth 为 0)，按 depth、上传时间排序；文件不存在返回空列表，失败返回 None
+    """
+    query = """
+    WITH RECURSIVE up (id, derived_from_file_id, depth) AS (
+        SELECT id, derived_from_file_id, 0 FROM files WHERE id = %s AND deleted_at IS NULL
+        UNION ALL
+        SELECT f.id, f.derived_from_file_id, u.depth + 1 FROM files f JOIN up u ON f.id = u.derived_from_file_id
+        WHERE u.depth < 100 AND f.deleted_at IS NULL
+    ),
+    root AS (
+        SELECT id FROM up ORDER BY depth DESC LIMIT 1
+    ),
+    down (id, depth) AS (
+        SELECT id, 0 FROM root
+        UNION ALL
+        SELECT f.id, d.depth + 1 FROM files f JOIN down d ON f.derived_from_file_id = d.id
+        WHERE d.depth < 100 AND f.deleted_at IS NULL
+    )
+    SELECT f.id, f.name, f.location, f.size, f.type, f.folder_id, f.upload_date, f.created_by,
+           f.derived_from_file_id, d.depth
+    FROM down d
+    JOIN files f ON f.id = d.id
+    ORDER BY d.depth, f.upload_date, f.id
+    """
+    try:
+        return execute_query(query, (file_id,))
+    except Exception as e:
+        logging.error(f"获取文件衍生树失败: {file_id}, {e}")
+        return None
+
+def get_file_descendants(file_id):
+    """
+    获取文件自身及其全部 (多级) 衍生文件 (递归 CTE，使用 derived_from_file_id 索引)
+    
+    Args:
+        file_id (str): 文件 ID
+        
+    Returns:
+        list: 文件记录列表 (含 depth，自身 depth 为 0)，失败返回 None
+    """
+    query = """
+    WITH RECURSIVE down (id, depth) AS (
+        SELECT id, 0 FROM files WHERE id = %s AND deleted_at IS NULL
+        UNION ALL
+        SELECT f.id, d.depth + 1 FROM files f JOIN down d ON f.derived_from_file_id = d.id
+        WHERE d.depth < 100 AND f.deleted_at IS NULL
+    )
+    SELECT f.id, f.name, f.location, f.size, f.type, f.folder_id, f.upload_date, f.created_by,
+           f.derived_from_file_id, d.depth
+    FROM down d
+    JOIN files f ON f.id = d.id
+    ORDER BY d.depth, f.upload_date, f.id
+    """
+    try:
+        return execute_query(query, (file_id,))
+    except Exception as e:
+        logging.error(f"获取衍生文件失败: {file_id}, {e}")
+        return None
+
+def delete_folder(folder_id):
+    """
+    删除文件夹记录
+    
+    Args:
+        folder_id (str): 文件夹 ID
+        
+    Returns:
+        bool: 删除成功返回 True，失败返回 False
+    """
+    # 先将该文件夹下的文件设置为无文件夹
+    update_query = """
+    UPDATE files
+    SET folder_id = NULL
+    WHERE folder_id = %s
+    """
+    
+    # 然后删除文件夹
+    delete_query = """
+    DELETE FROM folders
+    WHERE id = %s
+    """
+    
+    # 文件转为无文件夹后，分面统计随之并入未分类 ('')
+    merge_facets_query = """
+    INSERT INTO file_facets (folder_id, created_by, type, month, is_derived, file_count, total_size)
+    SELECT * FROM (
+        SELECT '' AS folder_id, created_by, type, month, is_derived, file_count AS moved_count, total_size AS moved_size
+        FROM file_facets
+        WHERE folder_id = %s
+    ) AS moved
+    ON DUPLICATE KEY UPDATE file_count = file_count + moved_count, total_size = total_size + moved_size
     """
     
     params = (folder_id,)
+
+    def delete(cursor):
+        cursor.execute("SELECT parent_id FROM folders WHERE id = %s FOR UPDATE", params)
+        folder = cursor.fetchone()
+        if not folder:
+            return 0
+        # 该文件夹的子树不再属于原祖先链
+        _move_folder_rollups(cursor, folder_id, folder['parent_id'], -1)
+        cursor.execute("DELETE FROM folder_rollups WHERE folder_id = %s", params)
+        cursor.execute(update_query, params)
+        cursor.execute(merge_facets_query, params)
+        cursor.execute("DELETE FROM file_facets WHERE folder_id = %s", params)
+        cursor.execute(delete_query, params)
+        return cursor.rowcount
     
     try:
-        execute_query(update_query, params, fetch=False)
-        rowcount = execute_query(delete_query, params, fetch=False)
+        rowcount = run_in_transaction(delete)
         success = rowcount > 0
         if success:
             logging.info(f"文件夹记录删除成功: {folder_id}")
@@ -506,4 +1492,499 @@ def delete_folder(folder_id):
         return success
     except Exception as e:
         logging.error(f"文件夹记录删除失败: {e}")
-        return False 
\ No newline at end of file
+        return False 
+
+def insert_job(job_type, payload, priority=0, max_attempts=3, created_by=None):
+    """
+    插入后台任务记录
+    
+    Args:
+        job_type (str): 任务类型 (对应已注册的任务处理函数)
+        payload (str): JSON 序列化后的任务参数
+        priority (int): 优先级，数值越大越先执行
+        max_attempts (int): 最大尝试次数
+        created_by (str, optional): 创建者 ID
+        
+    Returns:
+        str: 创建的任务 ID，失败则返回 None
+    """
+    job_id = generate_uuid()
+    now = datetime.now()
+    
+    query = """
+    INSERT INTO jobs (id, job_type, payload, status, priority, attempts, max_attempts, run_after, created_at, updated_at, created_by)
+    VALUES (%s, %s, %s, 'queued', %s, 0, %s, %s, %s, %s, %s)
+    """
+    params = (job_id, job_type, payload, priority, max_attempts, now, now, now, created_by)
+    
+    try:
+        execute_query(query, params, fetch=False)
+        logging.info(f"任务创建成功: {job_type}, ID: {job_id}")
+        return job_id
+    except Exception as e:
+        logging.error(f"任务创建失败: {e}")
+        return None
+
+def insert_jobs(job_type, payloads, priority=0, max_attempts=3, created_by=None, batch_id=None, batch_size=500):
+    """
+    在单个事务中批量插入同一类型的后台任务 (多行 INSERT)，可共用一个批次 ID
+    
+    Args:
+        job_type (str): 任务类型
+        payloads (list): 每个任务 JSON 序列化后的参数
+        priority (int): 优先级
+        max_attempts (int): 最大尝试次数
+        created_by (str, optional): 创建者 ID
+        batch_id (str, optional): 批次 ID，用 get_batch_jobs 查询整批任务
+        batch_size (int): 每条 INSERT 语句的行数
+        
+    Returns:
+        list: 创建的任务 ID (与 payloads 顺序一致)，失败则返回 None (没有任务被创建)
+    """
+    now = datetime.now()
+    rows = [(generate_uuid(), job_type, payload, priority, max_attempts, now, now, now, created_by, batch_id)
+            for payload in payloads]
+
+    def insert(cursor):
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            placeholders = ', '.join(["(%s, %s, %s, 'queued', %s, 0, %s, %s, %s, %s, %s, %s)"] * len(batch))
+            cursor.execute(f"""
+            INSERT INTO jobs (id, job_type, payload, status, priority, attempts, max_attempts, run_after,
+                              created_at, updated_at, created_by, batch_id)
+            VALUES {placeholders}
+            """, tuple(value for row in batch for value in row))
+
+    try:
+        run_in_transaction(insert)
+        logging.info(f"批量创建任务成功: {job_type}, 数量: {len(rows)}, 批次: {batch_id}")
+        return [row[0] for row in rows]
+    except Exception as e:
+        logging.error(f"批量创建任务失败: {e}")
+        return None
+
+def claim_job(worker_id, job_types=None):
+    """
+    领取一个待执行的任务 (按优先级从高到低，同优先级先进先出).
+    使用 SELECT ... FOR UPDATE SKIP LOCKED，多个 worker 并发领取时互不阻塞.
+    
+    Args:
+        worker_id (str): 领取任务的 worker 标识
+        job_types (list, optional): 只领取这些类型的任务
+        
+    Returns:
+        dict: 已标记为 running 的任务记录，没有可执行任务时返回 None
+    """
+    select_query = """
+    SELECT id, job_type, payload, status, priority, attempts, max_attempts, created_at, created_by
+    FROM jobs
+    WHERE status = 'queued' AND run_after <= %s
+    """
+    params = [datetime.now()]
+    if job_types:
+        select_query += f" AND job_type IN ({', '.join(['%s'] * len(job_types))})"
+        params.extend(job_types)
+    select_query += " ORDER BY priority DESC, created_at ASC LIMIT 1 FOR UPDATE SKIP LOCKED"
+
+    update_query = """
+    UPDATE jobs
+    SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = %s, updated_at = %s
+    WHERE id = %s
+    """
+    
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(select_query, tuple(params))
+        job = cursor.fetchone()
+        if not job:
+            connection.commit()
+            return None
+        now = datetime.now()
+        cursor.execute(update_query, (worker_id, now, now, job['id']))
+        connection.commit()
+        job['status'] = 'running'
+        job['attempts'] += 1
+        job['locked_by'] = worker_id
+        return job
+    except mysql.connector.Error as e:
+        if connection:
+            connection.rollback()
+        logging.error(f"领取任务失败: {e}")
+        return None
+    finally:
+        if connection:
+            connection.close()
+
+def _job_owner_condition(worker_id):
+    """worker_id 非空时只更新仍由该 worker 持有的任务 (被回收并重新领取的任务不能被原 worker 结束)."""
+    if worker_id is None:
+        return "", ()
+    return " AND status = 'running' AND locked_by = %s", (worker_id,)
+
+def heartbeat_job(job_id, worker_id):
+    """
+    刷新执行中任务的 locked_at，避免长任务被 requeue_stale_jobs 当作失联任务回收
+    
+    Args:
+        job_id (str): 任务 ID
+        worker_id (str): 持有任务的 worker 标识
+        
+    Returns:
+        bool: 任务仍由该 worker 持有返回 True，否则 (已被回收或更新失败) 返回 False
+    """
+    query = "UPDATE jobs SET locked_at = %s WHERE id = %s AND status = 'running' AND locked_by = %s"
+    try:
+        return execute_query(query, (datetime.now(), job_id, worker_id), fetch=False) > 0
+    except Exception as e:
+        logging.error(f"任务心跳更新失败: ID {job_id}, {e}")
+        return False
+
+def complete_job(job_id, result=None, worker_id=None):
+    """
+    标记任务执行成功
+    
+    Args:
+        job_id (str): 任务 ID
+        result (str, optional): JSON 序列化后的执行结果
+        worker_id (str, optional): 执行任务的 worker 标识，提供时只在任务仍由其持有时更新
+        
+    Returns:
+        bool: 更新成功返回 True，失败 (或任务已不由该 worker 持有) 返回 False
+    """
+    owner_condition, owner_params = _job_owner_condition(worker_id)
+    query = f"""
+    UPDATE jobs
+    SET status = 'succeeded', result = %s, last_error = NULL, locked_by = NULL, locked_at = NULL, updated_at = %s
+    WHERE id = %s{owner_condition}
+    """
+    try:
+        return execute_query(query, (result, datetime.now(), job_id) + owner_params, fetch=False) > 0
+    except Exception as e:
+        logging.error(f"任务状态更新失败: ID {job_id}, {e}")
+        return False
+
+def fail_job(job_id, error, retry_after=None, worker_id=None):
+    """
+    记录任务执行失败. 提供 retry_after 时重新排队，否则标记为最终失败.
+    
+    Args:
+        job_id (str): 任务 ID
+        error (str): 错误信息
+        retry_after (datetime, optional): 下次可重试的时间
+        worker_id (str, optional): 执行任务的 worker 标识，提供时只在任务仍由其持有时更新
+        
+    Returns:
+        bool: 更新成功返回 True，失败 (或任务已不由该 worker 持有) 返回 False
+    """
+    status = 'queued' if retry_after else 'failed'
+    owner_condition, owner_params = _job_owner_condition(worker_id)
+    query = f"""
+    UPDATE jobs
+    SET status = %s, last_error = %s, run_after = COALESCE(%s, run_after), locked_by = NULL, locked_at = NULL, updated_at = %s
+    WHERE id = %s{owner_condition}
+    """
+    try:
+        return execute_query(query, (status, error, retry_after, datetime.now(), job_id) + owner_params, fetch=False) > 0
+    except Exception as e:
+        logging.error(f"任务状态更新失败: ID {job_id}, {e}")
+        return False
+
+def requeue_stale_jobs(locked_before):
+    """
+    将 worker 异常退出后遗留的 running 任务重新排队. 执行中的任务由 worker 定期心跳刷新 locked_at
+    
+    Args:
+        locked_before (datetime): 最后一次心跳 (或领取) 早于该时间的 running 任务视为已失联
+        
+    Returns:
+        int: 重新排队的任务数
+    """
+    query = """
+    UPDATE jobs
+    SET status = IF(attempts < max_attempts, 'queued', 'failed'),
+        last_error = 'worker lost', locked_by = NULL, locked_at = NULL, updated_at = %s
+    WHERE status = 'running' AND locked_at < %s
+    """
+    try:
+        rowcount = execute_query(query, (datetime.now(), locked_before), fetch=False)
+        if rowcount:
+            logging.warning(f"已回收 {rowcount} 个失联任务")
+        return rowcount
+    except Exception as e:
+        logging.error(f"回收失联任务失败: {e}")
+        return 0
+
+def get_job_by_id(job_id):
+    """通过 ID 获取单个任务信息."""
+    query = """
+    SELECT id, job_type, payload, status, priority, attempts, max_attempts, run_after,
+           locked_by, last_error, result, created_at, updated_at, created_by
+    FROM jobs
+    WHERE id = %s
+    """
+    try:
+        result = execute_query(query, (job_id,))
+        return result[0] if result else None
+    except Exception as e:
+        logging.error(f"获取任务失败: ID {job_id}, {e}")
+        return None
+
+def get_batch_jobs(batch_id):
+    """
+    获取一个批次的全部任务 (按创建时间排序)
+    
+    Args:
+        batch_id (str): 批次 ID
+        
+    Returns:
+        list: 任务列表 (批次不存在时为空列表)，查询失败返回 None
+    """
+    query = """
+    SELECT id, job_type, payload, status, attempts, max_attempts, last_error, result, created_at, updated_at, created_by
+    FROM jobs
+    WHERE batch_id = %s
+    ORDER BY created_at, id
+    """
+    try:
+        return execute_query(query, (batch_id,))
+    except Exception as e:
+        logging.error(f"获取批次任务失败: 批次 {batch_id}, {e}")
+        return None
+
+def get_jobs(status=None, job_type=None, page=1, page_size=10):
+    """
+    获取任务列表 (按创建时间倒序分页).
+    
+    Args:
+        status (str, optional): 按状态过滤 (queued, running, succeeded, failed)
+        job_type (str, optional): 按任务类型过滤
+        page (int): 页码 (1-indexed).
+        page_size (int): 每页数量.
+        
+    Returns:
+        dict: 包含任务列表、总项目数、当前页码、每页数量和总页数的字典
+    """
+    conditions = []
+    params = []
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if job_type:
+        conditions.append("job_type = %s")
+        params.append(job_type)
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"""
+    SELECT id, job_type, status, priority, attempts, max_attempts, run_after, last_error, created_at, updated_at, created_by
+    FROM jobs
+    {where_clause}
+    ORDER BY created_at DESC
+    LIMIT %s OFFSET %s
+    """
+    offset = (page - 1) * page_size
+    
+    try:
+        result = execute_query(query, tuple(params + [page_size, offset]))
+        total_count_result = execute_query(f"SELECT COUNT(*) as total FROM jobs {where_clause}", tuple(params))
+        total_items = total_count_result[0]['total'] if total_count_result else 0
+        return {
+            'items': result,
+            'total_items': total_items,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total_items + page_size - 1) // page_size if page_size > 0 else 0
+        }
+    except Exception as e:
+        logging.error(f"获取任务列表失败: {e}")
+        return {'items': [], 'total_items': 0, 'page': page, 'page_size': page_size, 'total_pages': 0}
+
+def replace_file_chunks(file_id, derived_from_file_id, chunks, batch_size=500):
+    """
+    用新的分块替换文件的全部分块记录 (单个事务内完成)
+    
+    Args:
+        file_id (str): Markdown 文件 ID
+        derived_from_file_id (str, optional): Markdown 文件衍生自的原始文件 ID
+        chunks (list): 分块 dict 列表 (chunk_index, start_offset, end_offset, token_count, heading, content_hash)
+        batch_size (int): 每批插入的行数
+        
+    Returns:
+        bool: 成功返回 True，失败返回 False
+    """
+    delete_query = "DELETE FROM chunks WHERE file_id = %s"
+    insert_query = """
+    INSERT INTO chunks (id, file_id, derived_from_file_id, chunk_index, start_offset, end_offset, token_count, heading, content_hash, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    now = datetime.now()
+    rows = [
+        (chunk.get('id') or generate_uuid(), file_id, derived_from_file_id, chunk['chunk_index'],
+         chunk['start_offset'], chunk['end_offset'], chunk['token_count'], chunk.get('heading'),
+         chunk['content_hash'], now)
+        for chunk in chunks
+    ]
+    
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute(delete_query, (file_id,))
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(insert_query, rows[i:i + batch_size])
+        connection.commit()
+        logging.info(f"文件分块记录已更新: {file_id}, 分块数 {len(rows)}")
+        return True
+    except mysql.connector.Error as e:
+        if connection:
+            connection.rollback()
+        logging.error(f"文件分块记录更新失败: {file_id}, {e}")
+        return False
+    finally:
+        if connection:
+            connection.close()
+
+def get_file_chunks(file_id):
+    """
+    获取文件的分块记录 (按分块序号排序)
+    
+    Args:
+        file_id (str): Markdown 文件 ID
+        
+    Returns:
+        list: 分块记录列表，失败则返回空列表
+    """
+    query = """
+    SELECT id, file_id, derived_from_file_id, chunk_index, start_offset, end_offset, token_count, heading, content_hash, created_at
+    FROM chunks
+    WHERE file_id = %s
+    ORDER BY chunk_index
+    """
+    try:
+        return execute_query(query, (file_id,))
+    except Exception as e:
+        logging.error(f"获取文件分块失败: {file_id}, {e}")
+        return []
+
+def delete_file_chunks(file_id):
+    """
+    删除文件的全部分块记录
+    
+    Args:
+        file_id (str): Markdown 文件 ID
+        
+    Returns:
+        int: 删除的分块数
+    """
+    try:
+        return execute_query("DELETE FROM chunks WHERE file_id = %s", (file_id,), fetch=False)
+    except Exception as e:
+        logging.error(f"删除文件分块失败: {file_id}, {e}")
+        return 0
+
+def get_folder_subtree_ids(folder_id):
+    """
+    获取文件夹及其全部子孙文件夹的 ID (递归 CTE)
+    
+    Args:
+        folder_id (str): 根文件夹 ID
+        
+    Returns:
+        list: 文件夹 ID 列表 (根文件夹不存在时为空)，失败则返回 None
+    """
+    query = """
+    WITH RECURSIVE subtree (id) AS (
+        SELECT id FROM folders WHERE id = %s
+        UNION ALL
+        SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+    )
+    SELECT id FROM subtree
+    """
+    try:
+        return [row['id'] for row in execute_query(query, (folder_id,))]
+    except Exception as e:
+        logging.error(f"获取子文件夹失败: {folder_id}, {e}")
+        return None
+
+def get_file_ids(folder_ids=None, file_ids=None, created_by=None):
+    """
+    按条件筛选文件 ID (各条件之间为 AND)
+    
+    Args:
+        folder_ids (list, optional): 所在文件夹 ID 列表
+        file_ids (list, optional): 候选文件 ID 列表
+        created_by (str, optional): 创建者 ID
+        
+    Returns:
+        list: 文件 ID 列表，失败则返回 None
+    """
+    conditions = ["deleted_at IS NULL"]
+    params = []
+    for column, values in (('folder_id', folder_ids), ('id', file_ids)):
+        if values is not None:
+            if not values:
+                return []
+            conditions.append(f"{column} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+    if created_by is not None:
+        conditions.append("created_by = %s")
+        params.append(created_by)
+    
+    query = "SELECT id FROM files WHERE " + " AND ".join(conditions)
+    try:
+        return [row['id'] for row in execute_query(query, tuple(params))]
+    except Exception as e:
+        logging.error(f"筛选文件失败: {e}")
+        return None
+
+def get_chunks_by_ids(chunk_ids):
+    """
+    批量获取分块记录及其所属文件的名称、位置
+    
+    Args:
+        chunk_ids (list): 分块 ID 列表
+        
+    Returns:
+        dict: 分块 ID -> 分块记录 (含 file_name, location, folder_id)，失败则返回空 dict
+    """
+    if not chunk_ids:
+        return {}
+    query = f"""
+    SELECT c.id, c.file_id, c.derived_from_file_id, c.chunk_index, c.start_offset, c.end_offset,
+           c.token_count, c.heading, c.content_hash,
+           f.name AS file_name, f.location, f.folder_id
+    FROM chunks c
+    JOIN files f ON f.id = c.file_id AND f.deleted_at IS NULL
+    WHERE c.id IN ({', '.join(['%s'] * len(chunk_ids))})
+    """
+    try:
+        return {row['id']: row for row in execute_query(query, tuple(chunk_ids))}
+    except Exception as e:
+        logging.error(f"批量获取分块失败: {e}")
+        return {}
+
+def get_folder_ancestor_ids(folder_id):
+    """
+    获取文件夹自身及其全部祖先文件夹的 ID (递归 CTE)
+    
+    Args:
+        folder_id (str): 文件夹 ID
+        
+    Returns:
+        list: 文件夹 ID 列表 (从自身到根)，失败则返回 None
+    """
+    query = """
+    WITH RECURSIVE ancestors (id, parent_id, depth) AS (
+        SELECT id, parent_id, 0 FROM folders WHERE id = %s
+        UNION ALL
+        SELECT f.id, f.parent_id, a.depth + 1 FROM folders f JOIN ancestors a ON f.id = a.parent_id
+        WHERE a.depth < 100
+    )
+    SELECT id FROM ancestors ORDER BY depth
+    """
+    try:
+        return [row['id'] for row in execute_query(query, (folder_id,))]
+    except Exception as e:
+        logging.error(f"获取祖先文件夹失败: {folder_id}, {e}")
+        return None
@@ -0,0 +1,389 @@
+"""
+近重复分块检测模块 (MinHash + LSH 分段)
+转换得到的文档中常有大量重复的页眉、免责声明和模板段落. 建立分块索引时为每个分块计算
+MinHash 签名，按 LSH 分段 (banding) 查找候选，估计 Jaccard 相似度不低于 DEDUP_THRESHOLD 的
+分块归入同一簇: 每簇只有代表分块进入全文索引和向量索引，其余分块记录为指向代表的反向引用，
+检索结果通过反向引用列出包含该内容的全部文件.
+
+磁盘布局 (DEDUP_DIR):
+    journal.log      操作日志 (JSON Lines)，所有进程共享，压缩时原子替换为当前状态的快照
+    LOCK             fcntl 文件锁
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+from embedding_service import normalize_text
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DEDUP_DIR = os.getenv('DEDUP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'dedup'))
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.8))  # 估计 Jaccard 相似度阈值
+DEDUP_BANDS = int(os.getenv('DEDUP_BANDS', 32))
+DEDUP_ROWS = int(os.getenv('DEDUP_ROWS', 4))  # 签名长度 = DEDUP_BANDS * DEDUP_ROWS
+DEDUP_SHINGLE = int(os.getenv('DEDUP_SHINGLE', 5))  # 字符 shingle 长度
+DEDUP_MIN_CHARS = int(os.getenv('DEDUP_MIN_CHARS', 64))  # 更短的分块不参与去重
+DEDUP_COMPACT_THRESHOLD = int(os.getenv('DEDUP_COMPACT_THRESHOLD', 20000))
+
+_PRIME = (1 << 31) - 1
+
+
+class MinHasher:
+    """
+    字符 shingle 的 MinHash: h_i(x) = (a_i * crc32(x) + b_i) mod (2^31 - 1).
+    字符级 shingle 对中文和英文都适用，不依赖分词.
+    """
+
+    def __init__(self, num_perm=None, shingle=None, seed=1):
+        self.num_perm = num_perm or DEDUP_BANDS * DEDUP_ROWS
+        self.shingle = shingle or DEDUP_SHINGLE
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, self.num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, self.num_perm, dtype=np.uint64)[:, None]
+
+    def shingles(self, text):
+        """规范化文本 (NFKC、合并空白、小写) 后切分为字符 shingle 集合."""
+        text = normalize_text(text).lower()
+        k = self.shingle
+        if len(text) <= k:
+            return {text}
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, text):
+        """
+        计算 MinHash 签名
+
+        Args:
+            text (str): 分块文本
+
+        Returns:
+            np.ndarray: uint32 签名，长度 num_perm
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in self.shingles(text)), dtype=np.uint64
+        ) % _PRIME
+        return ((self._a * hashes[None, :] + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """按签名相同位置的比例估计 Jaccard 相似度."""
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+def _encode_signature(signature):
+    return base64.b64encode(signature.astype('<u4').tobytes()).decode('ascii')
+
+
+def _decode_signature(data):
+    return np.frombuffer(base64.b64decode(data), dtype='<u4').astype(np.uint32)
+
+
+class DedupIndex:
+    """
+    近重复分块簇 (代表分块 + 反向引用)，基于共享操作日志，可被多个进程同时读写.
+
+    日志操作:
+        rep       新的代表分块 (cid, fid, sig)
+        dup       近重复分块 (cid, fid) 归入代表 rep
+        promote   代表分块被删除，由簇内的分块 cid 接替 (沿用原签名)
+        del       删除分块 (代表分块只有在簇内没有其他分块时才直接删除)
+    """
+
+    def __init__(self, path, threshold=None, bands=None, rows=None, compact_threshold=None):
+        self.path = path
+        self.threshold = DEDUP_THRESHOLD if threshold is None else threshold
+        self.bands = bands or DEDUP_BANDS
+        self.rows = rows or DEDUP_ROWS
+        self.compact_threshold = compact_threshold or DEDUP_COMPACT_THRESHOLD
+        self.hasher = MinHasher(self.bands * self.rows)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(path, 'LOCK')
+        self._journal_path = os.path.join(path, 'journal.log')
+        self._reset()
+
+    def _reset(self):
+        self._reps = {}  # 代表分块 ID -> (file_id, 签名)
+        self._buckets = {}  # (段号, 段签名字节) -> {代表分块 ID}
+        self._members = {}  # 代表分块 ID -> {近重复分块 ID: file_id}
+        self._rep_of = {}  # 近重复分块 ID -> 代表分块 ID
+        self._by_file = {}  # file_id -> {近重复分块 ID}
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def _band_keys(self, signature):
+        data = signature.astype('<u4').tobytes()
+        width = self.rows * 4
+        return [(band, data[band * width:(band + 1) * width]) for band in range(self.bands)]
+
+    def _add_rep(self, chunk_id, file_id, signature):
+        self._reps[chunk_id] = (file_id, signature)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(chunk_id)
+
+    def _drop_rep(self, chunk_id):
+        _, signature = self._reps.pop(chunk_id)
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(chunk_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _add_member(self, chunk_id, file_id, rep):
+        self._members.setdefault(rep, {})[chunk_id] = file_id
+        self._rep_of[chunk_id] = rep
+        self._by_file.setdefault(file_id, set()).add(chunk_id)
+
+    def _drop_member(self, chunk_id):
+        rep = self._rep_of.pop(chunk_id)
+        file_id = self._members[rep].pop(chunk_id)
+        if not self._members[rep]:
+            del self._members[rep]
+        members = self._by_file[file_id]
+        members.discard(chunk_id)
+        if not members:
+            del self._by_file[file_id]
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'rep':
+            self._add_rep(entry['cid'], entry['fid'], _decode_signature(entry['sig']))
+        elif op == 'dup':
+            self._add_member(entry['cid'], entry['fid'], entry['rep'])
+        elif op == 'promote':
+            old, new = entry['rep'], entry['cid']
+            signature = self._reps[old][1]
+            file_id = self._members[old][new]
+            self._drop_member(new)
+            self._drop_rep(old)
+            self._add_rep(new, file_id, signature)
+            for chunk_id, member_file in list(self._members.pop(old, {}).items()):
+                self._rep_of[chunk_id] = new
+                self._members.setdefault(new, {})[chunk_id] = member_file
+        elif op == 'del':
+            chunk_id = entry['cid']
+            if chunk_id in self._rep_of:
+                self._drop_member(chunk_id)
+            elif chunk_id in self._reps:
+                for member in list(self._members.get(chunk_id, {})):
+                    self._drop_member(member)
+                self._drop_rep(chunk_id)
+
+    def _catch_up(self):
+        """载入其他进程追加的日志；日志被压缩替换 (inode 变化) 时从头重放 (调用方需持有文件锁)."""
+        try:
+            stat = os.stat(self._journal_path)
+        except FileNotFoundError:
+            if self._journal_inode is not None:
+                self._reset()
+            return
+        if stat.st_ino != self._journal_inode:
+            self._reset()
+            self._journal_inode = stat.st_ino
+        if stat.st_size <= self._journal_offset:
+            return
+        with open(self._journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 未写完整的行，等待下次读取
+                self._journal_offset += len(line)
+                self._journal_entries += 1
+                self._apply(json.loads(line))
+
+    def _append(self, entries):
+        """追加日志并应用到内存 (调用方需持有排他文件锁并已 catch up)."""
+        if not entries:
+            return
+        data = b''.join((json.dumps(entry) + '\n').encode('utf-8') for entry in entries)
+        with open(self._journal_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+        self._journal_offset += len(data)
+        self._journal_entries += len(entries)
+        for entry in entries:
+            self._apply(entry)
+        if self._journal_entries >= self.compact_threshold + 2 * (len(self._reps) + len(self._rep_of)):
+            self._compact()
+
+    def _compact(self):
+        """把当前状态写为新日志并原子替换旧日志 (调用方需持有排他文件锁)."""
+        entries = [{'op': 'rep', 'cid': chunk_id, 'fid': file_id, 'sig': _encode_signature(signature)}
+                   for chunk_id, (file_id, signature) in self._reps.items()]
+        entries.extend({'op': 'dup', 'cid': chunk_id, 'fid': file_id, 'rep': rep}
+                       for rep, members in self._members.items() for chunk_id, file_id in members.items())
+        tmp_path = f'{self._journal_path}.{os.getpid()}.tmp'
+        data = b''.join((json.dumps(entry) + '\n').encode('utf-8') for entry in entries)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._journal_inode = os.stat(self._journal_path).st_ino
+        self._journal_offset = len(data)
+        self._journal_entries = len(entries)
+        logging.info(f"去重日志压缩完成: 代表分块 {len(self._reps)}, 近重复分块 {len(self._rep_of)}")
+
+    def assign(self, chunks, exclude=None):
+        """
+        为新分块查找近重复簇. 找到的分块记录为该簇的反向引用，其余分块成为新簇的代表
+        (同一批中后面的分块也可以归入前面分块新建的簇).
+
+        Args:
+            chunks (list): [(chunk_id, file_id, text), ...]
+            exclude (set, optional): 不能作为代表的分块 ID (例如即将被删除的旧分块)
+
+        Returns:
+            dict: 近重复分块 ID -> 代表分块 ID. 不在其中的分块需要正常建立索引
+        """
+        exclude = exclude or set()
+        signed = [(chunk_id, file_id, self.hasher.signature(text))
+                  for chunk_id, file_id, text in chunks if len(text.strip()) >= DEDUP_MIN_CHARS]
+        duplicates = {}
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            entries = []
+            pending = {}  # 本批新增的代表分块: (段号, 段签名字节) -> [(chunk_id, 签名)]
+            for chunk_id, file_id, signature in signed:
+                if chunk_id in self._reps:
+                    continue
+                if chunk_id in self._rep_of:
+                    duplicates[chunk_id] = self._rep_of[chunk_id]
+                    continue
+                keys = self._band_keys(signature)
+                candidates = {}
+                for key in keys:
+                    for candidate in self._buckets.get(key, ()):
+                        candidates[candidate] = self._reps[candidate][1]
+                    candidates.update(pending.get(key, ()))
+                best, best_score = None, self.threshold
+                for candidate, candidate_signature in candidates.items():
+                    if candidate in exclude:
+                        continue
+                    score = estimate_similarity(signature, candidate_signature)
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is None:
+                    entries.append({'op': 'rep', 'cid': chunk_id, 'fid': file_id, 'sig': _encode_signature(signature)})
+                    for key in keys:
+                        pending.setdefault(key, []).append((chunk_id, signature))
+                else:
+                    entries.append({'op': 'dup', 'cid': chunk_id, 'fid': file_id, 'rep': best})
+                    duplicates[chunk_id] = best
+            self._append(entries)
+        return duplicates
+
+    def remove(self, chunk_ids):
+        """
+        删除分块. 被删除的代表分块如果簇内还有其他分块，由其中一个接替成为代表
+
+        Args:
+            chunk_ids (list): 分块 ID
+
+        Returns:
+            list: 接替的代表 [(新代表分块 ID, 新代表 file_id, 原代表分块 ID), ...]，
+                  新代表需要建立索引 (原代表的索引由调用方删除)
+        """
+        removing = set(chunk_ids)
+        promotions = []
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            entries = []
+            for chunk_id in removing:
+                if chunk_id in self._rep_of:
+                    entries.append({'op': 'del', 'cid': chunk_id})
+            for chunk_id in removing:
+                if chunk_id not in self._reps:
+                    continue
+                remaining = [(member, file_id) for member, file_id in self._members.get(chunk_id, {}).items()
+                             if member not in removing]
+                if remaining:
+                    member, file_id = remaining[0]
+                    entries.append({'op': 'promote', 'cid': member, 'rep': chunk_id})
+                    promotions.append((member, file_id, chunk_id))
+                else:
+                    entries.append({'op': 'del', 'cid': chunk_id})
+            self._append(entries)
+        return promotions
+
+    def _read(self):
+        with file_lock(self._lock_path, exclusive=False):
+            self._catch_up()
+
+    def representative(self, chunk_id):
+        """分块所在簇的代表分块 ID (分块自身是代表或未参与去重时返回自身)."""
+        with self._lock:
+            self._read()
+            return self._rep_of.get(chunk_id, chunk_id)
+
+    def cluster(self, chunk_id):
+        """
+        代表分块所在簇的全部分块
+
+        Returns:
+            list: [(chunk_id, file_id), ...]，第一个为代表分块；分块不是代表时返回空列表
+        """
+        with self._lock:
+            self._read()
+            rep = self._reps.get(chunk_id)
+            if rep is None:
+                return []
+            return [(chunk_id, rep[0])] + list(self._members.get(chunk_id, {}).items())
+
+    def representatives_for_files(self, file_ids):
+        """
+        查找簇内包含这些文件中分块的代表分块 (代表分块本身可能属于其他文件)
+
+        Args:
+            file_ids (iterable): 文件 ID
+
+        Returns:
+            dict: 代表分块 ID -> (代表 file_id, 属于这些文件的一个近重复分块 ID)
+        """
+        with self._lock:
+            self._read()
+            covering = {}
+            for file_id in file_ids:
+                for chunk_id in self._by_file.get(file_id, ()):
+                    rep = self._rep_of[chunk_id]
+                    covering.setdefault(rep, (self._reps[rep][0], chunk_id))
+            return covering
+
+    def stats(self):
+        with self._lock:
+            self._read()
+            return {
+                'representatives': len(self._reps),
+                'duplicates': len(self._rep_of),
+                'clusters': len(self._members)
+            }
+
+
+_dedup_index = None
+_dedup_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """获取近重复分块索引 (进程内单例). DEDUP_ENABLED 关闭时返回 None."""
+    global _dedup_index
+    if not DEDUP_ENABLED:
+        return None
+    with _dedup_index_lock:
+        if _dedup_index is None:
+            _dedup_index = DedupIndex(DEDUP_DIR)
+        return _dedup_index
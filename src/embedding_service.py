@@ -0,0 +1,492 @@
+"""
+文本向量化 (embedding) 服务模块
+通过可替换的 embedder 把分块文本转换为向量，供向量存储和稠密检索使用.
+EMBEDDING_URL 设置为 "stub" 时使用本地确定性的哈希 embedder，不依赖外部服务.
+
+- 磁盘缓存: 以规范化文本的 SHA-256 为 key 缓存向量 (每个 embedder 一个目录)，
+  重新索引未修改的分块不会再次调用 embedder
+- 批量调用: 来自多个线程的待向量化文本合并为批次. 空闲时立即发送; 有并发请求时批次达到
+  EMBED_BATCH_SIZE 或最早的请求等待超过 EMBED_BATCH_DEADLINE_MS 时发送. 多个线程同时请求
+  同一文本时只向量化一次
+- 指标: 缓存命中率与 embedder 吞吐量，每个进程定期写入 EMBED_CACHE_DIR/metrics/，
+  由 get_embedding_metrics() 汇总 (同时清理本机已退出进程的指标文件)
+
+缓存目录布局 (EMBED_CACHE_DIR/<embedder 名称>/):
+    meta.json     向量维度
+    keys          SHA-256 摘要 (每行 32 字节，只追加)
+    vectors       float32 向量 (只追加，与 keys 行对应)
+    LOCK          fcntl 文件锁
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+from search_index import tokenize
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Embedding 服务配置 (from .env)，接口兼容 OpenAI /v1/embeddings
+EMBEDDING_URL = os.getenv('EMBEDDING_URL', 'stub')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', '')
+EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY', '')
+EMBEDDING_TIMEOUT = int(os.getenv('EMBEDDING_TIMEOUT', 60))
+EMBEDDING_STUB_DIM = int(os.getenv('EMBEDDING_STUB_DIM', 256))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 64))
+EMBED_BATCH_DEADLINE_MS = float(os.getenv('EMBED_BATCH_DEADLINE_MS', 20))
+EMBED_CACHE_DIR = os.getenv('EMBED_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'embedding_cache'))
+EMBED_METRICS_INTERVAL = float(os.getenv('EMBED_METRICS_INTERVAL', 5))
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_DIGEST_SIZE = 32
+
+
+class HttpEmbedder:
+    """调用外部 embedding 服务 (POST {url}，请求体 {'model', 'input'})."""
+
+    def __init__(self, url=None, model=None, api_key=None, timeout=None):
+        self.url = url or EMBEDDING_URL
+        self.model = model if model is not None else EMBEDDING_MODEL
+        self.api_key = api_key if api_key is not None else EMBEDDING_API_KEY
+        self.timeout = timeout or EMBEDDING_TIMEOUT
+        self.name = f'http:{self.model or self.url}'
+
+    def embed(self, texts):
+        """
+        向量化一批文本
+
+        Args:
+            texts (list): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 向量
+
+        Raises:
+            RuntimeError: 服务调用失败或响应无效
+        """
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        try:
+            response = requests.post(
+                self.url,
+                json={'model': self.model, 'input': list(texts)},
+                headers=headers,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = sorted(response.json()['data'], key=lambda item: item.get('index', 0))
+            vectors = np.asarray([item['embedding'] for item in data], dtype=np.float32)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Embedding 服务调用失败: {e}")
+            raise RuntimeError(f'Embedding 服务调用失败: {e}') from e
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Embedding 服务返回了无效的响应: {e}")
+            raise RuntimeError('Embedding 服务返回了无效的响应') from e
+        if len(vectors) != len(texts):
+            raise RuntimeError(f'Embedding 服务返回了 {len(vectors)} 个向量，期望 {len(texts)} 个')
+        return vectors
+
+
+class HashingEmbedder:
+    """
+    本地桩 embedder: 检索词特征哈希 (带符号) 到固定维度，结果确定且与词汇重叠相关.
+    用于测试和离线开发.
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim or EMBEDDING_STUB_DIM
+        self.name = f'stub-hash-{self.dim}'
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return vectors
+
+
+def normalize_text(text):
+    """规范化文本 (NFKC、合并空白、去首尾空白)，作为缓存 key 和实际发送给 embedder 的文本."""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def text_digest(text):
+    """规范化文本的 SHA-256 摘要 (bytes)."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """
+    磁盘向量缓存 (只追加文件 + 内存摘要索引)，可被多个进程同时读写.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, 'meta.json')
+        self._keys_path = os.path.join(path, 'keys')
+        self._vectors_path = os.path.join(path, 'vectors')
+        self._lock_path = os.path.join(path, 'LOCK')
+        self.dim = None
+        self._rows = {}  # 摘要 -> 行号
+        self._row_count = 0
+        self._vectors = None
+
+    def _refresh(self):
+        """载入其他进程追加的缓存行. keys 文件最后写入，其行数决定可见的行数."""
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path) as f:
+                self.dim = json.load(f)['dim']
+        try:
+            rows = os.path.getsize(self._keys_path) // _DIGEST_SIZE
+        except FileNotFoundError:
+            rows = 0
+        if rows == self._row_count:
+            return
+        with open(self._keys_path, 'rb') as f:
+            f.seek(self._row_count * _DIGEST_SIZE)
+            data = f.read((rows - self._row_count) * _DIGEST_SIZE)
+        for offset in range(0, len(data), _DIGEST_SIZE):
+            self._rows[data[offset:offset + _DIGEST_SIZE]] = self._row_count + offset // _DIGEST_SIZE
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        self._row_count = rows
+
+    def _truncate_partial(self):
+        """截掉上次写入中断时残留的向量行与半个摘要，以 keys 的行数为准 (调用方需持有文件锁)."""
+        for path, width in ((self._keys_path, _DIGEST_SIZE), (self._vectors_path, self.dim * 4)):
+            expected = self._row_count * width
+            try:
+                if os.path.getsize(path) > expected:
+                    os.truncate(path, expected)
+            except FileNotFoundError:
+                pass
+
+    def get_many(self, digests):
+        """
+        批量查找缓存
+
+        Args:
+            digests (list): 文本摘要列表
+
+        Returns:
+            list: 与 digests 对应的 float32 向量，未命中为 None
+        """
+        with self._lock:
+            self._refresh()
+            rows, vectors = self._rows, self._vectors
+            return [np.array(vectors[rows[d]]) if d in rows else None for d in digests]
+
+    def put_many(self, digests, vectors):
+        """追加缓存条目 (已存在的摘要跳过)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                # 原子替换: _refresh 不持有文件锁，不能读到写了一半的 meta.json
+                tmp_path = self._meta_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump({'dim': self.dim}, f)
+                os.replace(tmp_path, self._meta_path)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与缓存维度 {self.dim} 不一致")
+            fresh, seen = [], set()
+            for i, digest in enumerate(digests):
+                if digest not in self._rows and digest not in seen:
+                    fresh.append(i)
+                    seen.add(digest)
+            if not fresh:
+                return
+            self._truncate_partial()
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors[fresh].tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.write(b''.join(digests[i] for i in fresh))
+            self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._row_count
+
+
+class EmbeddingMetrics:
+    """缓存命中与 embedder 调用计数 (进程内累计)，定期写入指标目录供其他进程汇总."""
+
+    COUNTERS = ('requested_texts', 'cache_hits', 'cache_misses', 'embedded_texts', 'embed_batches')
+
+    def __init__(self, directory=None):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.embed_seconds = 0.0
+        self.started_at = time.time()
+        self._directory = directory
+        self._last_flush = 0.0
+
+    def record_lookup(self, hits, misses):
+        with self._lock:
+            self.counters['requested_texts'] += hits + misses
+            self.counters['cache_hits'] += hits
+            self.counters['cache_misses'] += misses
+        self._maybe_flush()
+
+    def record_batch(self, size, seconds):
+        with self._lock:
+            self.counters['embedded_texts'] += size
+            self.counters['embed_batches'] += 1
+            self.embed_seconds += seconds
+        self._maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters, embed_seconds=self.embed_seconds, started_at=self.started_at)
+
+    def _maybe_flush(self, force=False):
+        if not self._directory or (not force and time.monotonic() - self._last_flush < EMBED_METRICS_INTERVAL):
+            return
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            path = os.path.join(self._directory, f'{socket.gethostname()}-{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logging.warning(f"写入 embedding 指标失败: {e}")
+
+
+def summarize_metrics(snapshots):
+    """汇总指标快照，计算缓存命中率和 embedder 吞吐量 (条/秒)."""
+    totals = dict.fromkeys(EmbeddingMetrics.COUNTERS, 0)
+    embed_seconds = 0.0
+    for snapshot in snapshots:
+        for name in totals:
+            totals[name] += snapshot.get(name, 0)
+        embed_seconds += snapshot.get('embed_seconds', 0.0)
+    requested = totals['requested_texts']
+    return dict(
+        totals,
+        embed_seconds=round(embed_seconds, 3),
+        cache_hit_rate=round(totals['cache_hits'] / requested, 4) if requested else None,
+        embed_throughput=round(totals['embedded_texts'] / embed_seconds, 2) if embed_seconds else None,
+        avg_batch_size=round(totals['embedded_texts'] / totals['embed_batches'], 2) if totals['embed_batches'] else None,
+        processes=len(snapshots)
+    )
+
+
+class EmbeddingBatcher:
+    """
+    把来自多个线程的待向量化文本合并为批次调用 embedder.
+    没有其他请求排队或正在向量化时立即发送 (单个查询不等待批次窗口); 出现并发时，批次达到
+    batch_size 或最早的待处理文本等待超过 deadline_ms 时发送.
+    """
+
+    def __init__(self, embedder, batch_size=None, deadline_ms=None, metrics=None):
+        self.embedder = embedder
+        self.batch_size = batch_size or EMBED_BATCH_SIZE
+        self.deadline = (EMBED_BATCH_DEADLINE_MS if deadline_ms is None else deadline_ms) / 1000
+        self.metrics = metrics
+        self._pending = []  # [(text, future, 入队时间)]
+        self._embedding = False  # embedder 调用进行中
+        self._contended = False  # 上次发送后有请求在排队或向量化期间到达
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """提交文本，返回与之对应的 Future 列表 (结果为 float32 向量)."""
+        futures = [Future() for _ in texts]
+        now = time.monotonic()
+        with self._condition:
+            if self._pending or self._embedding:
+                self._contended = True
+            self._pending.extend((text, future, now) for text, future in zip(texts, futures))
+            self._condition.notify()
+        return futures
+
+    def embed(self, texts):
+        """向量化文本并等待结果，返回 (len(texts), dim) float32 向量."""
+        return np.stack([future.result() for future in self.submit(texts)])
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if len(self._pending) >= self.batch_size:
+                    break
+                if self._pending:
+                    if not self._contended:
+                        break
+                    remaining = self._pending[0][2] + self.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._contended = bool(self._pending)
+            self._embedding = True
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                vectors = self.embedder.embed([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._condition:
+                    self._embedding = False
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch), time.perf_counter() - started)
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class EmbeddingService:
+    """带磁盘缓存和批量调用的 embedding 服务."""
+
+    def __init__(self, embedder, cache_dir=None, batch_size=None, deadline_ms=None):
+        cache_dir = cache_dir or EMBED_CACHE_DIR
+        self.embedder = embedder
+        self.cache = EmbeddingCache(os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', embedder.name)))
+        self.metrics = EmbeddingMetrics(os.path.join(cache_dir, 'metrics'))
+        self.batcher = EmbeddingBatcher(embedder, batch_size, deadline_ms, self.metrics)
+        self._inflight = {}  # 摘要 -> 正在向量化的 Future，完成时移除
+        self._inflight_lock = threading.Lock()
+
+    def _forget(self, digest, future):
+        with self._inflight_lock:
+            if self._inflight.get(digest) is future:
+                del self._inflight[digest]
+
+    def embed(self, texts):
+        """
+        向量化文本列表 (缓存命中的文本不调用 embedder)
+
+        Args:
+            texts (list): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 向量
+        """
+        normalized = [normalize_text(text) for text in texts]
+        digests = [hashlib.sha256(text.encode('utf-8')).digest() for text in normalized]
+        vectors = self.cache.get_many(digests)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.metrics.record_lookup(len(texts) - len(missing), len(missing))
+        if missing:
+            # 同一批内重复的文本只向量化一次; 其他线程正在向量化的文本等待其结果
+            unique = {}
+            for i in missing:
+                unique.setdefault(digests[i], normalized[i])
+            with self._inflight_lock:
+                shared = {digest: self._inflight[digest] for digest in unique if digest in self._inflight}
+                owned = [digest for digest in unique if digest not in shared]
+                futures = dict(zip(owned, self.batcher.submit([unique[digest] for digest in owned])))
+                self._inflight.update(futures)
+            for digest, future in futures.items():
+                future.add_done_callback(lambda done, digest=digest: self._forget(digest, done))
+            by_digest = {digest: future.result() for digest, future in {**shared, **futures}.items()}
+            if owned:
+                self.cache.put_many(owned, np.stack([by_digest[digest] for digest in owned]))
+            for i in missing:
+                vectors[i] = by_digest[digests[i]]
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedder():
+    """根据 EMBEDDING_URL 返回 embedder 实例."""
+    return HashingEmbedder() if EMBEDDING_URL == 'stub' else HttpEmbedder()
+
+
+def get_embedding_service():
+    """获取 embedding 服务 (进程内单例)."""
+    global _embedding_service
+    with _embedding_service_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService(get_embedder())
+        return _embedding_service
+
+
+def embed_texts(texts):
+    """
+    向量化文本列表
+
+    Args:
+        texts (list): 文本列表
+
+    Returns:
+        np.ndarray: (len(texts), dim) float32 向量
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return get_embedding_service().embed(texts)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_embedding_metrics():
+    """
+    汇总所有进程 (API 与 worker) 的 embedding 指标
+
+    Returns:
+        dict: 累计计数、cache_hit_rate、embed_throughput (条/秒)、avg_batch_size 与缓存条目数
+    """
+    service = get_embedding_service()
+    service.metrics._maybe_flush(force=True)
+    snapshots = []
+    directory = service.metrics._directory
+    hostname = socket.gethostname()
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            host, _, pid = name[:-len('.json')].rpartition('-')
+            if host == hostname and pid.isdigit() and not _process_alive(int(pid)):
+                # 本机已退出进程的指标文件 (进程内累计值随进程结束失效)
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    summary = summarize_metrics(snapshots)
+    summary['embedder'] = service.embedder.name
+    summary['cached_vectors'] = len(service.cache)
+    return summary
@@ -11,8 +11,9 @@ import json
 import time
 import mimetypes
 from datetime import datetime, timedelta
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, redirect, send_file
+from flask import Flask, request, jsonify, redirect, send_file, Response, stream_with_context
 from flask_cors import CORS  # 导入 CORS 支持
 import werkzeug
 import tempfile
@@ -35,7 +36,9 @@ from minio_config import (
     ensure_bucket_exists, # Ensure this uses global client
     upload_file_to_minio,
     get_file_url,
+    get_file_urls,
     delete_file_from_minio,
+    delete_files_from_minio,
     # list_files_in_minio, # This was imported from minio_config but not used in file_api
     # DEFAULT_BUCKET_NAME # No longer needed directly here
     # 以下函数应该从 db_utils 导入，而不是 minio_config
@@ -55,8 +58,47 @@ from db_utils import (
     update_file,
     get_files,
     get_file_by_id,
-    delete_file
+    delete_file,
+    delete_files,
+    get_files_by_ids,
+    iter_file_names,
+    query_files,
+    rebuild_file_facets,
+    get_folder_usage,
+    rebuild_folder_rollups,
+    get_file_lineage,
+    get_file_descendants,
+    restore_files,
+    get_deleted_files,
+    purge_deleted_files,
+    iter_folder_tree_files,
+    iter_export_folders,
+    iter_export_files,
+    get_file_chunks,
+    get_jobs
 )
+from markdown_converter import get_converter
+from job_queue import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    NonRetryableJobError,
+    register_job_handler,
+    enqueue_job,
+    enqueue_batch,
+    get_batch_status,
+    get_job_status
+)
+from search_index import get_document_index
+from name_index import get_name_index, encode_cursor, decode_cursor
+from chunk_indexer import index_file, index_files, remove_file_index
+from retrieval import retrieve, load_chunk_texts
+from embedding_service import get_embedding_metrics
+from query_cache import get_query_cache, invalidate_folders
+from rag_chat import stream_chat
+from storage_reconciler import reconcile_storage
+from folder_archive import stream_folder_zip
+from archive_expander import expand_archive, is_expandable, ArchiveError
 
 # Configure logging (can be done once here)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -91,6 +133,17 @@ ALLOWED_EXTENSIONS = {
     'zip', 'rar', '7z', 'tar', 'gz'
 }
 
+# 批量接口的单次请求上限
+FILE_BATCH_GET_MAX = int(os.getenv('FILE_BATCH_GET_MAX', 500))
+FILE_BATCH_DELETE_MAX = int(os.getenv('FILE_BATCH_DELETE_MAX', 5000))
+
+# 回收站: 软删除的文件保留期 (秒)，超过后由垃圾回收删除 MinIO 对象与记录
+FILE_TRASH_RETENTION = int(os.getenv('FILE_TRASH_RETENTION', 7 * 24 * 3600))
+FILE_GC_BATCH_SIZE = int(os.getenv('FILE_GC_BATCH_SIZE', 1000))
+
+# 目录导出: 每次从数据库读取并编码输出的行数
+CATALOG_EXPORT_BATCH_SIZE = int(os.getenv('CATALOG_EXPORT_BATCH_SIZE', 1000))
+
 def allowed_file(filename):
     """检查文件类型是否允许上传"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -100,6 +153,172 @@ def get_file_type(filename):
     mime_type, _ = mimetypes.guess_type(filename)
     return mime_type or 'application/octet-stream'
 
+def is_markdown_file(file_details):
+    """是否为 Markdown 文件"""
+    return file_details['type'] == 'text/markdown' or file_details['name'].endswith('.md')
+
+def update_search_index(file_id, markdown_content=None):
+    """
+    更新全文索引. markdown_content 为 None 时从索引中删除该文件.
+    索引失败只记录日志，不影响文件操作本身.
+    """
+    try:
+        if markdown_content is None:
+            get_document_index().delete_document(file_id)
+        else:
+            get_document_index().add_document(file_id, markdown_content)
+    except Exception as e:
+        logging.error(f"更新全文索引失败: 文件 {file_id}, {e}")
+
+def delete_chunk_index(file_id, folder_id=None):
+    """删除文件的分块记录及其全文索引和向量索引. 失败只记录日志."""
+    try:
+        remove_file_index(file_id, folder_id)
+    except Exception as e:
+        logging.error(f"删除分块索引失败: 文件 {file_id}, {e}")
+
+def delete_file_records(file_ids):
+    """
+    批量删除文件: 单个事务软删除数据库记录，再清理 Markdown 文件的全文索引和分块索引.
+    不访问 MinIO，对象由 collect_deleted_files 在保留期后批量删除.
+
+    Returns:
+        tuple: (已删除的文件记录列表, 失败列表 [{file_id, reason}])
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    try:
+        deleted, trashed = delete_files(file_ids)
+    except Exception as e:
+        # 事务已回滚: 全部 ID 以真实的错误原因报告失败
+        return [], [{'file_id': file_id, 'reason': f'数据库记录删除失败: {e}'} for file_id in file_ids]
+    deleted_ids, trashed = {row['id'] for row in deleted}, set(trashed)
+    failed = [
+        {'file_id': file_id, 'reason': '文件已在回收站中' if file_id in trashed else '文件不存在'}
+        for file_id in file_ids if file_id not in deleted_ids
+    ]
+
+    for row in deleted:
+        if is_markdown_file(row):
+            update_search_index(row['id'])
+            delete_chunk_index(row['id'], row.get('folder_id'))
+    return deleted, failed
+
+def restore_file_records(file_ids):
+    """
+    恢复回收站中的文件，并为其中的 Markdown 文件提交重建全文索引和分块索引的后台任务
+
+    Returns:
+        tuple: (已恢复的文件记录列表, 失败列表 [{file_id, reason}])
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    restored = restore_files(file_ids)
+    if restored is None:
+        return [], [{'file_id': file_id, 'reason': '数据库记录恢复失败'} for file_id in file_ids]
+    restored_ids = {row['id'] for row in restored}
+    failed = [{'file_id': file_id, 'reason': '文件不在回收站中'} for file_id in file_ids if file_id not in restored_ids]
+
+    for row in restored:
+        if is_markdown_file(row):
+            enqueue_job('reindex_markdown', {'file_id': row['id']}, created_by=row.get('created_by'))
+    return restored, failed
+
+def collect_deleted_files():
+    """
+    回收站垃圾回收: 分批清理删除时间超过 FILE_TRASH_RETENTION 的文件，
+    每批以 multi-object delete 删除 MinIO 对象后再删除数据库记录
+
+    Returns:
+        dict: {'purged': 清理的文件数, 'failed': 对象删除失败 (保留待下次重试) 的文件数}
+    """
+    deleted_before = datetime.now() - timedelta(seconds=FILE_TRASH_RETENTION)
+    purged_total, failed_total = 0, 0
+    while True:
+        result = purge_deleted_files(deleted_before, delete_files_from_minio, limit=FILE_GC_BATCH_SIZE)
+        if result is None:
+            break
+        purged, failed = result
+        purged_total += purged
+        failed_total += failed
+        if purged + failed < FILE_GC_BATCH_SIZE or purged == 0:
+            break
+    return {'purged': purged_total, 'failed': failed_total}
+
+def build_lineage_tree(rows):
+    """将 get_file_lineage 的扁平结果 (按 depth 排序) 组装为嵌套的衍生树."""
+    nodes = {row['id']: dict(row, children=[]) for row in rows}
+    root = None
+    for row in rows:
+        node = nodes[row['id']]
+        parent = nodes.get(row['derived_from_file_id']) if row['depth'] > 0 else None
+        if parent is not None:
+            parent['children'].append(node)
+        elif root is None:
+            root = node
+    return root
+
+def _export_json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def generate_catalog_ndjson(include, folder_id=None, created_by=None):
+    """
+    逐批编码并输出目录导出的 NDJSON 行 (内存占用与目录大小无关)
+    响应期间 (包括客户端读取慢时) 独占一个数据库连接池连接; 客户端断开时连接被直接断开，不读完剩余结果
+    
+    Args:
+        include (list): 导出的记录类型 ('folder'、'file'，按此顺序输出)
+        folder_id (str, optional): 只导出该文件夹子树
+        created_by (str, optional): 只导出该用户的记录
+        
+    Yields:
+        str: 若干行 NDJSON. 每行一条记录 ({"kind": "folder"|"file", ...})，最后一行为
+             {"kind": "end", ...} 汇总; 中途出错时最后一行为 {"kind": "error", ...}
+    """
+    sources = {'folder': iter_export_folders, 'file': iter_export_files}
+    counts = {kind: 0 for kind in include}
+    try:
+        for kind in include:
+            lines = []
+            for row in sources[kind](folder_id=folder_id, created_by=created_by,
+                                     batch_size=CATALOG_EXPORT_BATCH_SIZE):
+                lines.append(json.dumps({'kind': kind, **row}, ensure_ascii=False, default=_export_json_default))
+                if len(lines) >= CATALOG_EXPORT_BATCH_SIZE:
+                    counts[kind] += len(lines)
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                counts[kind] += len(lines)
+                yield '\n'.join(lines) + '\n'
+    except Exception as e:
+        # 响应头已发出，只能以最后一行告知客户端导出不完整
+        logging.error(f"目录导出失败: {e}")
+        yield json.dumps({'kind': 'error', 'message': str(e), 'counts': counts}, ensure_ascii=False) + '\n'
+        return
+    logging.info(f"目录导出完成: {counts}")
+    yield json.dumps({'kind': 'end', 'counts': counts}) + '\n'
+
+def is_async_request():
+    """请求是否要求以后台任务方式执行 (?async=true)"""
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def job_accepted_response(job_id, job_type):
+    """任务已入队的 202 响应"""
+    if not job_id:
+        return jsonify({
+            'code': 500,
+            'message': '后台任务提交失败',
+            'data': None
+        }), 500
+    return jsonify({
+        'code': 0,
+        'message': '任务已提交',
+        'data': {
+            'job_id': job_id,
+            'job_type': job_type,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}'
+        }
+    }), 202
+
 @app.route('/api/folders', methods=['GET'])
 def get_folders_api():
     """获取文件夹列表 API (支持分页和排序)"""
@@ -190,8 +409,20 @@ def create_folder_api():
 
 @app.route('/api/folders/<folder_id>', methods=['DELETE'])
 def delete_folder_api(folder_id):
-    """删除文件夹 API"""
+    """删除文件夹 API (?async=true 时以后台任务执行)"""
     try:
+        if is_async_request():
+            if not get_folder_by_id(folder_id):
+                return jsonify({
+                    'code': 404,
+                    'message': '文件夹不存在',
+                    'data': None
+                }), 404
+            job_id = enqueue_job('delete_folder', {'folder_id': folder_id},
+                                 created_by=request.headers.get("X-User-Id"))
+            return job_accepted_response(job_id, 'delete_folder')
+
+        invalidate_folders([folder_id])
         if delete_folder(folder_id):
             return jsonify({
                 'code': 0,
@@ -225,13 +456,13 @@ def modify_folder(folder_id):
     if not new_name and new_parent_id is None:
         return jsonify({"error": "必须提供新的名称或父文件夹ID"}), 400
 
-    # Ensure parent_id is None if client sends "ROOT" or similar for moving to root
-    if new_parent_id == "ROOT":
-        db_parent_id = None
-    else:
-        db_parent_id = new_parent_id
-
-    if update_folder(folder_id, name=new_name, parent_id=db_parent_id, updated_by=updated_by):
+    # 移动文件夹会改变新旧两条祖先链的子树，移动前后各使检索缓存失效一次
+    if new_parent_id is not None:
+        invalidate_folders([folder_id])
+    # parent_id 为 "ROOT" 时移动到根目录 (update_folder 将其映射为 NULL)
+    if update_folder(folder_id, name=new_name, parent_id=new_parent_id, updated_by=updated_by):
+        if new_parent_id is not None:
+            invalidate_folders([folder_id])
         # Fetch the updated folder details to return
         updated_folder_data = get_folder_by_id(folder_id)
         if updated_folder_data:
@@ -242,6 +473,56 @@ def modify_folder(folder_id):
     else:
         return jsonify({"error": "文件夹更新失败或未找到"}), 404 # Or 500 if it's a server error
 
+@app.route('/api/folders/<folder_id>/usage', methods=['GET'])
+def get_folder_usage_api(folder_id):
+    """获取文件夹 (含子文件夹) 按创建者汇总的文件数与字节数"""
+    if not get_folder_by_id(folder_id):
+        return jsonify({
+            'code': 404,
+            'message': '文件夹不存在',
+            'data': None
+        }), 404
+    usage = get_folder_usage(folder_id)
+    if usage is None:
+        return jsonify({
+            'code': 500,
+            'message': '获取文件夹用量失败',
+            'data': None
+        }), 500
+    return jsonify({
+        'code': 0,
+        'message': '获取成功',
+        'data': {
+            'folder_id': folder_id,
+            'total_file_count': sum(row['total_file_count'] for row in usage),
+            'total_size': sum(row['total_size'] for row in usage),
+            'by_user': usage
+        }
+    })
+
+@app.route('/api/folders/<folder_id>/download', methods=['GET'])
+def download_folder_api(folder_id):
+    """将文件夹 (含子文件夹) 边读边写地打包为 ZIP 流下载"""
+    folder = get_folder_by_id(folder_id)
+    if not folder:
+        return jsonify({
+            'code': 404,
+            'message': '文件夹不存在',
+            'data': None
+        }), 404
+    archive = stream_folder_zip(folder['name'], iter_folder_tree_files(folder_id))
+    return Response(stream_with_context(archive), mimetype='application/zip', headers={
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(folder['name'] + '.zip')}",
+        'X-Accel-Buffering': 'no'  # 关闭 nginx 缓冲，边打包边下载
+    })
+
+@app.route('/api/folders/rollups/rebuild', methods=['POST'])
+def rebuild_folder_rollups_api():
+    """从 files / folders 表重建文件夹汇总 (后台任务)"""
+    job_id = enqueue_job('rebuild_folder_rollups', {}, priority=PRIORITY_LOW,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'rebuild_folder_rollups')
+
 @app.route('/api/files', methods=['GET'])
 def list_files_api():
     """获取文件列表，支持按文件夹ID过滤，分页和排序"""
@@ -300,6 +581,23 @@ def upload_file_api():
         folder_id = request.form.get('folder_id')
         created_by = request.form.get('created_by')
         
+        # 压缩包在服务端展开 (expand=true): 按目录结构创建文件夹并保存其中的文件，不保存压缩包本身
+        if request.form.get('expand', '').lower() in ('1', 'true', 'yes') and is_expandable(file.filename):
+            try:
+                result = expand_archive(file.stream, file.filename, folder_id=folder_id,
+                                        created_by=created_by, allowed_file=allowed_file)
+            except ArchiveError as e:
+                return jsonify({
+                    'code': 400,
+                    'message': f'压缩包展开失败: {str(e)}',
+                    'data': None
+                }), 400
+            return jsonify({
+                'code': 0,
+                'message': f"压缩包展开完成: {result['files']} 个文件成功, {len(result['failed'])} 个失败",
+                'data': result
+            })
+        
         # 安全处理文件名
         filename = secure_filename(file.filename)
         
@@ -423,7 +721,7 @@ def download_file_api(file_id):
 
 @app.route('/api/files/<file_id>', methods=['DELETE'])
 def delete_file_api(file_id):
-    """删除文件 API"""
+    """删除文件 API (?cascade=true 时连同全部衍生文件一起删除)"""
     try:
         # 从数据库获取文件信息
         file_info = get_file_by_id(file_id)
@@ -433,30 +731,48 @@ def delete_file_api(file_id):
                 'message': '文件不存在',
                 'data': None
             }), 404
+
+        if request.args.get('cascade', '').lower() in ('1', 'true', 'yes'):
+            descendants = get_file_descendants(file_id)
+            if descendants is None:
+                return jsonify({
+                    'code': 500,
+                    'message': '查询衍生文件失败',
+                    'data': None
+                }), 500
+            deleted, failed = delete_file_records([row['id'] for row in descendants])
+            data = {
+                'deleted_file_ids': [row['id'] for row in deleted],
+                'failed': failed
+            }
+            if failed:
+                return jsonify({
+                    'code': 500,
+                    'message': f'文件删除部分失败: {len(failed)} 个文件删除失败',
+                    'data': data
+                }), 500
+            return jsonify({
+                'code': 0,
+                'message': f'文件及其 {len(deleted) - 1} 个衍生文件删除成功',
+                'data': data
+            })
         
-        # 从 MinIO 删除文件
-        location = file_info['location']
-        minio_delete_success = delete_file_from_minio(location)
-        
-        # 从数据库删除文件记录
+        # 软删除数据库记录 (移入回收站)，MinIO 对象由垃圾回收在保留期后删除
         db_delete_success = delete_file(file_id)
+        if db_delete_success and is_markdown_file(file_info):
+            update_search_index(file_id)
+            delete_chunk_index(file_id, file_info.get('folder_id'))
         
-        if minio_delete_success and db_delete_success:
+        if db_delete_success:
             return jsonify({
                 'code': 0,
                 'message': '文件删除成功',
                 'data': None
             })
         else:
-            message = []
-            if not minio_delete_success:
-                message.append("MinIO 文件删除失败")
-            if not db_delete_success:
-                message.append("数据库记录删除失败")
-            
             return jsonify({
                 'code': 500,
-                'message': '文件删除部分失败: ' + ', '.join(message),
+                'message': '文件删除失败: 数据库记录删除失败',
                 'data': None
             }), 500
     except Exception as e:
@@ -467,6 +783,241 @@ def delete_file_api(file_id):
             'data': None
         }), 500
 
+@app.route('/api/files/export', methods=['GET'])
+def export_catalog_api():
+    """以 NDJSON 流式导出文件夹与文件记录 (可按子树、创建者过滤)，替代逐文件夹分页遍历"""
+    folder_id = request.args.get('folder_id')
+    created_by = request.args.get('created_by')
+    include = [kind.strip() for kind in request.args.get('include', 'folder,file').split(',') if kind.strip()]
+    if not include or any(kind not in ('folder', 'file') for kind in include):
+        return jsonify({
+            'code': 400,
+            'message': 'include 只能为 folder、file (逗号分隔)',
+            'data': None
+        }), 400
+    if folder_id and not get_folder_by_id(folder_id):
+        return jsonify({
+            'code': 404,
+            'message': '文件夹不存在',
+            'data': None
+        }), 404
+    include = sorted(set(include), key=('folder', 'file').index)
+    return Response(stream_with_context(generate_catalog_ndjson(include, folder_id, created_by)),
+                    mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/api/files/batch-get', methods=['POST'])
+def batch_get_files_api():
+    """按 ID 批量获取文件信息 (单次 IN 查询，统一生成预签名 URL)，结果按请求顺序返回"""
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids or not all(isinstance(i, str) and i for i in file_ids):
+        return jsonify({
+            'code': 400,
+            'message': 'file_ids 必须为非空的文件 ID 列表',
+            'data': None
+        }), 400
+    file_ids = list(dict.fromkeys(file_ids))
+    if len(file_ids) > FILE_BATCH_GET_MAX:
+        return jsonify({
+            'code': 400,
+            'message': f'单次最多获取 {FILE_BATCH_GET_MAX} 个文件',
+            'data': None
+        }), 400
+
+    try:
+        files = get_files_by_ids(file_ids)
+        urls = get_file_urls([f['location'] for f in files.values() if f.get('location')])
+        items, missing = [], []
+        for file_id in file_ids:
+            file_info = files.get(file_id)
+            if not file_info:
+                missing.append(file_id)
+                continue
+            file_info['url'] = urls.get(file_info['location']) if file_info.get('location') else None
+            items.append(file_info)
+        return jsonify({
+            'code': 0,
+            'message': '获取成功',
+            'data': {
+                'items': items,
+                'missing': missing
+            }
+        })
+    except Exception as e:
+        logging.error(f"批量获取文件失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'批量获取文件失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/files/batch-delete', methods=['POST'])
+def batch_delete_files_api():
+    """批量删除文件 (单事务软删除记录，对象由垃圾回收批量删除)，逐个 ID 报告失败原因 (?async=true 时以后台任务执行)"""
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids or not all(isinstance(i, str) and i for i in file_ids):
+        return jsonify({
+            'code': 400,
+            'message': 'file_ids 必须为非空的文件 ID 列表',
+            'data': None
+        }), 400
+    file_ids = list(dict.fromkeys(file_ids))
+    if len(file_ids) > FILE_BATCH_DELETE_MAX:
+        return jsonify({
+            'code': 400,
+            'message': f'单次最多删除 {FILE_BATCH_DELETE_MAX} 个文件',
+            'data': None
+        }), 400
+
+    if is_async_request():
+        job_id = enqueue_job('delete_files', {'file_ids': file_ids},
+                             created_by=request.headers.get("X-User-Id"))
+        return job_accepted_response(job_id, 'delete_files')
+
+    try:
+        deleted, failed = delete_file_records(file_ids)
+        data = {
+            'deleted_file_ids': [row['id'] for row in deleted],
+            'failed': failed
+        }
+        if failed and not deleted:
+            return jsonify({
+                'code': 500,
+                'message': '文件删除失败',
+                'data': data
+            }), 500
+        return jsonify({
+            'code': 0,
+            'message': f'删除成功 {len(deleted)} 个，失败 {len(failed)} 个',
+            'data': data
+        })
+    except Exception as e:
+        logging.error(f"批量删除文件失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'批量删除文件失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/files/trash', methods=['GET'])
+def list_trash_api():
+    """获取回收站中的文件 (保留期内可恢复)"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', 10, type=int), 1), 100)
+    files_data = get_deleted_files(created_by=request.args.get('created_by') or None, page=page, page_size=page_size)
+    for file_item in files_data['items']:
+        file_item['purge_after'] = file_item['deleted_at'] + timedelta(seconds=FILE_TRASH_RETENTION)
+    return jsonify({
+        'code': 0,
+        'message': '获取成功',
+        'data': files_data
+    })
+
+@app.route('/api/files/restore', methods=['POST'])
+def restore_files_api():
+    """从回收站恢复文件，逐个 ID 报告失败原因"""
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids or not all(isinstance(i, str) and i for i in file_ids):
+        return jsonify({
+            'code': 400,
+            'message': 'file_ids 必须为非空的文件 ID 列表',
+            'data': None
+        }), 400
+    if len(file_ids) > FILE_BATCH_DELETE_MAX:
+        return jsonify({
+            'code': 400,
+            'message': f'单次最多恢复 {FILE_BATCH_DELETE_MAX} 个文件',
+            'data': None
+        }), 400
+
+    restored, failed = restore_file_records(file_ids)
+    data = {
+        'restored_file_ids': [row['id'] for row in restored],
+        'failed': failed
+    }
+    if failed and not restored:
+        status = 404 if all(f['reason'] == '文件不在回收站中' for f in failed) else 500
+        return jsonify({
+            'code': status,
+            'message': '文件恢复失败',
+            'data': data
+        }), status
+    return jsonify({
+        'code': 0,
+        'message': f'恢复成功 {len(restored)} 个，失败 {len(failed)} 个',
+        'data': data
+    })
+
+@app.route('/api/files/trash/collect', methods=['POST'])
+def collect_trash_api():
+    """立即执行一次回收站垃圾回收 (后台任务)"""
+    job_id = enqueue_job('collect_deleted_files', {}, priority=PRIORITY_LOW,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'collect_deleted_files')
+
+@app.route('/api/storage/reconcile', methods=['POST'])
+def reconcile_storage_api():
+    """对账 MinIO 与 files 表，报告 (repair=true 时修复) 无主对象与缺失对象 (后台任务)"""
+    data = request.get_json(silent=True) or {}
+    payload = {'repair': bool(data.get('repair', False)), 'prefix': data.get('prefix') or None}
+    job_id = enqueue_job('reconcile_storage', payload, priority=PRIORITY_LOW, max_attempts=1,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'reconcile_storage')
+
+@app.route('/api/files/<file_id>/lineage', methods=['GET'])
+def get_file_lineage_api(file_id):
+    """获取文件所在的完整衍生树 (从原始文件到全部多级衍生文件)"""
+    rows = get_file_lineage(file_id)
+    if rows is None:
+        return jsonify({
+            'code': 500,
+            'message': '获取衍生树失败',
+            'data': None
+        }), 500
+    if not rows:
+        return jsonify({
+            'code': 404,
+            'message': '文件不存在',
+            'data': None
+        }), 404
+    return jsonify({
+        'code': 0,
+        'message': '获取成功',
+        'data': {
+            'file_id': file_id,
+            'total_files': len(rows),
+            'root': build_lineage_tree(rows)
+        }
+    })
+
+@app.route('/api/files/<file_id>/derivatives', methods=['GET'])
+def get_file_derivatives_api(file_id):
+    """获取文件的全部 (多级) 衍生文件列表"""
+    rows = get_file_descendants(file_id)
+    if rows is None:
+        return jsonify({
+            'code': 500,
+            'message': '获取衍生文件失败',
+            'data': None
+        }), 500
+    if not rows:
+        return jsonify({
+            'code': 404,
+            'message': '文件不存在',
+            'data': None
+        }), 404
+    return jsonify({
+        'code': 0,
+        'message': '获取成功',
+        'data': {
+            'file_id': file_id,
+            'items': rows[1:],
+            'total_items': len(rows) - 1
+        }
+    })
+
 @app.route('/api/files/batch', methods=['POST'])
 def batch_upload_files_api():
     """批量上传文件 API"""
@@ -693,6 +1244,8 @@ def rename_or_move_file_api(file_id):
             return jsonify({"error": f"文件系统操作失败: {str(e)}"}), 500
 
     if update_file(file_id, name=final_new_name, new_folder_id=final_new_folder_id, new_location=new_location_minio, updated_by=updated_by):
+        # 文件名、位置或所属文件夹变化后，包含该文件的检索缓存失效
+        invalidate_folders({current_file_info['folder_id'], final_new_folder_id})
         updated_file_info = get_file_by_id(file_id)
         return jsonify({"message": "文件更新成功", "file": updated_file_info}), 200
     else:
@@ -701,9 +1254,97 @@ def rename_or_move_file_api(file_id):
         logging.error(f"文件数据库记录更新失败 file_id: {file_id} after potential MinIO op. New loc: {new_location_minio}")
         return jsonify({"error": "文件数据库记录更新失败"}), 500
 
+def markdown_display_name(name, fallback):
+    """
+    Markdown 衍生文件的显示名称: 保留中文等字符，只替换路径分隔符，并补全 .md 扩展名.
+    MinIO 对象名由 store_markdown_file 另行清理
+
+    Args:
+        name (str): 期望的文件名 (可带或不带 .md)
+        fallback (str): 清理后为空时使用的名称
+
+    Returns:
+        str: 以 .md 结尾的文件名
+    """
+    name = name.replace('/', '_').replace('\\', '_').strip() or fallback
+    return name if name.lower().endswith('.md') else f"{name}.md"
+
+def store_markdown_file(original_file_details, markdown_content, markdown_filename, created_by=None):
+    """
+    将 Markdown 内容上传到 MinIO 并插入衍生文件记录
+
+    Args:
+        original_file_details (dict): 原始文件记录 (get_file_by_id 的返回值)
+        markdown_content (str): Markdown 文本
+        markdown_filename (str): Markdown 文件名 (作为显示名称保存; MinIO 对象名另行清理)
+        created_by (str, optional): 创建者 ID
+
+    Returns:
+        tuple: (保存后的文件记录 dict, None) 或失败时 (None, 错误信息)
+    """
+    original_file_id = original_file_details['id']
+    original_folder_id = original_file_details.get('folder_id')
+
+    # 1. 为 Markdown 文件生成新 ID 和 MinIO 位置 (secure_filename 会去掉中文，只用于对象名)
+    new_file_id = generate_uuid()
+    stem = markdown_filename[:-3] if markdown_filename.lower().endswith('.md') else markdown_filename
+    minio_object_name = f"markdowns/{new_file_id}/{secure_filename(stem) or new_file_id}.md"
+
+    # 2. 上传 Markdown 内容到 MinIO
+    content_bytes = markdown_content.encode('utf-8')
+    content_stream = io.BytesIO(content_bytes)
+    content_length = len(content_bytes)
+
+    try:
+        upload_success = upload_file_to_minio(
+            file_data=content_stream,
+            object_name=minio_object_name,
+            target_bucket_name=bucket_name,
+            content_type='text/markdown',
+            file_size=content_length
+        )
+        if not upload_success:
+            return None, '上传 Markdown 到 MinIO 失败'
+        logging.info(f"Markdown 文件 {markdown_filename} (ID: {new_file_id}) 已上传到 MinIO: {minio_object_name}")
+    except Exception as e:
+        logging.error(f"上传 Markdown 到 MinIO 失败: {e}")
+        return None, f'上传 Markdown 到 MinIO 失败: {str(e)}'
+
+    # 3. 在数据库中插入新文件记录
+    file_data_to_insert = {
+        'id': new_file_id,
+        'name': markdown_filename,
+        'location': minio_object_name, 
+        'size': content_length,
+        'file_type': 'text/markdown',
+        'folder_id': original_folder_id, 
+        'created_by': created_by,
+        'derived_from_file_id': original_file_id
+    }
+    
+    inserted_file_id = insert_file(**file_data_to_insert)
+    if not inserted_file_id: 
+        try:
+            delete_file_from_minio(minio_object_name)
+            logging.info(f"数据库插入失败后，已从 MinIO 清理对象: {minio_object_name}")
+        except Exception as minio_del_err:
+            logging.error(f"数据库插入失败后，从 MinIO 清理对象 {minio_object_name} 失败: {minio_del_err}")
+        return None, '保存 Markdown 文件记录到数据库失败'
+
+    update_search_index(new_file_id, markdown_content)
+    enqueue_job('chunk_markdown', {'file_id': new_file_id}, created_by=created_by)
+
+    saved_file_details = get_file_by_id(new_file_id)
+    if not saved_file_details:
+        logging.error(f"成功插入数据库但无法立即获取文件 {new_file_id} 的详细信息。")
+        saved_file_details = file_data_to_insert 
+        saved_file_details['upload_date'] = datetime.utcnow().isoformat() 
+
+    return saved_file_details, None
+
 @app.route('/api/save-markdown', methods=['POST'])
 def save_markdown_api():
-    """保存 Markdown 内容为新文件，并关联到原始文件"""
+    """保存 Markdown 内容为新文件，并关联到原始文件 (?async=true 时以后台任务执行)"""
     try:
         data = request.get_json()
         if not data or not all(k in data for k in ['original_file_id', 'markdown_content', 'markdown_filename']):
@@ -715,10 +1356,7 @@ def save_markdown_api():
 
         original_file_id = data['original_file_id']
         markdown_content = data['markdown_content']
-        markdown_filename = secure_filename(data['markdown_filename']) # Sanitize filename
-
-        if not markdown_filename.lower().endswith('.md'):
-            markdown_filename += '.md'
+        markdown_filename = markdown_display_name(str(data['markdown_filename']), original_file_id)
 
         # 1. 获取原始文件信息
         original_file_details = get_file_by_id(original_file_id)
@@ -729,67 +1367,27 @@ def save_markdown_api():
                 'data': None
             }), 404
 
-        original_folder_id = original_file_details.get('folder_id')
         created_by_user = original_file_details.get('created_by') or request.headers.get("X-User-Id", "anonymous")
 
-        # 2. 为 Markdown 文件生成新 ID 和 MinIO 位置
-        new_file_id = generate_uuid()
-        minio_object_name = f"markdowns/{new_file_id}/{markdown_filename}"
-
-        # 3. 上传 Markdown 内容到 MinIO
-        content_bytes = markdown_content.encode('utf-8')
-        content_stream = io.BytesIO(content_bytes)
-        content_length = len(content_bytes)
-
-        try:
-            upload_file_to_minio(
-                file_data=content_stream,
-                object_name=minio_object_name,
-                target_bucket_name=bucket_name,
-                content_type='text/markdown',
-                file_size=content_length
-            )
-            logging.info(f"Markdown 文件 {markdown_filename} (ID: {new_file_id}) 已上传到 MinIO: {minio_object_name}")
-        except Exception as e:
-            logging.error(f"上传 Markdown 到 MinIO 失败: {e}")
-            return jsonify({
-                'code': 500,
-                'message': f'上传 Markdown 到 MinIO 失败: {str(e)}',
-                'data': None
-            }), 500
-
-        # 4. 在数据库中插入新文件记录
-        file_data_to_insert = {
-            'id': new_file_id,
-            'name': markdown_filename,
-            'location': minio_object_name, 
-            'size': content_length,
-            'file_type': 'text/markdown',
-            'folder_id': original_folder_id, 
-            'created_by': created_by_user,
-            'derived_from_file_id': original_file_id
-        }
-        
-        inserted_file_id = insert_file(**file_data_to_insert)
-        if not inserted_file_id: 
-            try:
-                delete_file_from_minio(minio_object_name)
-                logging.info(f"数据库插入失败后，已从 MinIO 清理对象: {minio_object_name}")
-            except Exception as minio_del_err:
-                logging.error(f"数据库插入失败后，从 MinIO 清理对象 {minio_object_name} 失败: {minio_del_err}")
-            
+        if is_async_request():
+            job_id = enqueue_job('save_markdown', {
+                'original_file_id': original_file_id,
+                'markdown_content': markdown_content,
+                'markdown_filename': markdown_filename,
+                'created_by': created_by_user
+            }, priority=PRIORITY_HIGH, created_by=created_by_user)
+            return job_accepted_response(job_id, 'save_markdown')
+
+        saved_file_details, error_message = store_markdown_file(
+            original_file_details, markdown_content, markdown_filename, created_by_user
+        )
+        if not saved_file_details:
             return jsonify({
                 'code': 500,
-                'message': '保存 Markdown 文件记录到数据库失败',
+                'message': error_message,
                 'data': None
             }), 500
 
-        saved_file_details = get_file_by_id(new_file_id)
-        if not saved_file_details:
-            logging.error(f"成功插入数据库但无法立即获取文件 {new_file_id} 的详细信息。")
-            saved_file_details = file_data_to_insert 
-            saved_file_details['upload_date'] = datetime.utcnow().isoformat() 
-
         return jsonify({
             'code': 0,
             'message': 'Markdown 文件保存成功',
@@ -804,6 +1402,168 @@ def save_markdown_api():
             'data': None
         }), 500
 
+def convert_file_to_markdown(file_id, created_by=None):
+    """
+    在服务端将文件转换为 Markdown 并保存为衍生文件.
+    文件内容从 MinIO 流式转发到转换服务，不经过浏览器.
+
+    Args:
+        file_id (str): 原始文件 ID
+        created_by (str, optional): 创建者 ID，默认沿用原始文件的创建者
+
+    Returns:
+        dict: {'success': bool, 'code': int, 'message': str, 'data': 保存后的文件记录或 None}
+    """
+    file_details = get_file_by_id(file_id)
+    if not file_details:
+        return {'success': False, 'code': 404, 'message': f'文件ID {file_id} 未找到', 'data': None}
+
+    response = None
+    try:
+        response = minio_client.get_object(bucket_name, file_details['location'])
+        result = get_converter().convert(
+            response,
+            file_details['name'],
+            file_details['type'],
+            file_details['size']
+        )
+    except Exception as e:
+        logging.error(f"从 MinIO 读取文件 {file_id} 进行转换失败: {e}")
+        return {'success': False, 'code': 500, 'message': f'读取文件失败: {str(e)}', 'data': None}
+    finally:
+        if response is not None:
+            response.close()
+            response.release_conn()
+
+    if not result.get('success') or not result.get('markdown_content'):
+        return {'success': False, 'code': 502, 'message': result.get('message') or 'Markdown转换失败', 'data': None}
+
+    original_name = file_details['name']
+    base_name = original_name.rsplit('.', 1)[0] if '.' in original_name else original_name
+    markdown_filename = markdown_display_name(base_name, file_id)
+
+    saved_file_details, error_message = store_markdown_file(
+        file_details,
+        result['markdown_content'],
+        markdown_filename,
+        created_by or file_details.get('created_by')
+    )
+    if not saved_file_details:
+        return {'success': False, 'code': 500, 'message': error_message, 'data': None}
+    return {'success': True, 'code': 0, 'message': 'Markdown 文件转换并保存成功', 'data': saved_file_details}
+
+@app.route('/api/files/<file_id>/convert', methods=['POST'])
+def convert_file_api(file_id):
+    """服务端转换单个文件为 Markdown 并保存 (?async=true 时以后台任务执行)"""
+    try:
+        created_by = request.headers.get("X-User-Id")
+        if is_async_request():
+            if not get_file_by_id(file_id):
+                return jsonify({
+                    'code': 404,
+                    'message': f'文件ID {file_id} 未找到',
+                    'data': None
+                }), 404
+            job_id = enqueue_job('convert_markdown', {'file_id': file_id, 'created_by': created_by},
+                                 priority=PRIORITY_NORMAL, created_by=created_by)
+            return job_accepted_response(job_id, 'convert_markdown')
+
+        result = convert_file_to_markdown(file_id, created_by=created_by)
+        return jsonify({
+            'code': result['code'],
+            'message': result['message'],
+            'data': result['data']
+        }), 201 if result['success'] else result['code']
+    except Exception as e:
+        logging.exception(f"转换文件 API 出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'服务器内部错误: {str(e)}',
+            'data': None
+        }), 500
+
+def conversion_batch_response(status):
+    """把批次任务进度整理为批量转换进度 (每个文件一条结果)"""
+    results = []
+    for job in status.pop('jobs'):
+        if job['status'] not in ('succeeded', 'failed'):
+            continue
+        succeeded = job['status'] == 'succeeded'
+        results.append({
+            'file_id': job['payload'].get('file_id') if isinstance(job['payload'], dict) else None,
+            'job_id': job['id'],
+            'success': succeeded,
+            'message': 'Markdown 文件转换并保存成功' if succeeded else job['last_error'],
+            'data': job['result'] if succeeded else None
+        })
+    status['results'] = results
+    return status
+
+@app.route('/api/files/convert/batch', methods=['POST'])
+def batch_convert_files_api():
+    """服务端批量转换文件为 Markdown (每个文件一个后台任务，由 job_worker 执行，通过进度接口查询)"""
+    try:
+        data = request.get_json()
+        file_ids = data.get('file_ids') if data else None
+        if not file_ids or not isinstance(file_ids, list):
+            return jsonify({
+                'code': 400,
+                'message': '缺少必要参数: file_ids',
+                'data': None
+            }), 400
+
+        file_ids = list(dict.fromkeys(file_ids))
+        created_by = request.headers.get("X-User-Id")
+        batch_id = enqueue_batch(
+            'convert_markdown',
+            [{'file_id': file_id, 'created_by': created_by} for file_id in file_ids],
+            priority=PRIORITY_NORMAL,
+            created_by=created_by
+        )
+        if not batch_id:
+            return jsonify({
+                'code': 500,
+                'message': '批量转换任务提交失败',
+                'data': None
+            }), 500
+        logging.info(f"批量转换任务已提交: {batch_id}, 文件数: {len(file_ids)}")
+        return jsonify({
+            'code': 0,
+            'message': f'批量转换任务已提交: {len(file_ids)} 个文件',
+            'data': conversion_batch_response(get_batch_status(batch_id))
+        }), 202
+    except Exception as e:
+        logging.exception(f"批量转换 API 出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'服务器内部错误: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/files/convert/batch/<batch_id>', methods=['GET'])
+def get_convert_batch_api(batch_id):
+    """查询批量转换任务进度"""
+    try:
+        status = get_batch_status(batch_id)
+    except Exception as e:
+        logging.exception(f"查询批量转换进度出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'服务器内部错误: {str(e)}',
+            'data': None
+        }), 500
+    if not status:
+        return jsonify({
+            'code': 404,
+            'message': f'批量任务 {batch_id} 不存在',
+            'data': None
+        }), 404
+    return jsonify({
+        'code': 0,
+        'message': '获取批量转换进度成功',
+        'data': conversion_batch_response(status)
+    })
+
 @app.route('/generate_api_key', methods=['POST'])
 def generate_api_key():
     print("==== /generate_api_key 被调用 ====")
@@ -963,7 +1723,7 @@ def update_file_content_api(file_id):
             }), 404
 
         # 2. 检查是否为可编辑的文件类型
-        if file_details['type'] != 'text/markdown' and not file_details['name'].endswith('.md'):
+        if not is_markdown_file(file_details):
             return jsonify({
                 'code': 400,
                 'message': '只支持编辑Markdown文件',
@@ -988,6 +1748,10 @@ def update_file_content_api(file_id):
 
             # 4. 更新数据库中的文件大小
             update_file(file_id, new_location=None, updated_by=None)  # 这里可以扩展update_file函数来支持更新文件大小
+            update_search_index(file_id, new_content)
+            # 增量重建分块索引: 只有内容变化的分块会重新向量化和索引
+            enqueue_job('chunk_markdown', {'file_id': file_id}, priority=PRIORITY_HIGH,
+                        created_by=request.headers.get("X-User-Id"))
             
             logging.info(f"文件内容更新成功: {file_id}")
             
@@ -1017,6 +1781,456 @@ def update_file_content_api(file_id):
             'data': None
         }), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_documents_api():
+    """全文检索已保存的 Markdown 文档 (BM25)"""
+    query = request.args.get('q', '').strip()
+    top_k = min(max(request.args.get('top_k', 10, type=int), 1), 100)
+    if not query:
+        return jsonify({
+            'code': 400,
+            'message': '缺少必要参数: q',
+            'data': None
+        }), 400
+
+    try:
+        started = time.perf_counter()
+        hits = get_document_index().search(query, top_k=top_k)
+        search_ms = (time.perf_counter() - started) * 1000
+
+        results = []
+        for file_id, score in hits:
+            file_info = get_file_by_id(file_id)
+            if not file_info: # 索引中残留的已删除文件
+                continue
+            file_info['score'] = score
+            file_info['url'] = get_file_url(file_info['location']) if file_info.get('location') else None
+            results.append(file_info)
+
+        return jsonify({
+            'code': 0,
+            'message': '检索成功',
+            'data': {
+                'query': query,
+                'items': results,
+                'took_ms': round(search_ms, 2)
+            }
+        })
+    except Exception as e:
+        logging.exception(f"全文检索出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'检索失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/files/search', methods=['GET'])
+def search_file_names_api():
+    """按文件名子串检索全部文件 (n-gram 索引)，排序后以游标分页"""
+    query = request.args.get('q', '').strip()
+    page_size = min(max(request.args.get('page_size', 20, type=int), 1), 100)
+    cursor = request.args.get('cursor')
+    if not query:
+        return jsonify({
+            'code': 400,
+            'message': '缺少必要参数: q',
+            'data': None
+        }), 400
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({
+            'code': 400,
+            'message': f'无效的游标: {cursor}',
+            'data': None
+        }), 400
+
+    try:
+        started = time.perf_counter()
+        hits, total, next_key = get_name_index().search(query, limit=page_size, after=after)
+        search_ms = (time.perf_counter() - started) * 1000
+
+        files = get_files_by_ids([file_id for file_id, _, _ in hits])
+        results = []
+        for file_id, tier, _ in hits:
+            file_info = files.get(file_id)
+            if not file_info: # 索引中残留的已删除文件
+                continue
+            file_info['match'] = ('exact', 'prefix', 'contains')[tier]
+            file_info['url'] = get_file_url(file_info['location']) if file_info.get('location') else None
+            results.append(file_info)
+
+        return jsonify({
+            'code': 0,
+            'message': '检索成功',
+            'data': {
+                'query': query,
+                'items': results,
+                'total_items': total,
+                'next_cursor': encode_cursor(next_key) if next_key else None,
+                'took_ms': round(search_ms, 2)
+            }
+        })
+    except Exception as e:
+        logging.exception(f"文件名检索出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'检索失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/files/search/rebuild', methods=['POST'])
+def rebuild_name_index_api():
+    """从 files 表重建文件名索引 (后台任务)"""
+    job_id = enqueue_job('rebuild_name_index', {}, priority=PRIORITY_LOW,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'rebuild_name_index')
+
+@app.route('/api/files/query', methods=['GET'])
+def query_files_api():
+    """按类型、大小、上传时间、创建者、是否衍生过滤文件，分页排序，并返回按类型和按月的分面计数"""
+    folder_id = request.args.get('folder_id')
+    if folder_id in ('', 'null', 'undefined'):
+        folder_id = None
+    types = [t.strip() for value in request.args.getlist('type') for t in value.split(',') if t.strip()]
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', 20, type=int), 1), 100)
+    sort_by = request.args.get('sort_by', 'name')
+    sort_order = request.args.get('sort_order', 'ASC')
+    created_by = request.args.get('created_by') or None
+
+    try:
+        min_size = request.args.get('min_size', type=int)
+        max_size = request.args.get('max_size', type=int)
+        for name in ('min_size', 'max_size'):
+            if request.args.get(name) and request.args.get(name, type=int) is None:
+                raise ValueError(f'{name} 必须为整数')
+        # 日期支持 YYYY-MM-DD 或 ISO 8601 时间; uploaded_after 含，uploaded_before 不含
+        uploaded_after = request.args.get('uploaded_after')
+        uploaded_after = datetime.fromisoformat(uploaded_after) if uploaded_after else None
+        uploaded_before = request.args.get('uploaded_before')
+        uploaded_before = datetime.fromisoformat(uploaded_before) if uploaded_before else None
+        derived = request.args.get('derived')
+        if derived is not None:
+            if derived.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError('derived 必须为 true 或 false')
+            derived = derived.lower() in ('true', '1')
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': f'无效的过滤参数: {e}',
+            'data': None
+        }), 400
+
+    files_data = query_files(
+        folder_id=folder_id, types=types or None, min_size=min_size, max_size=max_size,
+        uploaded_after=uploaded_after, uploaded_before=uploaded_before, created_by=created_by, derived=derived,
+        page=page, page_size=page_size, sort_by=sort_by, sort_order=sort_order
+    )
+    if files_data is None:
+        return jsonify({
+            'code': 500,
+            'message': '查询文件失败',
+            'data': None
+        }), 500
+
+    for file_item in files_data['items']:
+        file_item['url'] = get_file_url(file_item['location']) if file_item.get('location') else None
+
+    return jsonify({
+        'code': 0,
+        'message': '查询成功',
+        'data': files_data
+    })
+
+@app.route('/api/files/facets/rebuild', methods=['POST'])
+def rebuild_file_facets_api():
+    """从 files 表重建分面统计 (后台任务)"""
+    job_id = enqueue_job('rebuild_file_facets', {}, priority=PRIORITY_LOW,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'rebuild_file_facets')
+
+@app.route('/api/retrieve', methods=['POST'])
+def retrieve_api():
+    """混合检索 Markdown 分块 (BM25 + 稠密向量，RRF 融合)"""
+    data = request.get_json(silent=True) or {}
+    query = (data.get('query') or '').strip()
+    if not query:
+        return jsonify({
+            'code': 400,
+            'message': '缺少必要参数: query',
+            'data': None
+        }), 400
+    file_ids = data.get('file_ids')
+    if file_ids is not None and not isinstance(file_ids, list):
+        return jsonify({
+            'code': 400,
+            'message': 'file_ids 必须是列表',
+            'data': None
+        }), 400
+    try:
+        top_k = min(max(int(data.get('top_k', 10)), 1), 100)
+    except (TypeError, ValueError):
+        return jsonify({
+            'code': 400,
+            'message': 'top_k 必须是整数',
+            'data': None
+        }), 400
+
+    try:
+        result = retrieve(
+            query,
+            top_k=top_k,
+            folder_id=data.get('folder_id'),
+            file_ids=file_ids,
+            created_by=request.headers.get("X-User-Id")
+        )
+        items = result['items']
+        if data.get('include_text'):
+            load_chunk_texts(items)
+        for item in items:
+            item['url'] = get_file_url(item.pop('location'))
+        return jsonify({
+            'code': 0,
+            'message': '检索成功',
+            'data': {
+                'query': query,
+                'items': items,
+                'cache': result['cache'],
+                'timings': result['timings']
+            }
+        })
+    except Exception as e:
+        logging.exception(f"混合检索出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'检索失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/retrieve/cache', methods=['GET'])
+def retrieve_cache_stats_api():
+    """获取当前 API 进程的检索结果缓存统计"""
+    return jsonify({
+        'code': 0,
+        'message': '获取缓存统计成功',
+        'data': get_query_cache().stats()
+    })
+
+@app.route('/api/embeddings/metrics', methods=['GET'])
+def embedding_metrics_api():
+    """获取 embedding 缓存命中率与吞吐量指标 (汇总 API 与 worker 进程)"""
+    try:
+        return jsonify({
+            'code': 0,
+            'message': '获取指标成功',
+            'data': get_embedding_metrics()
+        })
+    except Exception as e:
+        logging.exception(f"获取 embedding 指标出错: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取指标失败: {str(e)}',
+            'data': None
+        }), 500
+
+@app.route('/api/chat', methods=['POST'])
+def chat_api():
+    """基于已保存 Markdown 的检索增强问答，以 SSE 流式返回回答"""
+    data = request.get_json(silent=True) or {}
+    query = (data.get('query') or '').strip()
+    if not query:
+        return jsonify({
+            'code': 400,
+            'message': '缺少必要参数: query',
+            'data': None
+        }), 400
+    file_ids = data.get('file_ids')
+    history = data.get('history')
+    if (file_ids is not None and not isinstance(file_ids, list)) or (history is not None and not isinstance(history, list)):
+        return jsonify({
+            'code': 400,
+            'message': 'file_ids 与 history 必须是列表',
+            'data': None
+        }), 400
+    try:
+        top_k = min(max(int(data['top_k']), 1), 50) if data.get('top_k') is not None else None
+        max_context_tokens = max(int(data['max_context_tokens']), 1) if data.get('max_context_tokens') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'code': 400,
+            'message': 'top_k 与 max_context_tokens 必须是整数',
+            'data': None
+        }), 400
+
+    events = stream_chat(
+        query,
+        folder_id=data.get('folder_id'),
+        file_ids=file_ids,
+        created_by=request.headers.get("X-User-Id"),
+        history=[message for message in (history or []) if isinstance(message, dict)],
+        top_k=top_k,
+        max_context_tokens=max_context_tokens
+    )
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 关闭 nginx 缓冲，逐条推送
+    })
+
+@app.route('/api/files/<file_id>/chunks', methods=['GET'])
+def get_file_chunks_api(file_id):
+    """获取 Markdown 文件的分块记录"""
+    file_details = get_file_by_id(file_id)
+    if not file_details:
+        return jsonify({
+            'code': 404,
+            'message': f'文件ID {file_id} 未找到',
+            'data': None
+        }), 404
+    return jsonify({
+        'code': 0,
+        'message': '获取分块成功',
+        'data': {
+            'file_id': file_id,
+            'items': get_file_chunks(file_id)
+        }
+    })
+
+@app.route('/api/chunks/rebuild', methods=['POST'])
+def rebuild_chunks_api():
+    """重新分块一批 Markdown 文件 (后台任务，进程池并行)"""
+    data = request.get_json()
+    file_ids = data.get('file_ids') if data else None
+    if not file_ids or not isinstance(file_ids, list):
+        return jsonify({
+            'code': 400,
+            'message': '缺少必要参数: file_ids',
+            'data': None
+        }), 400
+    job_id = enqueue_job('rechunk_files', {'file_ids': file_ids}, priority=PRIORITY_LOW,
+                         created_by=request.headers.get("X-User-Id"))
+    return job_accepted_response(job_id, 'rechunk_files')
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_api(job_id):
+    """查询后台任务状态"""
+    job = get_job_status(job_id)
+    if not job:
+        return jsonify({
+            'code': 404,
+            'message': f'任务 {job_id} 不存在',
+            'data': None
+        }), 404
+    job.pop('payload', None) # payload 可能包含完整文档内容，不返回给客户端
+    return jsonify({
+        'code': 0,
+        'message': '获取任务状态成功',
+        'data': job
+    })
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs_api():
+    """获取后台任务列表，支持按状态和类型过滤"""
+    status = request.args.get('status')
+    job_type = request.args.get('job_type')
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', 10, type=int)
+    return jsonify(get_jobs(status=status, job_type=job_type, page=page, page_size=page_size))
+
+# 后台任务处理函数 (由 job_worker 进程执行)
+@register_job_handler('convert_markdown')
+def convert_markdown_job(payload):
+    result = convert_file_to_markdown(payload['file_id'], created_by=payload.get('created_by'))
+    if result['code'] == 404:
+        raise NonRetryableJobError(result['message'])
+    if not result['success']:
+        raise RuntimeError(result['message'])
+    return {'file_id': result['data']['id'], 'name': result['data']['name']}
+
+@register_job_handler('save_markdown')
+def save_markdown_job(payload):
+    original_file_details = get_file_by_id(payload['original_file_id'])
+    if not original_file_details:
+        raise NonRetryableJobError(f"原始文件ID {payload['original_file_id']} 未找到")
+    saved_file_details, error_message = store_markdown_file(
+        original_file_details,
+        payload['markdown_content'],
+        payload['markdown_filename'],
+        payload.get('created_by')
+    )
+    if not saved_file_details:
+        raise RuntimeError(error_message)
+    return {'file_id': saved_file_details['id'], 'name': saved_file_details['name']}
+
+@register_job_handler('delete_folder')
+def delete_folder_job(payload):
+    invalidate_folders([payload['folder_id']])
+    if not delete_folder(payload['folder_id']):
+        raise NonRetryableJobError(f"文件夹 {payload['folder_id']} 不存在或删除失败")
+    return {'folder_id': payload['folder_id']}
+
+@register_job_handler('delete_files')
+def delete_files_job(payload):
+    deleted, failed = delete_file_records(payload['file_ids'])
+    return {'deleted_file_ids': [row['id'] for row in deleted], 'failed': failed}
+
+@register_job_handler('collect_deleted_files')
+def collect_deleted_files_job(payload):
+    return collect_deleted_files()
+
+@register_job_handler('reconcile_storage')
+def reconcile_storage_job(payload):
+    return reconcile_storage(repair=payload.get('repair', False), prefix=payload.get('prefix'),
+                             delete_file_records=delete_file_records)
+
+@register_job_handler('reindex_markdown')
+def reindex_markdown_job(payload):
+    file_details = get_file_by_id(payload['file_id'])
+    if not file_details:
+        raise NonRetryableJobError(f"文件 {payload['file_id']} 不存在")
+    import minio_config  # 模块顶部导入的 minio_client 是初始化前的 None
+    response = minio_config.minio_client.get_object(minio_config.bucket_name, file_details['location'])
+    try:
+        markdown_content = response.read().decode('utf-8')
+    finally:
+        response.close()
+        response.release_conn()
+    update_search_index(payload['file_id'], markdown_content)
+    return chunk_markdown_job(payload)
+
+@register_job_handler('chunk_markdown')
+def chunk_markdown_job(payload):
+    result = index_file(payload['file_id'])
+    if not result['success']:
+        if not get_file_by_id(payload['file_id']):
+            raise NonRetryableJobError(result['message'])
+        raise RuntimeError(result['message'])
+    return result
+
+@register_job_handler('rechunk_files')
+def rechunk_files_job(payload):
+    results = index_files(payload['file_ids'])
+    failed = [r for r in results if not r['success']]
+    return {'total': len(results), 'failed': failed}
+
+@register_job_handler('rebuild_name_index')
+def rebuild_name_index_job(payload):
+    return {'files': get_name_index().rebuild(iter_file_names())}
+
+@register_job_handler('rebuild_file_facets')
+def rebuild_file_facets_job(payload):
+    rows = rebuild_file_facets()
+    if rows is None:
+        raise RuntimeError('重建文件分面统计失败')
+    return {'rows': rows}
+
+@register_job_handler('rebuild_folder_rollups')
+def rebuild_folder_rollups_job(payload):
+    rows = rebuild_folder_rollups()
+    if rows is None:
+        raise RuntimeError('重建文件夹汇总失败')
+    return {'rows': rows}
+
 # Main execution point
 if __name__ == '__main__':
     # Load Flask run configurations from .env
@@ -0,0 +1,23 @@
+"""
+跨进程文件锁模块
+各嵌入式索引 (全文、名称、向量、ANN、分块、去重、嵌入缓存) 共用的 fcntl 文件锁，协调多进程 (API / worker) 对同一索引目录的读写.
+"""
+import fcntl
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """
+    持有 path 上的 fcntl 锁直到 with 块结束 (锁文件不存在时创建)
+
+    Args:
+        path (str): 锁文件路径
+        exclusive (bool): True 为排他锁 (写入)，False 为共享锁 (读取)
+    """
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
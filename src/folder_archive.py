@@ -0,0 +1,182 @@
+"""
+文件夹 ZIP 打包模块
+边读边写地把文件夹子树打包为 ZIP 流: 文件列表来自流式数据库查询，每个 MinIO 对象按块读入
+zipfile 并立即输出，不在内存中缓冲整个对象或整个压缩包. 写当前对象时，后续 ZIP_PREFETCH_OBJECTS
+个对象已在线程池中并发打开并预读开头 ZIP_PREFETCH_BYTES 字节，用以掩盖 MinIO 的请求延迟.
+内存占用约为 ZIP_PREFETCH_OBJECTS * ZIP_PREFETCH_BYTES + ZIP_CHUNK_SIZE，与文件夹大小无关.
+"""
+import logging
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import minio_config
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ZIP_PREFETCH_OBJECTS = int(os.getenv('ZIP_PREFETCH_OBJECTS', 4))
+ZIP_PREFETCH_BYTES = int(os.getenv('ZIP_PREFETCH_BYTES', 1024 * 1024))
+ZIP_CHUNK_SIZE = int(os.getenv('ZIP_CHUNK_SIZE', 256 * 1024))
+
+# 文本类文件压缩存储，其余 (PDF、Office、图片等本身已压缩) 直接存储以节省 CPU
+_DEFLATE_EXTENSIONS = {'md', 'txt', 'csv', 'json', 'xml', 'html', 'htm'}
+ERRORS_ENTRY_NAME = '_下载失败的文件.txt'
+
+
+class _StreamBuffer:
+    """zipfile 的输出目标: 只追加、可 tell、不可 seek (zipfile 因此改用数据描述符，无需回写文件头)."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """取出已写入的数据 (以单元素生成器返回，无数据时不产出空块)."""
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def _safe_name(name):
+    """去掉路径分隔符、'.' 与 '..'，避免解压时越出目标目录."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '_'.join(parts) or '_'
+
+
+def _unique_name(name, used):
+    if name not in used:
+        return name
+    stem, ext = os.path.splitext(name)
+    index = 2
+    while f"{stem} ({index}){ext}" in used:
+        index += 1
+    return f"{stem} ({index}){ext}"
+
+
+def _open_object(location):
+    """打开对象并预读开头部分. 小对象直接读完并关闭连接."""
+    response = minio_config.minio_client.get_object(minio_config.bucket_name, location)
+    try:
+        head = response.read(ZIP_PREFETCH_BYTES)
+    except Exception:
+        response.close()
+        response.release_conn()
+        raise
+    if len(head) < ZIP_PREFETCH_BYTES:
+        response.close()
+        response.release_conn()
+        return head, None
+    return head, response
+
+
+def _close_prefetched(future):
+    """丢弃已预读但不再需要的对象，归还 HTTP 连接."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    _, response = future.result()
+    if response is not None:
+        response.close()
+        response.release_conn()
+
+
+def stream_folder_zip(root_name, files):
+    """
+    生成文件夹的 ZIP 流
+
+    Args:
+        root_name (str): 压缩包内的根目录名 (通常为文件夹名)
+        files (iterable): 文件记录 (含 location, name, size, upload_date, folder_path)，
+                          按 folder_path 分组 (见 db_utils.iter_folder_tree_files)
+
+    Yields:
+        bytes: ZIP 数据块. 读取失败的文件不中断打包，最后以 ERRORS_ENTRY_NAME 条目列出
+    """
+    root = _safe_name(root_name)
+    output = _StreamBuffer()
+    files = iter(files)
+    pending = deque()
+    errors = []
+    current_folder, used_names = None, set()
+    written = 0
+
+    pool = ThreadPoolExecutor(max_workers=ZIP_PREFETCH_OBJECTS, thread_name_prefix='zip-prefetch')
+
+    def fill():
+        while len(pending) < ZIP_PREFETCH_OBJECTS:
+            row = next(files, None)
+            if row is None:
+                return
+            pending.append((row, pool.submit(_open_object, row['location'])))
+
+    try:
+        with zipfile.ZipFile(output, 'w', allowZip64=True) as archive:
+            fill()
+            while pending:
+                row, future = pending.popleft()
+                fill()
+
+                folder_path = '/'.join(_safe_name(part) for part in row['folder_path'].split('/')
+                                       if part not in ('', '.', '..'))
+                if folder_path != current_folder:
+                    current_folder, used_names = folder_path, set()
+                name = _unique_name(_safe_name(row['name']), used_names)
+                used_names.add(name)
+                arcname = '/'.join(part for part in (root, folder_path, name) if part)
+
+                try:
+                    head, response = future.result()
+                except Exception as e:
+                    logging.error(f"打包时读取对象失败: {row['location']}, {e}")
+                    errors.append(f"{arcname}\t{e}")
+                    continue
+
+                info = zipfile.ZipInfo(arcname, date_time=max(row['upload_date'].timetuple()[:6], (1980, 1, 1, 0, 0, 0)))
+                extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+                info.compress_type = zipfile.ZIP_DEFLATED if extension in _DEFLATE_EXTENSIONS else zipfile.ZIP_STORED
+                info.file_size = row['size'] or 0  # 大小提示，超过 2 GiB 时自动使用 ZIP64
+                try:
+                    with archive.open(info, 'w') as entry:
+                        entry.write(head)
+                        yield from output.drain()
+                        while response is not None:
+                            chunk = response.read(ZIP_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            entry.write(chunk)
+                            yield from output.drain()
+                finally:
+                    if response is not None:
+                        response.close()
+                        response.release_conn()
+                written += 1
+                yield from output.drain()
+
+            if errors:
+                archive.writestr(f"{root}/{ERRORS_ENTRY_NAME}", '\n'.join(errors) + '\n')
+        yield from output.drain()
+        logging.info(f"文件夹打包完成: {root_name}, 文件 {written} 个, 失败 {len(errors)} 个")
+    finally:
+        # 客户端中途断开时生成器被关闭: 取消尚未开始的预读，已打开的对象在完成后关闭
+        for _, future in pending:
+            if not future.cancel():
+                future.add_done_callback(_close_prefetched)
+        pool.shutdown(wait=False)
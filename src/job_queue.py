@@ -0,0 +1,159 @@
+"""
+后台任务队列模块
+任务持久化在 MySQL jobs 表中，由 job_worker 进程池领取执行
+"""
+import json
+import logging
+import os
+import uuid
+from dotenv import load_dotenv
+
+from db_utils import insert_job, insert_jobs, get_job_by_id, get_batch_jobs
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+# 任务优先级 (数值越大越先执行)
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 5
+PRIORITY_HIGH = 10
+
+# 已注册的任务处理函数: job_type -> handler(payload) -> JSON 可序列化结果
+JOB_HANDLERS = {}
+
+
+class NonRetryableJobError(Exception):
+    """任务处理函数抛出此异常时不再重试，直接标记为失败."""
+
+
+def register_job_handler(job_type):
+    """
+    注册任务处理函数的装饰器
+
+    Args:
+        job_type (str): 任务类型
+    """
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def enqueue_job(job_type, payload, priority=PRIORITY_NORMAL, max_attempts=None, created_by=None):
+    """
+    提交后台任务
+
+    Args:
+        job_type (str): 任务类型
+        payload (dict): 任务参数，必须可 JSON 序列化
+        priority (int): 优先级
+        max_attempts (int, optional): 最大尝试次数. Defaults to JOB_MAX_ATTEMPTS from .env.
+        created_by (str, optional): 创建者 ID
+
+    Returns:
+        str: 任务 ID，失败则返回 None
+    """
+    if job_type not in JOB_HANDLERS:
+        logging.warning(f"提交的任务类型在当前进程中未注册处理函数: {job_type}")
+    return insert_job(
+        job_type,
+        json.dumps(payload, ensure_ascii=False, default=str),
+        priority=priority,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        created_by=created_by
+    )
+
+
+def enqueue_batch(job_type, payloads, priority=PRIORITY_NORMAL, max_attempts=None, created_by=None):
+    """
+    在一个事务中提交一批同类型的后台任务，整批共用一个批次 ID (进度由 get_batch_status 汇总，任一 API 进程都可查询)
+
+    Args:
+        job_type (str): 任务类型
+        payloads (list): 每个任务的参数，必须可 JSON 序列化
+        priority (int): 优先级
+        max_attempts (int, optional): 最大尝试次数. Defaults to JOB_MAX_ATTEMPTS from .env.
+        created_by (str, optional): 创建者 ID
+
+    Returns:
+        str: 批次 ID，失败则返回 None
+    """
+    if job_type not in JOB_HANDLERS:
+        logging.warning(f"提交的任务类型在当前进程中未注册处理函数: {job_type}")
+    batch_id = uuid.uuid4().hex
+    job_ids = insert_jobs(
+        job_type,
+        [json.dumps(payload, ensure_ascii=False, default=str) for payload in payloads],
+        priority=priority,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        created_by=created_by,
+        batch_id=batch_id
+    )
+    return batch_id if job_ids is not None else None
+
+
+def _decode_job(job):
+    for field in ('payload', 'result'):
+        if job.get(field):
+            try:
+                job[field] = json.loads(job[field])
+            except ValueError:
+                pass
+    return job
+
+
+def get_batch_status(batch_id):
+    """
+    汇总一个批次的任务进度
+
+    Args:
+        batch_id (str): 批次 ID
+
+    Returns:
+        dict: {batch_id, status ('running' / 'completed'), total, completed, succeeded, failed,
+               created_at, finished_at, jobs (payload 和 result 已反序列化)}，批次不存在返回 None
+
+    Raises:
+        RuntimeError: 查询数据库失败
+    """
+    jobs = get_batch_jobs(batch_id)
+    if jobs is None:
+        raise RuntimeError('查询批次任务失败')
+    if not jobs:
+        return None
+    jobs = [_decode_job(job) for job in jobs]
+    succeeded = sum(1 for job in jobs if job['status'] == 'succeeded')
+    failed = sum(1 for job in jobs if job['status'] == 'failed')
+    finished = succeeded + failed == len(jobs)
+    return {
+        'batch_id': batch_id,
+        'status': 'completed' if finished else 'running',
+        'total': len(jobs),
+        'completed': succeeded + failed,
+        'succeeded': succeeded,
+        'failed': failed,
+        'created_at': min(job['created_at'] for job in jobs).isoformat(),
+        'finished_at': max(job['updated_at'] for job in jobs).isoformat() if finished else None,
+        'jobs': jobs
+    }
+
+
+def get_job_status(job_id):
+    """
+    获取任务状态，payload 和 result 反序列化为对象
+
+    Args:
+        job_id (str): 任务 ID
+
+    Returns:
+        dict: 任务信息，未找到则返回 None
+    """
+    job = get_job_by_id(job_id)
+    if not job:
+        return None
+    return _decode_job(job)
@@ -0,0 +1,186 @@
+"""
+后台任务 Worker 进程池
+从 jobs 表领取任务并执行，支持优先级、失败重试 (指数退避) 与失联任务回收.
+
+用法: python job_worker.py --workers 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', 10))
+JOB_STALE_TIMEOUT = int(os.getenv('JOB_STALE_TIMEOUT', 1800))
+JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', 60))
+FILE_GC_INTERVAL = int(os.getenv('FILE_GC_INTERVAL', 600))
+
+
+def _retry_delay(attempts):
+    """第 attempts 次失败后的重试间隔 (秒)，指数退避."""
+    return JOB_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0))
+
+
+def _start_heartbeat(job_id, worker_id):
+    """
+    在后台线程中每 JOB_HEARTBEAT_INTERVAL 秒刷新任务的 locked_at，使超过 JOB_STALE_TIMEOUT 的长任务
+    不被当作失联任务回收. 返回的 Event 置位后线程退出.
+    """
+    from db_utils import heartbeat_job
+
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            if not heartbeat_job(job_id, worker_id):
+                logging.warning(f"任务已不由本 worker 持有 (可能已被回收): {job_id}")
+                return
+
+    threading.Thread(target=beat, name=f"job-heartbeat-{job_id}", daemon=True).start()
+    return stop
+
+
+def run_job(job, handlers):
+    """
+    执行单个已领取的任务并记录结果. 执行期间定期心跳; 结束时只在任务仍由本 worker 持有时更新状态，
+    避免已被回收并由其他 worker 重新执行的任务被覆盖.
+
+    Args:
+        job (dict): claim_job 返回的任务记录
+        handlers (dict): job_type -> 处理函数
+    """
+    from db_utils import complete_job, fail_job
+    from job_queue import NonRetryableJobError
+
+    job_id = job['id']
+    worker_id = job.get('locked_by')
+    handler = handlers.get(job['job_type'])
+    if handler is None:
+        fail_job(job_id, f"未注册的任务类型: {job['job_type']}", worker_id=worker_id)
+        return
+
+    started = time.monotonic()
+    heartbeat = _start_heartbeat(job_id, worker_id) if worker_id else None
+    try:
+        payload = json.loads(job['payload']) if job.get('payload') else {}
+        result = handler(payload)
+        if complete_job(job_id, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                        worker_id=worker_id):
+            logging.info(f"任务执行成功: {job['job_type']} {job_id}, 耗时 {time.monotonic() - started:.2f}s")
+        else:
+            logging.warning(f"任务执行完成但未能记录结果 (任务可能已被回收): {job['job_type']} {job_id}")
+    except NonRetryableJobError as e:
+        logging.error(f"任务执行失败 (不重试): {job['job_type']} {job_id}, {e}")
+        fail_job(job_id, str(e), worker_id=worker_id)
+    except Exception as e:
+        if job['attempts'] < job['max_attempts']:
+            retry_after = datetime.now() + timedelta(seconds=_retry_delay(job['attempts']))
+            logging.warning(f"任务执行失败，将于 {retry_after.isoformat()} 重试: {job['job_type']} {job_id}, {e}")
+            fail_job(job_id, str(e), retry_after=retry_after, worker_id=worker_id)
+        else:
+            logging.error(f"任务执行失败，已达最大尝试次数: {job['job_type']} {job_id}, {e}")
+            fail_job(job_id, str(e), worker_id=worker_id)
+    finally:
+        if heartbeat is not None:
+            heartbeat.set()
+
+
+def worker_loop(worker_index, job_types=None, stop_event=None):
+    """
+    单个 worker 进程的主循环. 每个进程独立初始化数据库连接池和 MinIO 客户端.
+
+    Args:
+        worker_index (int): worker 序号
+        job_types (list, optional): 只处理这些类型的任务
+        stop_event (multiprocessing.Event, optional): 置位后在当前任务结束时退出
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # 导入 file_api 会初始化 MinIO 客户端和数据库连接池，并注册其中定义的任务处理函数
+    import file_api
+    from db_utils import claim_job, requeue_stale_jobs
+    from job_queue import JOB_HANDLERS
+
+    if worker_index == 0:
+        # 向量存储的段压缩放在 worker 进程中，不占用 API 进程
+        from vector_store import start_background_compaction
+        start_background_compaction()
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    logging.info(f"Worker 启动: {worker_id}, 任务类型: {job_types or sorted(JOB_HANDLERS)}")
+
+    last_stale_check = 0.0
+    last_gc = time.monotonic()
+    while stop_event is None or not stop_event.is_set():
+        if worker_index == 0 and time.monotonic() - last_stale_check > 60:
+            requeue_stale_jobs(datetime.now() - timedelta(seconds=JOB_STALE_TIMEOUT))
+            last_stale_check = time.monotonic()
+        if worker_index == 0 and FILE_GC_INTERVAL > 0 and time.monotonic() - last_gc > FILE_GC_INTERVAL:
+            # 回收站垃圾回收: 删除超过保留期的软删除文件的 MinIO 对象与记录
+            try:
+                file_api.collect_deleted_files()
+            except Exception as e:
+                logging.error(f"回收站垃圾回收失败: {e}")
+            last_gc = time.monotonic()
+
+        job = claim_job(worker_id, job_types=job_types)
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        run_job(job, JOB_HANDLERS)
+
+    logging.info(f"Worker 退出: {worker_id}")
+
+
+def run_worker_pool(num_workers=None, job_types=None):
+    """
+    启动 worker 进程池并在收到 SIGINT/SIGTERM 时优雅退出
+
+    Args:
+        num_workers (int, optional): 进程数. Defaults to JOB_WORKERS from .env.
+        job_types (list, optional): 只处理这些类型的任务
+    """
+    num_workers = num_workers or JOB_WORKERS
+    stop_event = multiprocessing.Event()
+    processes = []
+    for index in range(num_workers):
+        process = multiprocessing.Process(
+            target=worker_loop,
+            args=(index, job_types, stop_event),
+            name=f"job-worker-{index}"
+        )
+        process.start()
+        processes.append(process)
+    logging.info(f"已启动 {num_workers} 个任务 worker 进程")
+
+    def shutdown(signum, frame):
+        logging.info("收到退出信号，等待当前任务完成...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DeepRAG 后台任务 worker')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='worker 进程数')
+    parser.add_argument('--job-types', nargs='*', help='只处理指定类型的任务')
+    args = parser.parse_args()
+    run_worker_pool(args.workers, args.job_types)
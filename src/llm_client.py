@@ -0,0 +1,103 @@
+"""
+大语言模型 (LLM) 客户端模块
+以生成器的形式流式返回模型输出的文本片段. LLM_API_URL 设置为 "stub" 时使用本地回显模型，
+不依赖外部服务.
+"""
+import json
+import logging
+import os
+import re
+import time
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# LLM 服务配置 (from .env)，接口兼容 OpenAI /chat/completions
+LLM_API_URL = os.getenv('LLM_API_URL', 'stub')
+LLM_API_KEY = os.getenv('LLM_API_KEY', '')
+LLM_MODEL = os.getenv('LLM_MODEL', '')
+LLM_TIMEOUT = int(os.getenv('LLM_TIMEOUT', 120))
+LLM_STUB_DELAY_MS = float(os.getenv('LLM_STUB_DELAY_MS', 0))
+
+_STUB_TOKEN_RE = re.compile(r'\s*\S+')
+
+
+class OpenAIChatClient:
+    """调用 OpenAI 兼容的流式对话接口 (POST {base_url}/chat/completions, stream=true)."""
+
+    def __init__(self, base_url=None, api_key=None, model=None, timeout=None):
+        self.base_url = (base_url or LLM_API_URL).rstrip('/')
+        self.api_key = api_key if api_key is not None else LLM_API_KEY
+        self.model = model if model is not None else LLM_MODEL
+        self.timeout = timeout or LLM_TIMEOUT
+
+    def stream(self, messages, **options):
+        """
+        流式生成回答
+
+        Args:
+            messages (list): [{'role', 'content'}, ...]
+            **options: 透传给接口的其他参数 (temperature 等)
+
+        Yields:
+            str: 增量文本
+
+        Raises:
+            RuntimeError: 服务调用失败
+        """
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        body = dict(options, model=self.model, messages=messages, stream=True)
+        try:
+            with requests.post(f"{self.base_url}/chat/completions", json=body, headers=headers,
+                               stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    choices = json.loads(data).get('choices') or [{}]
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        yield content
+        except requests.exceptions.RequestException as e:
+            logging.error(f"LLM 服务调用失败: {e}")
+            raise RuntimeError(f'LLM 服务调用失败: {e}') from e
+        except ValueError as e:
+            logging.error(f"LLM 服务返回了无效的流数据: {e}")
+            raise RuntimeError('LLM 服务返回了无效的响应') from e
+
+
+class EchoChatClient:
+    """本地回显模型: 复述问题并列出上下文中的资料标题，逐词输出. 用于测试和离线开发."""
+
+    def __init__(self, delay_ms=None):
+        self.delay = (LLM_STUB_DELAY_MS if delay_ms is None else delay_ms) / 1000
+
+    def stream(self, messages, **options):
+        question = messages[-1]['content'] if messages else ''
+        sources = re.findall(r'^\[(\d+)\] (.+)$', question, flags=re.MULTILINE)
+        query = question.rsplit('问题:', 1)[-1].strip()
+        lines = [f"(stub) 问题: {query}"]
+        if sources:
+            lines.append(f"参考了 {len(sources)} 段资料:")
+            lines.extend(f"- [{number}] {title}" for number, title in sources)
+        else:
+            lines.append("没有检索到相关资料.")
+        for token in _STUB_TOKEN_RE.findall('\n'.join(lines)):
+            if self.delay:
+                time.sleep(self.delay)
+            yield token
+
+
+def get_llm_client():
+    """根据 LLM_API_URL 返回 LLM 客户端实例."""
+    if LLM_API_URL == 'stub':
+        return EchoChatClient()
+    return OpenAIChatClient()
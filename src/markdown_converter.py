@@ -0,0 +1,132 @@
+"""
+Markdown 转换服务客户端模块
+在服务端将 MinIO 中的对象流式转发给 Markdown 转换服务 (批量转换由后台任务队列执行，参见 job_queue)
+"""
+import logging
+import os
+import uuid
+
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 转换服务配置 (from .env). 设置为 "stub" 时使用本地桩转换器，不依赖外部服务
+MARKDOWN_CONVERTER_URL = os.getenv('MARKDOWN_CONVERTER_URL', 'http://localhost:8000')
+MARKDOWN_CONVERTER_TIMEOUT = int(os.getenv('MARKDOWN_CONVERTER_TIMEOUT', 600))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _MultipartStream:
+    """
+    以只读文件对象的形式逐块生成 multipart/form-data 请求体.
+
+    实现 __len__ 以便 requests 设置 Content-Length 并按块调用 read()，
+    文件内容直接从源流读取，不会整体载入内存.
+    """
+
+    def __init__(self, source, filename, content_type, length, field_name='file'):
+        self.boundary = uuid.uuid4().hex
+        safe_name = filename.replace('"', '')
+        self._head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{safe_name}"\r\n'
+            f'Content-Type: {content_type or "application/octet-stream"}\r\n\r\n'
+        ).encode('utf-8')
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._source = source
+        self._length = length
+        self._parts = [self._head, None, self._tail]
+        self._buffer = b''
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self._head) + self._length + len(self._tail)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = STREAM_CHUNK_SIZE
+        while len(self._buffer) < size and self._parts:
+            part = self._parts[0]
+            if part is None:
+                data = self._source.read(STREAM_CHUNK_SIZE)
+                if data:
+                    self._buffer += data
+                    continue
+            else:
+                self._buffer += part
+            self._parts.pop(0)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class HttpMarkdownConverter:
+    """调用外部 Markdown 转换服务 (POST {base_url}/process/)."""
+
+    def __init__(self, base_url=None, timeout=None):
+        self.base_url = (base_url or MARKDOWN_CONVERTER_URL).rstrip('/')
+        self.timeout = timeout or MARKDOWN_CONVERTER_TIMEOUT
+
+    def convert(self, source, filename, content_type, length):
+        """
+        将文件流转换为 Markdown
+
+        Args:
+            source (file-like): 可读的文件流 (例如 MinIO get_object 的响应)
+            filename (str): 原始文件名
+            content_type (str): 文件 MIME 类型
+            length (int): 文件大小（字节）
+
+        Returns:
+            dict: 转换服务的响应，至少包含 success, message, markdown_content
+        """
+        body = _MultipartStream(source, filename, content_type, length)
+        try:
+            response = requests.post(
+                f"{self.base_url}/process/",
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Markdown 转换服务调用失败: {e}")
+            return {'success': False, 'message': f'转换服务调用失败: {str(e)}'}
+        except ValueError as e:
+            logging.error(f"Markdown 转换服务返回了无效的 JSON: {e}")
+            return {'success': False, 'message': '转换服务返回了无效的响应'}
+
+
+class StubMarkdownConverter:
+    """本地桩转换器：把文件内容按 UTF-8 解码后包装为 Markdown，用于测试和离线开发."""
+
+    def convert(self, source, filename, content_type, length):
+        parts = []
+        while True:
+            data = source.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            parts.append(data)
+        text = b''.join(parts).decode('utf-8', errors='replace')
+        return {
+            'success': True,
+            'message': 'stub conversion',
+            'file_name': filename,
+            'file_type': content_type,
+            'markdown_content': f"# {filename}\n\n{text}"
+        }
+
+
+def get_converter():
+    """根据 MARKDOWN_CONVERTER_URL 返回转换器实例."""
+    if MARKDOWN_CONVERTER_URL == 'stub':
+        return StubMarkdownConverter()
+    return HttpMarkdownConverter()
@@ -7,6 +7,7 @@ import os # Added for environ
 from dotenv import load_dotenv # Added for .env loading
 from minio import Minio
 from minio.error import S3Error
+from minio.deleteobjects import DeleteObject
 from datetime import timedelta # 确保导入 timedelta
 
 # Load environment variables from .env file
@@ -226,6 +227,45 @@ def get_file_url(object_name, target_bucket_name=None, expires=604800):
         logging.error(f"错误类型: {type(e).__name__}")
         return None
 
+def get_file_urls(object_names, target_bucket_name=None, expires=604800):
+    """
+    批量生成预签名 URL (签名在本地计算，不逐个发起请求，也不逐个记录日志)
+    
+    Args:
+        object_names (list): 对象名称列表
+        target_bucket_name (str, optional): 存储桶名称
+        expires (int or timedelta, optional): URL 过期时间（秒或timedelta对象），默认为 7 天 (604800秒)
+        
+    Returns:
+        dict: 对象名称 -> 预签名 URL (生成失败的对象不出现)
+    """
+    global minio_client # Use the global client
+    if not minio_client:
+        logging.error("MinIO client not initialized for getting file URLs.")
+        return {}
+
+    current_bucket = target_bucket_name if target_bucket_name else bucket_name
+    if not current_bucket:
+        logging.error("No bucket name specified or initialized for getting file URLs.")
+        return {}
+
+    expires_delta = expires if isinstance(expires, timedelta) else timedelta(seconds=int(expires))
+    if expires_delta.total_seconds() <= 0:
+        expires_delta = timedelta(seconds=604800)
+
+    urls = {}
+    for object_name in dict.fromkeys(object_names):
+        try:
+            urls[object_name] = minio_client.presigned_get_object(
+                bucket_name=current_bucket,
+                object_name=object_name,
+                expires=expires_delta
+            )
+        except Exception as e:
+            logging.error(f"获取文件 URL 失败: {object_name}, {e}")
+    logging.info(f"批量生成预签名 URL: {len(urls)}/{len(object_names)} 个")
+    return urls
+
 def delete_file_from_minio(object_name, target_bucket_name=None):
     """
     从 MinIO 删除文件
@@ -256,31 +296,79 @@ def delete_file_from_minio(object_name, target_bucket_name=None):
         logging.error(f"文件删除失败: {e}")
         return False
 
-def list_files_in_minio(prefix=None, target_bucket_name=None):
+def delete_files_from_minio(object_names, target_bucket_name=None):
     """
-    列出 MinIO 存储桶中的文件
+    批量删除 MinIO 对象 (S3 multi-object delete，客户端按每请求 1000 个对象分批)
     
     Args:
-        prefix (str, optional): 对象名称前缀，用于筛选文件
+        object_names (list): 对象名称列表
         target_bucket_name (str, optional): 存储桶名称
         
     Returns:
-        list: 文件对象列表，失败则返回空列表
+        list: 删除失败的对象名称列表 (全部成功时为空列表)
     """
     global minio_client # Use the global client
-    if not minio_client:
-        logging.error("MinIO client not initialized for listing files.")
+    object_names = [name for name in dict.fromkeys(object_names) if name]
+    if not object_names:
         return []
-
+    if not minio_client:
+        logging.error("MinIO client not initialized for deleting files.")
+        return object_names
+    
     current_bucket = target_bucket_name if target_bucket_name else bucket_name
     if not current_bucket:
-        logging.error("No bucket name specified or initialized for listing files.")
-        return []
+        logging.error("No bucket name specified or initialized for deleting files.")
+        return object_names
 
     try:
-        # 列出所有对象
-        objects = minio_client.list_objects(current_bucket, prefix=prefix, recursive=True)
-        return list(objects)
+        # remove_objects 是惰性的，必须遍历返回的错误迭代器才会真正发出删除请求
+        errors = minio_client.remove_objects(current_bucket, (DeleteObject(name) for name in object_names))
+        failed = []
+        for error in errors:
+            logging.error(f"文件删除失败: {error.name}, {error.code}: {error.message}")
+            failed.append(error.name)
+        logging.info(f"批量删除文件: {len(object_names) - len(failed)}/{len(object_names)} 个 from bucket {current_bucket}")
+        return failed
     except S3Error as e:
+        logging.error(f"批量删除文件失败: {e}")
+        return object_names
+
+def iter_files_in_minio(prefix=None, target_bucket_name=None, start_after=None):
+    """
+    逐个遍历 MinIO 存储桶中的对象 (生成器，按对象名称字典序，SDK 按页拉取，内存占用与桶大小无关).
+    与 list_files_in_minio 不同，列举出错时抛出异常，调用方可以区分 "列举完毕" 与 "列举中断"
+    
+    Args:
+        prefix (str, optional): 对象名称前缀，用于筛选文件
+        target_bucket_name (str, optional): 存储桶名称
+        start_after (str, optional): 从该对象名称之后开始列举 (用于断点续扫)
+        
+    Yields:
+        Object: MinIO 对象信息 (object_name, size, last_modified 等)
+    """
+    if not minio_client:
+        raise RuntimeError("MinIO client not initialized for listing files.")
+    current_bucket = target_bucket_name if target_bucket_name else bucket_name
+    if not current_bucket:
+        raise RuntimeError("No bucket name specified or initialized for listing files.")
+
+    for obj in minio_client.list_objects(current_bucket, prefix=prefix, recursive=True, start_after=start_after):
+        if not obj.is_dir:
+            yield obj
+
+def list_files_in_minio(prefix=None, target_bucket_name=None):
+    """
+    列出 MinIO 存储桶中的文件 (一次性载入全部列表，大桶请使用 iter_files_in_minio)
+    
+    Args:
+        prefix (str, optional): 对象名称前缀，用于筛选文件
+        target_bucket_name (str, optional): 存储桶名称
+        
+    Returns:
+        list: 文件对象列表，失败则返回空列表
+    """
+    try:
+        return list(iter_files_in_minio(prefix=prefix, target_bucket_name=target_bucket_name))
+    except (S3Error, RuntimeError) as e:
         logging.error(f"列出文件失败: {e}")
-        return [] 
\ No newline at end of file
+        return []
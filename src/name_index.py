@@ -0,0 +1,649 @@
+"""
+文件名检索模块
+文件名 n-gram 倒排索引，支持任意子串查询 (含中日韩文件名)、排序和游标 (keyset) 分页，
+避免 LIKE '%x%' 全表扫描.
+
+文件名先经 NFKC 规范化并转小写，再从每个字符起取 n 个字符作为 n-gram: CJK 字符 n=2 (字二元组)，
+其他字符 n=3 (三元组)，末尾不足 n 个字符的也保留. 倒排表记录 (文档号, 出现位置)，查询词中各完整
+n-gram 按其相对位置对齐即可判断子串匹配与前缀匹配，不需要读取文件名；不含完整 n-gram 的短查询词
+(1~2 个字符) 在排序后的 n-gram 词典中按前缀范围查找.
+
+磁盘布局 (NAME_INDEX_DIR):
+    CURRENT          当前基础段的代号
+    seg-<代号>/       基础段 (NumPy, mmap 加载): 排序后的 n-gram 词典、按 (n-gram, 文档号, 位置) 排序的
+                     倒排表、文件 ID 及其排序下标、规范化后的文件名 (UTF-8 拼接) 与长度
+    journal.log      基础段之后的增量操作日志 (JSON Lines)，所有进程共享
+    LOCK             fcntl 文件锁
+
+写入先追加日志再更新内存，查询前读取其他进程新追加的日志；日志条数超过 NAME_INDEX_COMPACT_THRESHOLD
+时合并为新的基础段. 排序: 完全匹配文件名或去掉扩展名的文件名 > 前缀匹配 > 包含，同级按文件名长度升序，
+再按文件 ID 升序，三者组成游标.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from array import array
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+NAME_INDEX_DIR = os.getenv('NAME_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'name_index'))
+NAME_INDEX_COMPACT_THRESHOLD = int(os.getenv('NAME_INDEX_COMPACT_THRESHOLD', 5000))
+
+_WIDE_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]')
+_TERM_DTYPE = 'U3'  # 最长的 n-gram 为 3 个字符
+_ID_DTYPE = 'S32'
+_MAX_LENGTH = 65535  # 文件名长度与位置以 uint16 存储
+_EMPTY_DOCS = np.zeros(0, dtype=np.uint32)
+_EMPTY_POSITIONS = np.zeros(0, dtype=np.uint16)
+
+# 排序等级
+TIER_EXACT = 0
+TIER_PREFIX = 1
+TIER_CONTAINS = 2
+
+
+def normalize_name(name):
+    """文件名规范化: NFKC (全角转半角等) + 小写."""
+    return unicodedata.normalize('NFKC', name or '').lower()[:_MAX_LENGTH]
+
+
+def _gram_length(ch):
+    return 2 if _WIDE_RE.match(ch) else 3
+
+
+def name_grams(name):
+    """
+    规范化后文件名的 n-gram 及其出现位置
+
+    Args:
+        name (str): 规范化后的文件名
+
+    Returns:
+        dict: n-gram -> [位置, ...] (升序)
+    """
+    grams = {}
+    for i, ch in enumerate(name):
+        grams.setdefault(name[i:i + _gram_length(ch)], []).append(i)
+    return grams
+
+
+def _query_grams(term):
+    """
+    查询词中的完整 n-gram
+
+    Returns:
+        tuple: ([(n-gram, 在查询词中的位置), ...], 这些 n-gram 是否覆盖查询词的全部字符)
+    """
+    grams, covered = [], 0
+    for i, ch in enumerate(term):
+        n = _gram_length(ch)
+        if i + n <= len(term):
+            grams.append((term[i:i + n], i))
+            covered = i + n
+    return grams, covered == len(term)
+
+
+def _stem_length(name):
+    return len(os.path.splitext(name)[0])
+
+
+def _keys(docs, positions):
+    """(文档号, 位置) 合并为一个可排序的整数."""
+    return docs.astype(np.int64) << 16 | positions
+
+
+def _docs(keys):
+    """_keys 编码还原为文档号 (与倒排表同为 uint32，避免 searchsorted 时整体转换类型)."""
+    return (keys >> 16).astype(np.uint32)
+
+
+def _unique_sorted(values):
+    """升序数组去重."""
+    if len(values) < 2:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+
+def _members(values, sorted_values):
+    """values 中的每个元素是否出现在升序数组 sorted_values 中."""
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    index = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[index] == values
+
+
+def _gather(docs, positions, candidates):
+    """倒排表 (按文档号升序) 中文档号属于 candidates (升序) 的部分."""
+    lo = np.searchsorted(docs, candidates, side='left')
+    counts = np.searchsorted(docs, candidates, side='right') - lo
+    total = int(counts.sum())
+    if total == len(docs):
+        return docs, positions
+    index = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return docs[index], positions[index]
+
+
+def encode_cursor(key):
+    """游标 (等级, 文件名长度, 文件 ID) 编码为字符串."""
+    tier, length, file_id = key
+    return f'{tier}.{length}.{file_id}'
+
+
+def decode_cursor(cursor):
+    """
+    解析 encode_cursor 生成的游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    tier, length, file_id = cursor.split('.', 2)
+    if not file_id or len(file_id) > 32 or not file_id.isascii():
+        raise ValueError(f'无效的游标: {cursor}')
+    return int(tier), int(length), file_id
+
+
+class NameIndex:
+    """
+    内存中的文件名 n-gram 索引.
+
+    基础段 (只读 NumPy 数组，可为 mmap) + 增量段两层结构. 文档号单调递增 (基础段在前)，
+    所以每个 n-gram 的倒排表天然按 (文档号, 位置) 有序；删除只打墓碑，在 write_segment() 时物理清除.
+    """
+
+    def __init__(self):
+        # 基础段
+        self._terms = np.zeros(0, dtype=_TERM_DTYPE)  # 排序后的 n-gram
+        self._offsets = np.zeros(1, dtype=np.int64)  # n-gram 下标 -> 倒排表起点, 长度 len(terms)+1
+        self._docnos = _EMPTY_DOCS
+        self._positions = _EMPTY_POSITIONS
+        self._file_ids = np.zeros(0, dtype=_ID_DTYPE)
+        self._order = np.zeros(0, dtype=np.int64)  # 文件 ID 升序的文档号
+        self._name_offsets = np.zeros(1, dtype=np.int64)
+        self._names = np.zeros(0, dtype=np.uint8)
+        self._base_docs = 0
+        # 增量段
+        self._delta = {}  # n-gram -> (array('I') 文档号, array('H') 位置)
+        self._delta_ids = {}  # 文件 ID -> 文档号
+        self._delta_file_ids = []
+        self._delta_names = []
+        self._delta_id_array = None
+        # 所有文档
+        self._name_lengths = array('H')
+        self._stem_lengths = array('H')
+        self._alive = bytearray()
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _docno(self, file_id):
+        """文件 ID 对应的存活文档号 (不存在时为 None)."""
+        docno = self._delta_ids.get(file_id)
+        if docno is not None:
+            return docno
+        if not self._base_docs:
+            return None
+        key = file_id.encode('ascii')
+        position = int(np.searchsorted(self._file_ids, key, sorter=self._order))
+        if position < self._base_docs:
+            docno = int(self._order[position])
+            if self._file_ids[docno] == key and self._alive[docno]:
+                return docno
+        return None
+
+    def add(self, file_id, name):
+        """
+        添加文件名 (文件 ID 已存在时替换)
+
+        Args:
+            file_id (str): 文件 ID
+            name (str): 文件名
+        """
+        self.delete(file_id)
+        normalized = normalize_name(name)
+        docno = self._base_docs + len(self._delta_names)
+        self._delta_ids[file_id] = docno
+        self._delta_file_ids.append(file_id)
+        self._delta_names.append(normalized)
+        self._delta_id_array = None
+        self._name_lengths.append(len(normalized))
+        self._stem_lengths.append(_stem_length(normalized))
+        self._alive.append(1)
+        self._live += 1
+        for gram, positions in name_grams(normalized).items():
+            postings = self._delta.get(gram)
+            if postings is None:
+                postings = self._delta[gram] = (array('I'), array('H'))
+            postings[0].extend([docno] * len(positions))
+            postings[1].extend(positions)
+
+    def delete(self, file_id):
+        """删除文件名 (打墓碑). 返回是否存在."""
+        docno = self._docno(file_id)
+        if docno is None:
+            return False
+        self._delta_ids.pop(file_id, None)
+        self._alive[docno] = 0
+        self._live -= 1
+        return True
+
+    def _name(self, docno):
+        if docno >= self._base_docs:
+            return self._delta_names[docno - self._base_docs]
+        return bytes(self._names[self._name_offsets[docno]:self._name_offsets[docno + 1]]).decode('utf-8')
+
+    def _file_id_array(self, docnos):
+        file_ids = np.empty(len(docnos), dtype=_ID_DTYPE)
+        base = docnos < self._base_docs
+        file_ids[base] = self._file_ids[docnos[base]]
+        if not base.all():
+            if self._delta_id_array is None:
+                self._delta_id_array = np.array(self._delta_file_ids, dtype=_ID_DTYPE)
+            file_ids[~base] = self._delta_id_array[docnos[~base] - self._base_docs]
+        return file_ids
+
+    def _postings(self, gram):
+        """n-gram 的倒排表 (文档号数组, 位置数组)，按 (文档号, 位置) 升序."""
+        docs, positions = [], []
+        i = int(np.searchsorted(self._terms, gram))
+        if i < len(self._terms) and self._terms[i] == gram:
+            start, end = self._offsets[i], self._offsets[i + 1]
+            docs.append(self._docnos[start:end])
+            positions.append(self._positions[start:end])
+        delta = self._delta.get(gram)
+        if delta:
+            docs.append(np.frombuffer(delta[0], dtype=np.uint32))
+            positions.append(np.frombuffer(delta[1], dtype=np.uint16))
+        if not docs:
+            return _EMPTY_DOCS, _EMPTY_POSITIONS
+        if len(docs) == 1:
+            return docs[0], positions[0]
+        return np.concatenate(docs), np.concatenate(positions)
+
+    def _prefix_keys(self, prefix):
+        """以 prefix 开头的所有 n-gram 的出现位置 (_keys 编码，升序)."""
+        lo = int(np.searchsorted(self._terms, prefix, side='left'))
+        hi = int(np.searchsorted(self._terms, prefix + '\uffff', side='left'))
+        start, end = self._offsets[lo], self._offsets[hi]
+        keys = [_keys(self._docnos[start:end], self._positions[start:end])]
+        keys.extend(_keys(np.frombuffer(docs, dtype=np.uint32), np.frombuffer(positions, dtype=np.uint16))
+                    for gram, (docs, positions) in self._delta.items() if gram.startswith(prefix))
+        return np.unique(np.concatenate(keys))
+
+    def _match_term(self, term, candidates=None):
+        """
+        查找包含查询词的文档
+
+        Args:
+            term (str): 规范化后的查询词
+            candidates (np.ndarray, optional): 只在这些文档号 (升序) 中查找
+
+        Returns:
+            tuple: (匹配的文档号, 文件名以查询词开头的文档号, 是否需要逐个校验文件名)，文档号均升序
+        """
+        grams, covered = _query_grams(term)
+        if not grams:
+            starts = self._prefix_keys(term)
+            if candidates is not None:
+                starts = starts[_members(_docs(starts), candidates)]
+            return _unique_sorted(_docs(starts)), _docs(starts[(starts & 0xFFFF) == 0]), False
+
+        postings = {gram: self._postings(gram) for gram, _ in grams}
+        by_size = sorted(postings, key=lambda gram: len(postings[gram][0]))
+        docs = candidates
+        for gram in by_size:
+            gram_docs = postings[gram][0]
+            if docs is None:
+                docs = _unique_sorted(gram_docs)
+            else:
+                lo = np.searchsorted(gram_docs, docs, side='left')
+                docs = docs[np.searchsorted(gram_docs, docs, side='right') > lo]
+            if not len(docs):
+                return _EMPTY_DOCS, _EMPTY_DOCS, False
+
+        # 各 n-gram 的出现位置减去其在查询词中的位置即查询词的起始位置，所有 n-gram 一致才是子串匹配
+        starts = None
+        for gram, offset in sorted(grams, key=lambda item: len(postings[item[0]][0])):
+            gram_docs, gram_positions = _gather(*postings[gram], docs)
+            keep = gram_positions >= offset
+            keys = _keys(gram_docs[keep], gram_positions[keep] - offset)
+            starts = keys if starts is None else np.intersect1d(starts, keys, assume_unique=True)
+            if not len(starts):
+                return _EMPTY_DOCS, _EMPTY_DOCS, False
+        return _unique_sorted(_docs(starts)), _docs(starts[(starts & 0xFFFF) == 0]), not covered
+
+    def search(self, query, limit=20, after=None):
+        """
+        检索文件名包含查询中所有词 (按空白切分) 的文件
+
+        Args:
+            query (str): 查询文本
+            limit (int): 返回结果数
+            after (tuple, optional): 游标 (等级, 文件名长度, 文件 ID)，只返回排在其后的结果
+
+        Returns:
+            tuple: ([(file_id, 等级, 文件名长度), ...], 匹配总数, 下一页游标 (等级, 文件名长度, 文件 ID) 或 None)
+        """
+        terms = normalize_name(query).split()
+        if not terms or not self._live:
+            return [], 0, None
+        lead = terms[0]
+        candidates, lead_prefix, verify_terms = None, None, []
+        for term in sorted(set(terms), key=len, reverse=True):
+            candidates, prefix, verify = self._match_term(term, candidates)
+            if term == lead:
+                lead_prefix = prefix
+            if verify:
+                verify_terms.append(term)
+            if not len(candidates):
+                return [], 0, None
+        candidates = candidates[np.frombuffer(self._alive, dtype=np.uint8)[candidates].astype(bool)]
+
+        lengths = np.frombuffer(self._name_lengths, dtype=np.uint16)[candidates]
+        if verify_terms:
+            # 查询词末尾有 n-gram 未覆盖的字符 (例如 CJK 字后跟 1~2 个字母)，逐个校验候选文件名
+            names = [self._name(int(docno)) for docno in candidates]
+            keep = np.fromiter((all(term in name for term in verify_terms) for name in names),
+                               dtype=bool, count=len(names))
+            tiers = np.fromiter(
+                (TIER_EXACT if name == lead or os.path.splitext(name)[0] == lead
+                 else TIER_PREFIX if name.startswith(lead) else TIER_CONTAINS for name in names),
+                dtype=np.uint8, count=len(names))
+            candidates, lengths, tiers = candidates[keep], lengths[keep], tiers[keep]
+        else:
+            prefix = _members(candidates, lead_prefix)
+            stems = np.frombuffer(self._stem_lengths, dtype=np.uint16)[candidates]
+            exact = prefix & ((lengths == len(lead)) | (stems == len(lead)))
+            tiers = np.where(exact, TIER_EXACT, np.where(prefix, TIER_PREFIX, TIER_CONTAINS)).astype(np.uint8)
+        total = len(candidates)
+
+        rank = tiers.astype(np.int64) << 16 | lengths
+        if after is not None:
+            after_rank = int(after[0]) << 16 | int(after[1])
+            later = rank > after_rank
+            ties = np.flatnonzero(rank == after_rank)
+            later[ties] = self._file_id_array(candidates[ties]) > after[2].encode('ascii')
+            candidates, rank = candidates[later], rank[later]
+        if not len(rank):
+            return [], total, None
+        if len(rank) > limit:
+            # 先按 (等级, 长度) 取出可能进入本页的结果，只对这些结果取文件 ID 排序
+            within = rank <= np.partition(rank, limit - 1)[limit - 1]
+            selected_rank, selected_ids = rank[within], self._file_id_array(candidates[within])
+        else:
+            selected_rank, selected_ids = rank, self._file_id_array(candidates)
+        order = np.lexsort((selected_ids, selected_rank))[:limit]
+        hits = [(selected_ids[i].decode('ascii'), int(selected_rank[i] >> 16), int(selected_rank[i] & 0xFFFF))
+                for i in order]
+        next_key = (hits[-1][1], hits[-1][2], hits[-1][0]) if len(rank) > limit else None
+        return hits, total, next_key
+
+    def write_segment(self, path):
+        """合并基础段与增量段、清除已删除文件后写入新的段目录，文档号重新从 0 连续编号."""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        remap = np.full(len(alive), -1, dtype=np.int64)
+        remap[alive] = np.arange(int(alive.sum()))
+
+        # 统一的 n-gram 词典 (排序)
+        delta_terms = list(self._delta)
+        terms, inverse = np.unique(
+            np.concatenate([np.asarray(self._terms), np.array(delta_terms, dtype=_TERM_DTYPE)]), return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        posting_terms = [np.repeat(inverse[:len(self._terms)], np.diff(self._offsets))]
+        posting_docs = [np.asarray(self._docnos, dtype=np.int64)]
+        posting_positions = [np.asarray(self._positions)]
+        for term_id, term in zip(inverse[len(self._terms):], delta_terms):
+            docs, positions = self._delta[term]
+            posting_terms.append(np.full(len(docs), term_id, dtype=np.int64))
+            posting_docs.append(np.frombuffer(docs, dtype=np.uint32).astype(np.int64))
+            posting_positions.append(np.frombuffer(positions, dtype=np.uint16))
+        all_terms = np.concatenate(posting_terms)
+        all_docs = remap[np.concatenate(posting_docs)]
+        all_positions = np.concatenate(posting_positions)
+        keep = all_docs >= 0
+        all_terms, all_docs, all_positions = all_terms[keep], all_docs[keep], all_positions[keep]
+        order = np.lexsort((all_positions, all_docs, all_terms))
+        all_terms, all_docs, all_positions = all_terms[order], all_docs[order], all_positions[order]
+
+        # 去掉所有倒排都已被删除的 n-gram
+        counts = np.bincount(all_terms, minlength=len(terms))
+        used = np.flatnonzero(counts)
+        offsets = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+
+        # 文件 ID 与文件名
+        base_alive = alive[:self._base_docs]
+        delta_alive = alive[self._base_docs:]
+        delta_names = [name for name, live in zip(self._delta_names, delta_alive) if live]
+        file_ids = np.concatenate([
+            np.asarray(self._file_ids)[base_alive],
+            np.array([file_id for file_id, live in zip(self._delta_file_ids, delta_alive) if live], dtype=_ID_DTYPE)
+        ])
+        names = np.concatenate([
+            np.asarray(self._names)[np.repeat(base_alive, np.diff(self._name_offsets))],
+            np.frombuffer(''.join(delta_names).encode('utf-8'), dtype=np.uint8)
+        ])
+        name_sizes = np.concatenate([
+            np.diff(self._name_offsets)[base_alive],
+            np.array([len(name.encode('utf-8')) for name in delta_names], dtype=np.int64)
+        ])
+        name_offsets = np.zeros(len(name_sizes) + 1, dtype=np.int64)
+        np.cumsum(name_sizes, out=name_offsets[1:])
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'terms.npy'), terms[used])
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'docnos.npy'), all_docs.astype(np.uint32))
+        np.save(os.path.join(path, 'positions.npy'), all_positions.astype(np.uint16))
+        np.save(os.path.join(path, 'file_ids.npy'), file_ids)
+        np.save(os.path.join(path, 'order.npy'), np.argsort(file_ids, kind='stable'))
+        np.save(os.path.join(path, 'names.npy'), names)
+        np.save(os.path.join(path, 'name_offsets.npy'), name_offsets)
+        np.save(os.path.join(path, 'name_lengths.npy'), np.frombuffer(self._name_lengths, dtype=np.uint16)[alive])
+        np.save(os.path.join(path, 'stem_lengths.npy'), np.frombuffer(self._stem_lengths, dtype=np.uint16)[alive])
+
+    @classmethod
+    def load_segment(cls, path):
+        """从段目录加载索引，大数组以 mmap 方式打开."""
+        index = cls()
+        for name in ('terms', 'docnos', 'positions', 'file_ids', 'order', 'names', 'name_offsets'):
+            setattr(index, f'_{name}', np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        index._offsets = np.load(os.path.join(path, 'offsets.npy'))
+        index._name_lengths = array('H', np.load(os.path.join(path, 'name_lengths.npy')).tobytes())
+        index._stem_lengths = array('H', np.load(os.path.join(path, 'stem_lengths.npy')).tobytes())
+        index._base_docs = len(index._file_ids)
+        index._alive = bytearray(b'\x01' * index._base_docs)
+        index._live = index._base_docs
+        return index
+
+
+class NameIndexStore:
+    """
+    持久化的文件名索引 (基础段 + 共享操作日志)，可被多个进程同时读写.
+    """
+
+    def __init__(self, path, compact_threshold=None):
+        self.path = path
+        self.compact_threshold = compact_threshold or NAME_INDEX_COMPACT_THRESHOLD
+        self._lock = threading.RLock()
+        self._index = NameIndex()
+        self._generation = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(path, 'LOCK')
+        self._journal_path = os.path.join(path, 'journal.log')
+        self._current_path = os.path.join(path, 'CURRENT')
+
+    def _read_generation(self):
+        try:
+            with open(self._current_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _segment_path(self, generation):
+        return os.path.join(self.path, f'seg-{generation:06d}')
+
+    @staticmethod
+    def _apply(index, entry):
+        if entry['op'] == 'add':
+            index.add(entry['id'], entry['name'])
+        elif entry['op'] == 'delete':
+            index.delete(entry['id'])
+
+    def _read_journal(self, offset):
+        """读取 offset 之后完整的日志行，返回 [(行字节数, 操作), ...]."""
+        if not os.path.exists(self._journal_path) or os.path.getsize(self._journal_path) <= offset:
+            return []
+        entries = []
+        with open(self._journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 未写完整的行，等待下次读取
+                entries.append((len(line), json.loads(line)))
+        return entries
+
+    def _catch_up(self):
+        """载入其他进程产生的新段与新日志 (调用方需持有文件锁)."""
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._index = NameIndex.load_segment(self._segment_path(generation)) if generation else NameIndex()
+            self._generation = generation
+            self._journal_offset = 0
+            self._journal_entries = 0
+        for size, entry in self._read_journal(self._journal_offset):
+            self._journal_offset += size
+            self._journal_entries += 1
+            self._apply(self._index, entry)
+
+    def _append(self, entries):
+        if not entries:
+            return
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            data = b''.join((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8') for entry in entries)
+            with open(self._journal_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_offset += len(data)
+            self._journal_entries += len(entries)
+            for entry in entries:
+                self._apply(self._index, entry)
+            if self._journal_entries >= self.compact_threshold:
+                self._compact()
+
+    def _install(self, index):
+        """把 index 写为新的基础段并清空日志 (调用方需持有排他文件锁)."""
+        generation = max(self._generation or 0, self._read_generation()) + 1
+        segment = self._segment_path(generation)
+        shutil.rmtree(segment, ignore_errors=True)
+        index.write_segment(segment)
+        tmp_current = self._current_path + '.tmp'
+        with open(tmp_current, 'w') as f:
+            f.write(str(generation))
+        os.replace(tmp_current, self._current_path)
+        open(self._journal_path, 'wb').close()
+        old_segment = self._segment_path(self._generation) if self._generation else None
+        self._index = NameIndex.load_segment(segment)
+        self._generation = generation
+        self._journal_offset = 0
+        self._journal_entries = 0
+        if old_segment and old_segment != segment:
+            shutil.rmtree(old_segment, ignore_errors=True)
+
+    def _compact(self):
+        self._install(self._index)
+        logging.info(f"文件名索引压缩完成: {self.path}, 段 {self._generation}, 文件数 {len(self._index)}")
+
+    def add(self, file_id, name):
+        """索引 (或重新索引) 文件名."""
+        self._append([{'op': 'add', 'id': file_id, 'name': name}])
+
+    def add_many(self, items):
+        """批量索引文件名 (一次写入日志并 fsync). items 为 (file_id, name) 序列."""
+        self._append([{'op': 'add', 'id': file_id, 'name': name} for file_id, name in items])
+
+    def delete(self, file_ids):
+        """从索引中删除文件."""
+        self._append([{'op': 'delete', 'id': file_id} for file_id in file_ids])
+
+    def compact(self):
+        """立即压缩索引."""
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            self._compact()
+
+    def rebuild(self, rows):
+        """
+        从头重建索引 (例如索引与 files 表不一致时).
+        新索引在锁外构建，安装前重放构建期间其他写入追加的日志 (操作幂等).
+
+        Args:
+            rows (iterable): [(file_id, name), ...]
+
+        Returns:
+            int: 索引的文件数
+        """
+        with self._lock, file_lock(self._lock_path, exclusive=False):
+            self._catch_up()
+            generation, offset = self._generation, self._journal_offset
+        index = NameIndex()
+        for file_id, name in rows:
+            index.add(file_id, name)
+        with self._lock, file_lock(self._lock_path):
+            if self._read_generation() != generation:
+                # 构建期间日志被压缩过，压缩前追加的改动只能靠读取 rows 时已经看到
+                logging.warning(f"文件名索引重建期间发生了压缩，重建开始后的个别改动可能缺失，可再次重建: {self.path}")
+                offset = 0
+            for _, entry in self._read_journal(offset):
+                self._apply(index, entry)
+            self._install(index)
+            logging.info(f"文件名索引重建完成: {self.path}, 文件数 {len(self._index)}")
+            return len(self._index)
+
+    def search(self, query, limit=20, after=None):
+        """
+        检索文件名，参见 NameIndex.search
+
+        Returns:
+            tuple: ([(file_id, 等级, 文件名长度), ...], 匹配总数, 下一页游标或 None)
+        """
+        with self._lock:
+            with file_lock(self._lock_path, exclusive=False):
+                self._catch_up()
+            return self._index.search(query, limit=limit, after=after)
+
+    def __len__(self):
+        with self._lock:
+            with file_lock(self._lock_path, exclusive=False):
+                self._catch_up()
+            return len(self._index)
+
+
+_name_index = None
+_name_index_lock = threading.Lock()
+
+
+def get_name_index():
+    """获取文件名索引 (进程内单例)."""
+    global _name_index
+    with _name_index_lock:
+        if _name_index is None:
+            _name_index = NameIndexStore(NAME_INDEX_DIR)
+        return _name_index
@@ -0,0 +1,238 @@
+"""
+检索结果缓存模块
+在混合检索之前缓存查询结果 (进程内 LRU + TTL)，缓存 key 为规范化的查询文本与检索范围.
+查询文本不同但语义相近 (查询向量余弦相似度不低于 QUERY_CACHE_SIMILARITY) 时也可命中.
+
+失效: 每个文件夹维护一个代号 (generation)，文件内容或位置变化时递增该文件所在文件夹
+及其全部祖先文件夹的代号，以及全局代号 '*'. 缓存条目记录写入时检索范围对应的代号
+(文件夹范围用该文件夹的代号，其他范围用全局代号)，代号变化后条目失效.
+代号保存在 QUERY_CACHE_DIR/generations.json 中，API 与 worker 进程共享.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+from embedding_service import normalize_text
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+QUERY_CACHE_DIR = os.getenv('QUERY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'query_cache'))
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 1024))
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 300))
+QUERY_CACHE_SIMILARITY = float(os.getenv('QUERY_CACHE_SIMILARITY', 0.97))  # 0 表示只做精确匹配
+
+GLOBAL_SCOPE = '*'
+
+
+class GenerationCounters:
+    """
+    跨进程共享的代号计数器 (JSON 文件 + fcntl 锁). 读取时只 stat 文件，内容变化后才重新载入.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._signature = None
+        self._values = {}
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._signature, self._values = None, {}
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            with open(self.path) as f:
+                self._values = json.load(f)
+            self._signature = signature
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            return self._values.get(key, 0)
+
+    def bump(self, keys):
+        """递增一组代号 (原子替换文件，读者不会看到写了一半的内容)."""
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock, file_lock(self._lock_path):
+            self._signature = None
+            self._load()
+            values = dict(self._values)
+            for key in keys:
+                values[key] = values.get(key, 0) + 1
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(values, f)
+            os.replace(tmp_path, self.path)
+            self._signature = None
+
+
+class QueryCache:
+    """
+    检索结果缓存: 精确匹配 (规范化查询 + 范围) 优先，其次在同一范围内按查询向量做近似匹配.
+    """
+
+    def __init__(self, generations, max_entries=None, ttl=None, similarity=None):
+        self.generations = generations
+        self.max_entries = max_entries or QUERY_CACHE_SIZE
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self.similarity = QUERY_CACHE_SIMILARITY if similarity is None else similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (query, scope) -> entry
+        self._by_scope = {}  # scope -> {query: 查询向量}，用于近似匹配
+        self.hits = self.semantic_hits = self.misses = 0
+
+    @staticmethod
+    def scope_key(folder_id=None, file_ids=None, created_by=None, **options):
+        """把检索范围与影响结果的参数 (top_k 等) 组合为可哈希的 key."""
+        return (
+            folder_id,
+            tuple(sorted(file_ids)) if file_ids is not None else None,
+            created_by,
+            tuple(sorted(options.items()))
+        )
+
+    def generation_for(self, scope):
+        """范围对应的当前代号. 在检索开始前读取，写入缓存时使用，避免缓存检索期间已过期的结果."""
+        folder_id = scope[0]
+        return self.generations.get(folder_id if folder_id is not None else GLOBAL_SCOPE)
+
+    def _valid(self, entry, scope, now):
+        return now - entry['created'] <= self.ttl and entry['generation'] == self.generation_for(scope)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        vectors = self._by_scope.get(key[1])
+        if vectors is not None:
+            vectors.pop(key[0], None)
+            if not vectors:
+                del self._by_scope[key[1]]
+
+    def get(self, query, scope):
+        """
+        精确匹配查找
+
+        Returns:
+            object: 缓存的结果，未命中返回 None
+        """
+        key = (normalize_text(query).lower(), scope)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._valid(entry, scope, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['result']
+                self._drop(key)
+            return None
+
+    def get_similar(self, query_vector, scope):
+        """
+        在同一范围的缓存条目中查找查询向量最相近的一条 (相似度不低于阈值)
+
+        Returns:
+            object: 缓存的结果，未命中返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            vectors = self._by_scope.get(scope) if self.similarity > 0 else None
+            if vectors:
+                queries = list(vectors)
+                scores = np.stack([vectors[q] for q in queries]) @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    key = (queries[best], scope)
+                    entry = self._entries[key]
+                    if self._valid(entry, scope, now):
+                        self._entries.move_to_end(key)
+                        self.semantic_hits += 1
+                        return entry['result']
+                    self._drop(key)
+            return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, query, scope, result, generation, query_vector=None):
+        """写入缓存条目，超出容量时淘汰最久未使用的条目."""
+        key = (normalize_text(query).lower(), scope)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {'result': result, 'generation': generation, 'created': time.monotonic()}
+            if query_vector is not None:
+                self._by_scope.setdefault(scope, {})[key[0]] = np.asarray(query_vector, dtype=np.float32)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.semantic_hits) / lookups, 4) if lookups else None
+            }
+
+
+_generations = None
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_generations():
+    """获取共享代号计数器 (进程内单例)."""
+    global _generations
+    with _query_cache_lock:
+        if _generations is None:
+            _generations = GenerationCounters(os.path.join(QUERY_CACHE_DIR, 'generations.json'))
+        return _generations
+
+
+def get_query_cache():
+    """获取检索结果缓存 (进程内单例)."""
+    global _query_cache
+    generations = get_generations()
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(generations)
+        return _query_cache
+
+
+def invalidate_folders(folder_ids):
+    """
+    使包含这些文件夹的检索范围的缓存失效 (文件夹自身、全部祖先文件夹与全局范围)
+
+    Args:
+        folder_ids (iterable): 发生变化的文件夹 ID，None 表示根目录
+    """
+    from db_utils import get_folder_ancestor_ids
+
+    keys = {GLOBAL_SCOPE}
+    for folder_id in folder_ids:
+        if folder_id is None:
+            continue
+        ancestors = get_folder_ancestor_ids(folder_id)
+        keys.update(ancestors if ancestors else [folder_id])
+    try:
+        get_generations().bump(keys)
+    except OSError as e:
+        logging.error(f"更新检索缓存代号失败: {e}")
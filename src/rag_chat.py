@@ -0,0 +1,181 @@
+"""
+检索增强问答 (RAG) 模块
+检索相关分块，按得分把分块打包进上下文词元预算 (合并同一文件中重叠或相邻的分块)，
+再调用 LLM 流式生成回答，以 Server-Sent Events (OpenAI chat.completion.chunk 格式) 输出.
+检索完成后立即发送第一条事件 (引用来源)，首字节时间只取决于检索耗时.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+
+from chunker import count_tokens
+from llm_client import get_llm_client
+from retrieval import load_chunk_texts, retrieve
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHAT_TOP_K = int(os.getenv('CHAT_TOP_K', 12))
+CHAT_CONTEXT_TOKENS = int(os.getenv('CHAT_CONTEXT_TOKENS', 3000))
+CHAT_HISTORY_MESSAGES = int(os.getenv('CHAT_HISTORY_MESSAGES', 6))
+
+SYSTEM_PROMPT = (
+    "你是知识库问答助手。请只根据提供的资料回答用户的问题，"
+    "在引用资料的句子后用 [编号] 标注来源；资料中没有答案时请直接说明。"
+)
+
+
+def pack_context(items, max_tokens=None):
+    """
+    把检索到的分块打包进词元预算
+
+    按得分从高到低选择分块；与已选片段属于同一文件且字节区间重叠或相邻的分块合并到该片段
+    (重叠部分只计一次)，放不下的分块跳过，继续尝试得分更低但更短的分块.
+
+    Args:
+        items (list): 带 'text' 的检索结果 (参见 retrieval.load_chunk_texts)
+        max_tokens (int, optional): 上下文词元上限. Defaults to CHAT_CONTEXT_TOKENS from .env.
+
+    Returns:
+        list: 片段列表 (按得分降序)，每个片段含 file_id, file_name, heading, start_offset,
+              end_offset, score, chunk_ids, tokens, text
+    """
+    max_tokens = max_tokens or CHAT_CONTEXT_TOKENS
+    spans = []
+    used = 0
+    for item in sorted(items, key=lambda item: -item['score']):
+        if not item.get('text'):
+            continue
+        data = item['text'].encode('utf-8')
+        start, end = item['start_offset'], item['start_offset'] + len(data)
+        span = next((s for s in spans if s['file_id'] == item['file_id']
+                     and start <= s['end_offset'] and end >= s['start_offset']), None)
+        if span is None:
+            tokens = count_tokens(item['text'])
+            if used + tokens > max_tokens:
+                continue
+            spans.append({
+                'file_id': item['file_id'],
+                'file_name': item['file_name'],
+                'heading': item.get('heading'),
+                'start_offset': start,
+                'end_offset': end,
+                'score': item['score'],
+                'chunk_ids': [item['chunk_id']],
+                'tokens': tokens,
+                'data': data,
+            })
+            used += tokens
+            continue
+
+        if span['start_offset'] <= start and end <= span['end_offset']:
+            span['chunk_ids'].append(item['chunk_id'])  # 已完全包含
+            continue
+        merged_start, merged_end = min(start, span['start_offset']), max(end, span['end_offset'])
+        merged = bytearray(merged_end - merged_start)
+        merged[start - merged_start:end - merged_start] = data
+        merged[span['start_offset'] - merged_start:span['end_offset'] - merged_start] = span['data']
+        tokens = count_tokens(merged.decode('utf-8', errors='replace'))
+        if used + tokens - span['tokens'] > max_tokens:
+            continue
+        used += tokens - span['tokens']
+        span.update(start_offset=merged_start, end_offset=merged_end, tokens=tokens, data=bytes(merged))
+        span['chunk_ids'].append(item['chunk_id'])
+
+    for span in spans:
+        span['text'] = span.pop('data').decode('utf-8', errors='replace').strip()
+    return spans
+
+
+def build_messages(query, spans, history=None):
+    """
+    组装发送给 LLM 的消息
+
+    Args:
+        query (str): 用户问题
+        spans (list): pack_context 的结果
+        history (list, optional): 之前的对话 [{'role', 'content'}, ...]，只保留最近 CHAT_HISTORY_MESSAGES 条
+
+    Returns:
+        list: [{'role', 'content'}, ...]
+    """
+    context = []
+    for number, span in enumerate(spans, start=1):
+        title = span['file_name'] + (f" > {span['heading']}" if span.get('heading') else '')
+        context.append(f"[{number}] {title}\n{span['text']}")
+    messages = [{'role': 'system', 'content': SYSTEM_PROMPT}]
+    for message in (history or [])[-CHAT_HISTORY_MESSAGES:]:
+        if message.get('role') in ('user', 'assistant') and isinstance(message.get('content'), str):
+            messages.append({'role': message['role'], 'content': message['content']})
+    messages.append({
+        'role': 'user',
+        'content': "资料:\n\n" + ('\n\n'.join(context) if context else '(无)') + f"\n\n问题: {query}"
+    })
+    return messages
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _chunk_event(completion_id, created, model, delta, finish_reason=None, **extra):
+    return _sse(dict({
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': created,
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }, **extra))
+
+
+def stream_chat(query, folder_id=None, file_ids=None, created_by=None, history=None,
+                top_k=None, max_context_tokens=None, client=None):
+    """
+    检索并流式生成回答
+
+    Args:
+        query (str): 用户问题
+        folder_id (str, optional): 只在该文件夹子树中检索
+        file_ids (list, optional): 只在这些文件中检索
+        created_by (str, optional): 只检索该用户创建的文件
+        history (list, optional): 之前的对话
+        top_k (int, optional): 检索的分块数. Defaults to CHAT_TOP_K from .env.
+        max_context_tokens (int, optional): 上下文词元上限
+        client (optional): LLM 客户端. Defaults to get_llm_client().
+
+    Yields:
+        str: SSE 事件. 第一条事件的 delta 为 {'role': 'assistant'} 并带有 sources (引用来源)，
+             之后每条事件携带一段增量文本，最后是 finish_reason='stop' 的事件和 'data: [DONE]'
+    """
+    client = client or get_llm_client()
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = getattr(client, 'model', None) or type(client).__name__
+    started = time.perf_counter()
+    try:
+        result = retrieve(query, top_k=top_k or CHAT_TOP_K, folder_id=folder_id,
+                          file_ids=file_ids, created_by=created_by)
+        items = result['items']
+        load_chunk_texts(items)
+        spans = pack_context(items, max_context_tokens)
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        sources = [
+            {key: span[key] for key in ('file_id', 'file_name', 'heading', 'start_offset', 'end_offset', 'score', 'chunk_ids', 'tokens')}
+            for span in spans
+        ]
+        yield _chunk_event(completion_id, created, model, {'role': 'assistant', 'content': ''},
+                           sources=sources, retrieval={'cache': result['cache'], 'took_ms': round(retrieval_ms, 2)})
+
+        for text in client.stream(build_messages(query, spans, history)):
+            yield _chunk_event(completion_id, created, model, {'content': text})
+        yield _chunk_event(completion_id, created, model, {}, finish_reason='stop')
+    except Exception as e:
+        logging.exception(f"生成回答失败: {e}")
+        yield _chunk_event(completion_id, created, model, {}, finish_reason='error', error=str(e))
+    yield "data: [DONE]\n\n"
@@ -0,0 +1,323 @@
+"""
+混合检索模块
+在 Markdown 分块上并行执行全文检索 (BM25) 与稠密向量检索，用倒数排名融合 (RRF) 合并结果.
+两路检索在线程池中并发执行，端到端延迟接近较慢的一路而不是两者之和.
+近重复分块只有代表分块在索引中 (参见 dedup_index)，结果通过反向引用列出同簇的其他分块.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from ann_index import get_ann_index
+from chunk_store import get_chunk_store
+from db_utils import get_chunks_by_ids, get_file_ids, get_folder_subtree_ids
+from dedup_index import get_dedup_index
+from embedding_service import embed_texts
+from query_cache import QUERY_CACHE_SIZE, get_query_cache
+from search_index import get_chunk_index
+from vector_store import get_vector_store, normalize
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', 50))  # 每一路检索的候选数
+RETRIEVAL_RRF_K = int(os.getenv('RETRIEVAL_RRF_K', 60))
+RETRIEVAL_THREADS = int(os.getenv('RETRIEVAL_THREADS', 8))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RETRIEVAL_THREADS, thread_name_prefix='retrieval')
+        return _executor
+
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """
+    倒数排名融合: score(d) = sum(1 / (k + rank_i(d)))，rank 从 1 开始
+
+    Args:
+        rankings (dict): 检索器名称 -> 按相关性降序排列的 key 列表
+        k (int, optional): 平滑常数. Defaults to RETRIEVAL_RRF_K from .env.
+
+    Returns:
+        list: [(key, fused_score, {检索器名称: rank}), ...] 按融合得分降序
+    """
+    k = k or RETRIEVAL_RRF_K
+    scores = {}
+    ranks = {}
+    for name, keys in rankings.items():
+        for rank, key in enumerate(keys, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            ranks.setdefault(key, {})[name] = rank
+    fused = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [(key, score, ranks[key]) for key, score in fused]
+
+
+def resolve_file_scope(folder_id=None, file_ids=None, created_by=None):
+    """
+    把检索范围解析为文件 ID 集合
+
+    Args:
+        folder_id (str, optional): 只检索该文件夹子树中的文件
+        file_ids (list, optional): 只检索这些文件
+        created_by (str, optional): 只检索该用户创建的文件
+
+    Returns:
+        set: 文件 ID 集合；没有任何限制条件时返回 None
+
+    Raises:
+        RuntimeError: 查询数据库失败
+    """
+    if folder_id is None and file_ids is None and created_by is None:
+        return None
+    folder_ids = None
+    if folder_id is not None:
+        folder_ids = get_folder_subtree_ids(folder_id)
+        if folder_ids is None:
+            raise RuntimeError('查询文件夹失败')
+    scope = get_file_ids(folder_ids=folder_ids, file_ids=file_ids, created_by=created_by)
+    if scope is None:
+        raise RuntimeError('查询文件失败')
+    return set(scope)
+
+
+def _in_scope(chunk_id, file_id, scope, covering):
+    return scope is None or file_id in scope or chunk_id in covering
+
+
+def lexical_search(query, limit, scope=None, covering=None):
+    """
+    BM25 分块检索，返回 [(chunk_id, file_id, score), ...].
+    covering 为簇内包含范围内分块的去重代表 (参见 DedupIndex.representatives_for_files)，代表本身不在范围内也保留.
+    """
+    covering = covering or {}
+    # 分块 key 为 '<file_id>/<chunk_id>'，范围按文件 ID 前缀过滤
+    keys = [f'{file_id}/{chunk_id}' for chunk_id, (file_id, _) in covering.items()]
+    hits = []
+    for key, score in get_chunk_index().search(query, top_k=limit, groups=scope, keys=keys):
+        file_id, chunk_id = key.split('/', 1)
+        hits.append((chunk_id, file_id, score))
+    return hits
+
+
+def dense_search(query, limit, scope=None, covering=None):
+    """
+    稠密向量分块检索，返回 [(chunk_id, file_id, score), ...].
+    ANN 索引已训练时使用 ANN，否则在向量存储上精确检索. covering 参见 lexical_search.
+    """
+    covering = covering or {}
+    vector = embed_texts([query])  # 查询缓存已向量化过的查询直接命中 embedding 缓存
+    file_ids = chunk_ids = None
+    if scope is not None:
+        # 在截取 top-k 之前过滤: 范围内文件的分块，加上范围外文件中的去重代表分块本身
+        file_ids, chunk_ids = list(scope), list(covering)
+    ann = get_ann_index()
+    if ann.is_trained:
+        hits = ann.search(vector, top_k=limit, file_ids=file_ids, chunk_ids=chunk_ids)[0]
+    else:
+        hits = get_vector_store().search(vector, top_k=limit, file_ids=file_ids, chunk_ids=chunk_ids)[0]
+    return [hit for hit in hits if _in_scope(hit[0], hit[1], scope, covering)]
+
+
+def _copy_result(result, cache_status):
+    """复制检索结果 (调用方会修改结果项，缓存中的对象不能共享出去)."""
+    return {
+        'items': [dict(item) for item in result['items']],
+        'timings': dict(result['timings']),
+        'cache': cache_status
+    }
+
+
+def retrieve(query, top_k=10, folder_id=None, file_ids=None, created_by=None, candidates=None, use_cache=True):
+    """
+    混合检索 Markdown 分块 (先查询结果缓存，参见 query_cache)
+
+    Args:
+        query (str): 查询文本
+        top_k (int): 返回结果数
+        folder_id (str, optional): 只检索该文件夹子树中的文件
+        file_ids (list, optional): 只检索这些文件
+        created_by (str, optional): 只检索该用户创建的文件
+        candidates (int, optional): 每一路检索的候选数. Defaults to RETRIEVAL_CANDIDATES from .env.
+        use_cache (bool): 是否使用查询结果缓存
+
+    Returns:
+        dict: {'items', 'timings', 'cache': 'hit' / 'semantic' / 'miss' / None}，参见 search_chunks
+    """
+    if not use_cache or QUERY_CACHE_SIZE <= 0:
+        return dict(search_chunks(query, top_k, folder_id, file_ids, created_by, candidates), cache=None)
+
+    started = time.perf_counter()
+    cache = get_query_cache()
+    scope = cache.scope_key(folder_id, file_ids, created_by, top_k=top_k, candidates=candidates)
+    # 代号在检索开始前读取: 检索期间发生的写入会使本次写入的条目立即失效
+    generation = cache.generation_for(scope)
+    cached, status, query_vector = cache.get(query, scope), 'hit', None
+    if cached is None and cache.similarity > 0:
+        try:
+            query_vector = normalize(embed_texts([query]))[0]
+            cached, status = cache.get_similar(query_vector, scope), 'semantic'
+        except Exception as e:
+            logging.warning(f"查询向量化失败，跳过近似缓存匹配: {e}")
+    if cached is not None:
+        result = _copy_result(cached, status)
+        result['timings'] = {'cache_ms': round((time.perf_counter() - started) * 1000, 3)}
+        return result
+
+    cache.record_miss()
+    result = search_chunks(query, top_k, folder_id, file_ids, created_by, candidates)
+    cache.put(query, scope, _copy_result(result, None), generation, query_vector)
+    return dict(result, cache='miss')
+
+
+def search_chunks(query, top_k=10, folder_id=None, file_ids=None, created_by=None, candidates=None):
+    """
+    混合检索 Markdown 分块
+
+    Args:
+        query (str): 查询文本
+        top_k (int): 返回结果数
+        folder_id (str, optional): 只检索该文件夹子树中的文件
+        file_ids (list, optional): 只检索这些文件
+        created_by (str, optional): 只检索该用户创建的文件
+        candidates (int, optional): 每一路检索的候选数. Defaults to RETRIEVAL_CANDIDATES from .env.
+
+    Returns:
+        dict: {'items': 分块结果列表, 'timings': 各阶段耗时 (ms)}.
+              分块结果含 chunk_id, file_id, file_name, chunk_index, start_offset, end_offset,
+              heading, score (RRF), lexical_rank/score, dense_rank/score,
+              duplicates (同簇的其他近重复分块 [{'chunk_id', 'file_id'}])
+    """
+    started = time.perf_counter()
+    limit = max(candidates or RETRIEVAL_CANDIDATES, top_k)
+    scope = resolve_file_scope(folder_id, file_ids, created_by)
+    timings = {'scope_ms': (time.perf_counter() - started) * 1000}
+    if scope is not None and not scope:
+        return {'items': [], 'timings': {name: round(value, 2) for name, value in timings.items()}}
+    dedup = get_dedup_index()
+    covering = dedup.representatives_for_files(scope) if dedup is not None and scope is not None else {}
+
+    def timed(name, fn):
+        def run():
+            run_started = time.perf_counter()
+            try:
+                return fn(query, limit, scope, covering)
+            finally:
+                timings[f'{name}_ms'] = (time.perf_counter() - run_started) * 1000
+        return run
+
+    executor = _get_executor()
+    retrieval_started = time.perf_counter()
+    futures = {
+        'lexical': executor.submit(timed('lexical', lexical_search)),
+        'dense': executor.submit(timed('dense', dense_search)),
+    }
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            # 一路检索失败时仍返回另一路的结果
+            logging.error(f"{name} 检索失败: {e}")
+            results[name] = []
+    timings['retrieval_ms'] = (time.perf_counter() - retrieval_started) * 1000
+
+    fused = reciprocal_rank_fusion({name: [hit[0] for hit in hits] for name, hits in results.items()})
+    scores = {name: {hit[0]: hit[2] for hit in hits} for name, hits in results.items()}
+    top = fused[:top_k]
+    # 代表分块不在检索范围内时，展示簇内属于范围内文件的分块
+    chunk_ids = [chunk_id for chunk_id, _, _ in top]
+    chunks = get_chunks_by_ids(chunk_ids + [covering[chunk_id][1] for chunk_id in chunk_ids if chunk_id in covering])
+
+    items = []
+    for rep_id, score, ranks in top:
+        chunk_id = rep_id
+        if rep_id in covering and covering[rep_id][0] not in scope:
+            chunk_id = covering[rep_id][1]
+        chunk = chunks.get(chunk_id)
+        if chunk is None:  # 索引中残留的已删除分块
+            continue
+        item = {
+            'chunk_id': chunk_id,
+            'file_id': chunk['file_id'],
+            'file_name': chunk['file_name'],
+            'folder_id': chunk['folder_id'],
+            'location': chunk['location'],
+            'derived_from_file_id': chunk['derived_from_file_id'],
+            'chunk_index': chunk['chunk_index'],
+            'start_offset': chunk['start_offset'],
+            'end_offset': chunk['end_offset'],
+            'token_count': chunk['token_count'],
+            'heading': chunk['heading'],
+            'score': score,
+        }
+        for name in results:
+            item[f'{name}_rank'] = ranks.get(name)
+            item[f'{name}_score'] = scores[name].get(rep_id)
+        if dedup is not None:
+            item['duplicates'] = [
+                {'chunk_id': member, 'file_id': file_id}
+                for member, file_id in dedup.cluster(rep_id)
+                if member != chunk_id and (scope is None or file_id in scope)
+            ]
+        items.append(item)
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+    return {'items': items, 'timings': {name: round(value, 2) for name, value in timings.items()}}
+
+
+def load_chunk_texts(items):
+    """
+    读取分块文本 (Markdown 文件中该分块字节区间的原文)，写入每个结果的 'text' 字段.
+    优先从本地分块存储切片读取 (参见 chunk_store，分块文本不含字节区间末尾的换行符)；
+    存储中缺失、字节区间不一致 (已过期) 或文本与原文字节数不符 (分块时合并了连续空行、CRLF 换行)
+    的分块按字节区间从 MinIO 并行读取.
+
+    Args:
+        items (list): retrieve 返回的分块结果
+    """
+    import minio_config
+
+    try:
+        stored = get_chunk_store().get([item['chunk_id'] for item in items], text=True)
+    except Exception as e:
+        logging.error(f"读取分块存储失败，改为从 MinIO 读取: {e}")
+        stored = {}
+    missing = []
+    for item in items:
+        chunk = stored.get(item['chunk_id'])
+        if (chunk is not None
+                and (chunk['start_offset'], chunk['end_offset']) == (item['start_offset'], item['end_offset'])
+                and item['end_offset'] - item['start_offset'] - len(chunk['text']) in (0, 1)):
+            item['text'] = str(chunk['text'], 'utf-8', 'replace')
+        else:
+            missing.append(item)
+
+    def read(item):
+        response = None
+        try:
+            response = minio_config.minio_client.get_object(
+                minio_config.bucket_name, item['location'],
+                offset=item['start_offset'], length=item['end_offset'] - item['start_offset']
+            )
+            return response.read().decode('utf-8', errors='replace')
+        except Exception as e:
+            logging.error(f"读取分块文本失败: {item['chunk_id']}, {e}")
+            return None
+        finally:
+            if response is not None:
+                response.close()
+                response.release_conn()
+
+    for item, text in zip(missing, _get_executor().map(read, missing)):
+        item['text'] = text
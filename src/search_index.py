@@ -0,0 +1,480 @@
+"""
+全文检索模块
+嵌入式 BM25 倒排索引，中文等 CJK 文本按字二元组 (bigram) 切分.
+
+磁盘布局 (SEARCH_INDEX_DIR):
+    CURRENT          当前基础段的代号
+    seg-<代号>/       压缩后的基础段: 词典 + 按词分组、文档号升序的倒排表 (NumPy, mmap 加载)
+    journal.log      基础段之后的增量操作日志 (JSON Lines)，所有进程共享
+    LOCK             fcntl 文件锁，保证多进程 (API / worker) 追加与压缩的顺序一致
+
+每次写入先追加日志再更新内存；查询前读取其他进程新追加的日志。日志条数超过
+SEARCH_COMPACT_THRESHOLD 时把基础段与增量合并为新段，并物理删除已删除的文档.
+"""
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'search_index'))
+CHUNK_SEARCH_INDEX_DIR = os.getenv('CHUNK_SEARCH_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'chunk_index'))
+SEARCH_COMPACT_THRESHOLD = int(os.getenv('SEARCH_COMPACT_THRESHOLD', 2000))
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(
+    r'[a-z0-9]+(?:[._-][a-z0-9]+)*'
+    r'|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+'
+)
+_MAX_TF = 65535
+
+
+def tokenize(text):
+    """
+    切分文本为检索词.
+    拉丁字母/数字按词切分并转小写；CJK 连续字符切分为字二元组，单字保留为一元词.
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        list: 检索词列表 (保留重复，用于统计词频)
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        run = match.group()
+        if run[0] < '\u0080':
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class InvertedIndex:
+    """
+    内存中的 BM25 倒排索引.
+
+    基础段 (只读 NumPy 数组，可为 mmap) + 增量段 (array 追加) 两层结构. 文档号单调递增，
+    所以每个词的倒排表天然按文档号有序；删除只打墓碑，在 write_segment() 时物理清除.
+    文档频率只统计未删除的文档 (有墓碑时按存活标记过滤倒排表)，与文档数 N 口径一致.
+    """
+
+    def __init__(self):
+        self._terms = {}  # 基础段: term -> term_id
+        self._offsets = np.zeros(1, dtype=np.int64)  # 基础段: term_id -> 倒排表起点, 长度 len(terms)+1
+        self._docnos = np.zeros(0, dtype=np.uint32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._delta = {}  # 增量段: term -> (array('I') 文档号, array('H') 词频)
+        self._delta_postings = 0
+        self._doc_keys = []  # 文档号 -> key (已删除为 None)
+        self._doc_lengths = array('I')
+        self._alive = bytearray()
+        self._key_to_doc = {}
+        self._groups = {}  # key 前缀 (第一个 '/' 之前，例如文件 ID) -> array('I') 文档号，用于按范围过滤
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._key_to_doc)
+
+    def __contains__(self, key):
+        return key in self._key_to_doc
+
+    @property
+    def tombstones(self):
+        return len(self._doc_keys) - len(self._key_to_doc)
+
+    def add(self, key, term_counts, length):
+        """
+        添加文档 (key 已存在时先删除旧版本)
+
+        Args:
+            key (str): 文档标识 (例如文件 ID)
+            term_counts (dict): 检索词 -> 词频
+            length (int): 文档长度 (检索词总数)
+        """
+        self.delete(key)
+        docno = len(self._doc_keys)
+        self._doc_keys.append(key)
+        self._doc_lengths.append(length)
+        self._alive.append(1)
+        self._key_to_doc[key] = docno
+        self._add_to_group(key, docno)
+        self._total_length += length
+        for term, tf in term_counts.items():
+            postings = self._delta.get(term)
+            if postings is None:
+                postings = self._delta[term] = (array('I'), array('H'))
+            postings[0].append(docno)
+            postings[1].append(min(tf, _MAX_TF))
+        self._delta_postings += len(term_counts)
+
+    def _add_to_group(self, key, docno):
+        prefix = key.split('/', 1)[0]
+        group = self._groups.get(prefix)
+        if group is None:
+            group = self._groups[prefix] = array('I')
+        group.append(docno)
+
+    def doc_mask(self, groups=None, keys=None):
+        """
+        文档号掩码: key 前缀属于 groups 或 key 属于 keys 的文档为 True (不区分是否已删除)
+
+        Args:
+            groups (iterable, optional): key 前缀 (第一个 '/' 之前的部分)
+            keys (iterable, optional): 完整的 key
+
+        Returns:
+            numpy.ndarray: 长度为文档号总数的 bool 数组
+        """
+        mask = np.zeros(len(self._doc_keys), dtype=bool)
+        for group in groups or ():
+            docnos = self._groups.get(group)
+            if docnos is not None:
+                mask[np.frombuffer(docnos, dtype=np.uint32)] = True
+        docnos = [self._key_to_doc[key] for key in keys or () if key in self._key_to_doc]
+        mask[docnos] = True
+        return mask
+
+    def delete(self, key):
+        """删除文档 (打墓碑). 返回是否存在该文档."""
+        docno = self._key_to_doc.pop(key, None)
+        if docno is None:
+            return False
+        self._doc_keys[docno] = None
+        self._alive[docno] = 0
+        self._total_length -= self._doc_lengths[docno]
+        return True
+
+    def _postings(self, term):
+        """返回 term 的 (文档号, 词频) NumPy 数组列表 (基础段与增量段各一份)."""
+        result = []
+        term_id = self._terms.get(term)
+        if term_id is not None:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            result.append((self._docnos[start:end], self._tfs[start:end]))
+        delta = self._delta.get(term)
+        if delta is not None:
+            result.append((np.frombuffer(delta[0], dtype=np.uint32), np.frombuffer(delta[1], dtype=np.uint16)))
+        return result
+
+    def search(self, query_terms, top_k=10, groups=None, keys=None):
+        """
+        BM25 检索
+
+        Args:
+            query_terms (list): 查询检索词 (tokenize 的结果)
+            top_k (int): 返回结果数
+            groups (iterable, optional): 指定时只返回 key 前缀属于 groups 或 key 属于 keys 的文档
+                (参见 doc_mask，在取前 top_k 之前过滤)
+            keys (iterable, optional): 指定 groups 时额外允许的完整 key
+
+        Returns:
+            list: [(key, score), ...] 按得分降序
+        """
+        live_docs = len(self._key_to_doc)
+        if not live_docs or not query_terms:
+            return []
+        n_docs = len(self._doc_keys)
+        avgdl = self._total_length / live_docs if live_docs else 1.0
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths.astype(np.float32) / max(avgdl, 1.0))
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+        has_tombstones = live_docs < n_docs
+        scores = np.zeros(n_docs, dtype=np.float32)
+        matched = False
+
+        for term, qtf in Counter(query_terms).items():
+            postings = self._postings(term)
+            if has_tombstones:
+                df = sum(int(np.count_nonzero(alive[docnos])) for docnos, _ in postings)
+            else:
+                df = sum(len(docnos) for docnos, _ in postings)
+            if not df:
+                continue
+            matched = True
+            idf = math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+            for docnos, tfs in postings:
+                tf = tfs.astype(np.float32)
+                # 同一词的倒排表中文档号唯一，可以直接按下标累加
+                scores[docnos] += qtf * idf * tf * (BM25_K1 + 1) / (tf + norm[docnos])
+
+        if not matched:
+            return []
+        scores *= alive
+        candidates = np.flatnonzero(scores > 0)
+        if groups is not None:
+            candidates = candidates[self.doc_mask(groups, keys)[candidates]]
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self._doc_keys[docno], float(scores[docno])) for docno in candidates]
+
+    def write_segment(self, path):
+        """
+        合并基础段与增量段、清除已删除文档后写入新的段目录.
+        文档号重新从 0 连续编号，倒排表按 (词, 文档号) 排序存储.
+        """
+        remap = np.full(len(self._doc_keys), -1, dtype=np.int64)
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        remap[alive] = np.arange(int(alive.sum()))
+
+        terms = list(self._terms)
+        term_ids = dict(self._terms)
+        for term in self._delta:
+            if term not in term_ids:
+                term_ids[term] = len(terms)
+                terms.append(term)
+
+        base_lengths = np.diff(self._offsets)
+        posting_terms = [np.repeat(np.arange(len(base_lengths), dtype=np.int64), base_lengths)]
+        posting_docs = [self._docnos.astype(np.int64)]
+        posting_tfs = [np.asarray(self._tfs)]
+        for term, (docnos, tfs) in self._delta.items():
+            posting_terms.append(np.full(len(docnos), term_ids[term], dtype=np.int64))
+            posting_docs.append(np.frombuffer(docnos, dtype=np.uint32).astype(np.int64))
+            posting_tfs.append(np.frombuffer(tfs, dtype=np.uint16))
+        all_terms = np.concatenate(posting_terms)
+        all_docs = remap[np.concatenate(posting_docs)]
+        all_tfs = np.concatenate(posting_tfs)
+
+        keep = all_docs >= 0
+        all_terms, all_docs, all_tfs = all_terms[keep], all_docs[keep], all_tfs[keep]
+        order = np.lexsort((all_docs, all_terms))
+        all_terms, all_docs, all_tfs = all_terms[order], all_docs[order], all_tfs[order]
+
+        # 去掉所有倒排都已被删除的词
+        counts = np.bincount(all_terms, minlength=len(terms))
+        used = np.flatnonzero(counts)
+        new_term_ids = np.full(len(terms), -1, dtype=np.int64)
+        new_term_ids[used] = np.arange(len(used))
+        offsets = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'terms.json'), 'w', encoding='utf-8') as f:
+            json.dump([terms[i] for i in used], f, ensure_ascii=False)
+        with open(os.path.join(path, 'doc_keys.json'), 'w', encoding='utf-8') as f:
+            json.dump([key for key in self._doc_keys if key is not None], f, ensure_ascii=False)
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'docnos.npy'), all_docs.astype(np.uint32))
+        np.save(os.path.join(path, 'tfs.npy'), all_tfs.astype(np.uint16))
+        np.save(os.path.join(path, 'doc_lengths.npy'), np.frombuffer(self._doc_lengths, dtype=np.uint32)[alive])
+
+    @classmethod
+    def load_segment(cls, path):
+        """从段目录加载索引，倒排数组以 mmap 方式打开."""
+        index = cls()
+        with open(os.path.join(path, 'terms.json'), encoding='utf-8') as f:
+            index._terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, 'doc_keys.json'), encoding='utf-8') as f:
+            index._doc_keys = json.load(f)
+        index._offsets = np.load(os.path.join(path, 'offsets.npy'))
+        index._docnos = np.load(os.path.join(path, 'docnos.npy'), mmap_mode='r')
+        index._tfs = np.load(os.path.join(path, 'tfs.npy'), mmap_mode='r')
+        index._doc_lengths = array('I', np.load(os.path.join(path, 'doc_lengths.npy')).tobytes())
+        index._alive = bytearray(b'\x01' * len(index._doc_keys))
+        index._key_to_doc = {key: docno for docno, key in enumerate(index._doc_keys)}
+        for docno, key in enumerate(index._doc_keys):
+            index._add_to_group(key, docno)
+        index._total_length = sum(index._doc_lengths)
+        return index
+
+
+class SearchIndexStore:
+    """
+    持久化的全文索引 (基础段 + 共享操作日志)，可被多个进程同时读写.
+    """
+
+    def __init__(self, path, compact_threshold=None):
+        self.path = path
+        self.compact_threshold = compact_threshold or SEARCH_COMPACT_THRESHOLD
+        self._lock = threading.RLock()
+        self._index = InvertedIndex()
+        self._generation = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(path, 'LOCK')
+        self._journal_path = os.path.join(path, 'journal.log')
+        self._current_path = os.path.join(path, 'CURRENT')
+
+    def _read_generation(self):
+        try:
+            with open(self._current_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _segment_path(self, generation):
+        return os.path.join(self.path, f'seg-{generation:06d}')
+
+    def _apply(self, entry):
+        if entry['op'] == 'add':
+            self._index.add(entry['key'], entry['tf'], entry['len'])
+        elif entry['op'] == 'delete':
+            self._index.delete(entry['key'])
+
+    def _catch_up(self):
+        """载入其他进程产生的新段与新日志 (调用方需持有文件锁)."""
+        generation = self._read_generation()
+        if generation != self._generation:
+            segment = self._segment_path(generation)
+            self._index = InvertedIndex.load_segment(segment) if generation else InvertedIndex()
+            self._generation = generation
+            self._journal_offset = 0
+            self._journal_entries = 0
+        if not os.path.exists(self._journal_path):
+            return
+        if os.path.getsize(self._journal_path) <= self._journal_offset:
+            return
+        with open(self._journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 未写完整的行，等待下次读取
+                self._journal_offset += len(line)
+                self._journal_entries += 1
+                self._apply(json.loads(line))
+
+    def _append(self, entries):
+        if not entries:
+            return
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            data = b''.join((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8') for entry in entries)
+            with open(self._journal_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_offset += len(data)
+            self._journal_entries += len(entries)
+            for entry in entries:
+                self._apply(entry)
+            if self._journal_entries >= self.compact_threshold:
+                self._compact()
+
+    def _compact(self):
+        """把当前内存索引写为新的基础段并清空日志 (调用方需持有排他文件锁)."""
+        generation = (self._generation or 0) + 1
+        segment = self._segment_path(generation)
+        shutil.rmtree(segment, ignore_errors=True)
+        self._index.write_segment(segment)
+        tmp_current = self._current_path + '.tmp'
+        with open(tmp_current, 'w') as f:
+            f.write(str(generation))
+        os.replace(tmp_current, self._current_path)
+        open(self._journal_path, 'wb').close()
+        old_segment = self._segment_path(self._generation) if self._generation else None
+        self._index = InvertedIndex.load_segment(segment)
+        self._generation = generation
+        self._journal_offset = 0
+        self._journal_entries = 0
+        if old_segment:
+            shutil.rmtree(old_segment, ignore_errors=True)
+        logging.info(f"全文索引压缩完成: {self.path}, 段 {generation}, 文档数 {len(self._index)}")
+
+    def add_document(self, key, text):
+        """
+        索引 (或重新索引) 一篇文档
+
+        Args:
+            key (str): 文档标识
+            text (str): 文档文本
+        """
+        self.add_documents([(key, text)])
+
+    def add_documents(self, documents):
+        """
+        批量索引文档 (一次追加日志)
+
+        Args:
+            documents (iterable): [(key, text), ...]
+        """
+        entries = []
+        for key, text in documents:
+            tokens = tokenize(text)
+            entries.append({'op': 'add', 'key': key, 'len': len(tokens), 'tf': dict(Counter(tokens))})
+        self._append(entries)
+
+    def delete_document(self, key):
+        """从索引中删除文档."""
+        self.delete_documents([key])
+
+    def delete_documents(self, keys):
+        """批量删除文档."""
+        self._append([{'op': 'delete', 'key': key} for key in keys])
+
+    def compact(self):
+        """立即压缩索引."""
+        with self._lock, file_lock(self._lock_path):
+            self._catch_up()
+            self._compact()
+
+    def search(self, query, top_k=10, groups=None, keys=None):
+        """
+        检索文档
+
+        Args:
+            query (str): 查询文本
+            top_k (int): 返回结果数
+            groups (iterable, optional): 只返回 key 前缀属于 groups 的文档，参见 InvertedIndex.search
+            keys (iterable, optional): 指定 groups 时额外允许的完整 key
+
+        Returns:
+            list: [(key, score), ...] 按得分降序
+        """
+        with self._lock:
+            with file_lock(self._lock_path, exclusive=False):
+                self._catch_up()
+            return self._index.search(tokenize(query), top_k=top_k, groups=groups, keys=keys)
+
+    def __len__(self):
+        with self._lock:
+            with file_lock(self._lock_path, exclusive=False):
+                self._catch_up()
+            return len(self._index)
+
+
+_document_index = None
+_document_index_lock = threading.Lock()
+
+
+def get_document_index():
+    """获取 Markdown 文档全文索引 (进程内单例)."""
+    global _document_index
+    with _document_index_lock:
+        if _document_index is None:
+            _document_index = SearchIndexStore(SEARCH_INDEX_DIR)
+        return _document_index
+
+
+_chunk_index = None
+_chunk_index_lock = threading.Lock()
+
+
+def get_chunk_index():
+    """获取分块级全文索引 (进程内单例)，文档 key 为 '<file_id>/<chunk_id>'."""
+    global _chunk_index
+    with _chunk_index_lock:
+        if _chunk_index is None:
+            _chunk_index = SearchIndexStore(CHUNK_SEARCH_INDEX_DIR)
+        return _chunk_index
@@ -0,0 +1,172 @@
+"""
+MinIO 与 files 表对账模块
+流式遍历存储桶中的对象，分批用 IN 查询核对 files.location; 再按位置字节序遍历 files 记录，
+与同序的对象列举归并 (不逐个 HEAD 对象)，找出两个方向的不一致:
+  - 无主对象: 对象存在但没有任何 files 记录引用 (例如移动文件时复制成功、更新记录失败，或删除中途失败)
+  - 缺失对象: files 记录存在但对象不存在
+对象列举与记录遍历都按批进行，内存占用与桶大小、表大小无关. 刚上传或刚移动的文件可能处于
+"对象已写入、记录未提交" 的中间状态，因此只核对早于 RECONCILE_GRACE_SECONDS 的对象和记录.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from minio.error import S3Error
+
+import minio_config
+from db_utils import iter_file_locations, get_referenced_locations, get_files_by_ids
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', 1000))
+RECONCILE_GRACE_SECONDS = int(os.getenv('RECONCILE_GRACE_SECONDS', 3600))
+RECONCILE_SAMPLE_LIMIT = int(os.getenv('RECONCILE_SAMPLE_LIMIT', 100))
+
+_MISSING_CODES = ('NoSuchKey', 'NoSuchObject')
+
+
+def _sample(samples, item):
+    if len(samples) < RECONCILE_SAMPLE_LIMIT:
+        samples.append(item)
+
+
+def _check_objects(batch, report, repair):
+    """核对一批对象是否被 files 记录引用，repair 时批量删除无主对象."""
+    referenced = get_referenced_locations([obj.object_name for obj in batch])
+    orphans = [obj for obj in batch if obj.object_name not in referenced]
+    if not orphans:
+        return
+    report['orphan_objects'] += len(orphans)
+    report['orphan_bytes'] += sum(obj.size or 0 for obj in orphans)
+    for obj in orphans:
+        _sample(report['orphan_object_samples'], obj.object_name)
+    if repair:
+        # 删除前再核对一次，缩小与并发写入之间的竞态窗口
+        referenced = get_referenced_locations([obj.object_name for obj in orphans])
+        names = [obj.object_name for obj in orphans if obj.object_name not in referenced]
+        failed = minio_config.delete_files_from_minio(names)
+        report['orphan_objects_removed'] += len(names) - len(failed)
+
+
+def _missing_rows(rows, objects, state):
+    """
+    归并: rows 与 objects 都按对象名称字节序排列，返回 rows 中对象不存在的记录.
+    state['current'] 为 objects 中尚未越过的对象名称，跨批保留
+    """
+    missing = []
+    for row in rows:
+        while state['current'] is not None and state['current'] < row['location']:
+            state['current'] = next(objects, None)
+        if state['current'] != row['location']:
+            missing.append(row)
+    return missing
+
+
+def _check_files(missing, report, repair, delete_file_records):
+    """记录对象缺失的一批 files 记录，repair 时删除 (软删除) 这些记录."""
+    if not missing:
+        return
+    report['missing_objects'] += len(missing)
+    for row in missing:
+        _sample(report['missing_object_samples'], {'file_id': row['id'], 'location': row['location']})
+    if repair and delete_file_records is not None:
+        # 删除前逐个确认 (只针对少量缺失记录): 对象仍不存在且位置未变化 (期间被移动的文件不算缺失)
+        current = get_files_by_ids([row['id'] for row in missing])
+        file_ids = []
+        for row in missing:
+            if row['id'] not in current or current[row['id']]['location'] != row['location']:
+                continue
+            found = object_exists(row['location'])
+            if found is None:
+                report['check_errors'] += 1
+            elif not found:
+                file_ids.append(row['id'])
+        deleted, _ = delete_file_records(file_ids)
+        report['missing_files_removed'] += len(deleted)
+
+
+def object_exists(object_name):
+    """
+    检查对象是否存在
+
+    Returns:
+        bool or None: 存在 True，不存在 False，无法确定 (网络或权限错误) 时为 None
+    """
+    try:
+        minio_config.minio_client.stat_object(minio_config.bucket_name, object_name)
+        return True
+    except S3Error as e:
+        if e.code in _MISSING_CODES:
+            return False
+        logging.warning(f"检查对象失败: {object_name}, {e}")
+        return None
+    except Exception as e:
+        logging.warning(f"检查对象失败: {object_name}, {e}")
+        return None
+
+
+def reconcile_storage(repair=False, prefix=None, delete_file_records=None):
+    """
+    对账 MinIO 存储桶与 files 表
+
+    Args:
+        repair (bool): 为 True 时修复: 删除无主对象，删除 (软删除) 对象缺失的文件记录
+        prefix (str, optional): 只核对该前缀下的对象及位置在该前缀下的记录
+        delete_file_records (callable, optional): 修复缺失对象时用于删除记录的函数
+            (file_ids -> (已删除记录, 失败列表))，由调用方提供以便同时清理索引
+
+    Returns:
+        dict: 对账报告 (各类计数与最多 RECONCILE_SAMPLE_LIMIT 个样例)
+    """
+    started = time.monotonic()
+    grace_cutoff = datetime.now() - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+    grace_cutoff_utc = datetime.now(timezone.utc) - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+    report = {
+        'repair': repair,
+        'prefix': prefix,
+        'objects_scanned': 0,
+        'orphan_objects': 0,
+        'orphan_bytes': 0,
+        'orphan_objects_removed': 0,
+        'orphan_object_samples': [],
+        'files_scanned': 0,
+        'missing_objects': 0,
+        'missing_files_removed': 0,
+        'missing_object_samples': [],
+        'check_errors': 0
+    }
+
+    # 1. 对象 -> 记录: 流式列举对象，每批一次 IN 查询
+    batch = []
+    for obj in minio_config.iter_files_in_minio(prefix=prefix):
+        if obj.last_modified is not None and obj.last_modified >= grace_cutoff_utc:
+            continue
+        report['objects_scanned'] += 1
+        batch.append(obj)
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            _check_objects(batch, report, repair)
+            batch = []
+            if report['objects_scanned'] % (RECONCILE_BATCH_SIZE * 100) == 0:
+                logging.info(f"对账进度: 已核对 {report['objects_scanned']} 个对象, 无主对象 {report['orphan_objects']} 个")
+    if batch:
+        _check_objects(batch, report, repair)
+
+    # 2. 记录 -> 对象: 按位置字节序遍历记录，与同序的对象列举归并 (不逐个 HEAD 对象)
+    objects = (obj.object_name for obj in minio_config.iter_files_in_minio(prefix=prefix))
+    state = {'current': next(objects, None)}
+    for rows in iter_file_locations(uploaded_before=grace_cutoff, prefix=prefix, batch_size=RECONCILE_BATCH_SIZE):
+        report['files_scanned'] += len(rows)
+        _check_files(_missing_rows(rows, objects, state), report, repair, delete_file_records)
+
+    report['took_seconds'] = round(time.monotonic() - started, 1)
+    logging.info(
+        f"对账完成: 对象 {report['objects_scanned']} 个 (无主 {report['orphan_objects']}, 已删除 {report['orphan_objects_removed']}), "
+        f"记录 {report['files_scanned']} 个 (缺失对象 {report['missing_objects']}, 已删除 {report['missing_files_removed']}), "
+        f"耗时 {report['took_seconds']}s"
+    )
+    return report
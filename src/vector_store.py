@@ -0,0 +1,477 @@
+"""
+向量存储模块
+分块向量保存在只追加的内存映射段文件中，支持 float32 / float16 / int8 量化存储，
+以 NumPy 矩阵乘法分批暴力检索 top-k，删除使用墓碑，后台线程压缩段文件.
+
+磁盘布局 (VECTOR_STORE_DIR):
+    manifest.json              维度、存储类型、每段行数、段列表 (每段的全局行号起点)
+    seg-<序号>.vec             行向量 (rows x dim，按存储类型)
+    seg-<序号>.scale           int8 量化时每行的缩放系数 (float32)
+    seg-<序号>.cid / .fid      每行对应的分块 ID / 文件 ID (定长 32 字节)
+    tombstones                 已删除的全局行号 (int64，只追加)
+    LOCK                       fcntl 文件锁，多进程 (API / worker) 写入互斥
+
+打开时只读取 manifest 并建立内存映射，冷启动几乎不需要 I/O，内存占用由操作系统页缓存决定.
+"""
+import json
+import logging
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from file_lock import file_lock
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+VECTOR_STORE_DIR = os.getenv('VECTOR_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'vector_store'))
+VECTOR_STORE_DTYPE = os.getenv('VECTOR_STORE_DTYPE', 'float32')  # float32 / float16 / int8
+VECTOR_SEGMENT_ROWS = int(os.getenv('VECTOR_SEGMENT_ROWS', 1_000_000))
+VECTOR_SEARCH_BLOCK_ROWS = int(os.getenv('VECTOR_SEARCH_BLOCK_ROWS', 8192))
+VECTOR_COMPACT_DEAD_RATIO = float(os.getenv('VECTOR_COMPACT_DEAD_RATIO', 0.2))
+VECTOR_COMPACT_INTERVAL = int(os.getenv('VECTOR_COMPACT_INTERVAL', 600))
+
+ID_WIDTH = 32
+_ID_DTYPE = np.dtype(f'S{ID_WIDTH}')
+_STORAGE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+
+
+def normalize(vectors):
+    """把向量按行归一化为单位长度 (余弦相似度 = 内积)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _encode_ids(ids):
+    encoded = [str(i).encode('ascii') for i in ids]
+    if any(len(i) > ID_WIDTH for i in encoded):
+        raise ValueError(f"ID 长度不能超过 {ID_WIDTH} 字节")
+    return np.array(encoded, dtype=_ID_DTYPE)
+
+
+class _Segment:
+    """一个段文件组的内存映射视图. 行数由 .cid 文件大小决定 (最后写入)."""
+
+    def __init__(self, store, name, base):
+        self.name = name
+        self.base = base
+        self._prefix = os.path.join(store.path, name)
+        self._dim = store.dim
+        self._dtype = store.storage_dtype
+        self.rows = 0
+        self.vectors = self.scales = self.chunk_ids = self.file_ids = None
+        self.refresh()
+
+    def path(self, suffix):
+        return f"{self._prefix}.{suffix}"
+
+    def _map(self, suffix, dtype, shape):
+        if not shape[0]:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path(suffix), dtype=dtype, mode='r', shape=shape)
+
+    def refresh(self):
+        """若其他进程追加了行，重新建立内存映射."""
+        try:
+            rows = os.path.getsize(self.path('cid')) // ID_WIDTH
+        except FileNotFoundError:
+            rows = 0
+        if rows == self.rows and self.vectors is not None:
+            return
+        self.vectors = self._map('vec', self._dtype, (rows, self._dim))
+        self.scales = self._map('scale', np.float32, (rows,)) if self._dtype == np.int8 else None
+        self.chunk_ids = self._map('cid', _ID_DTYPE, (rows,))
+        self.file_ids = self._map('fid', _ID_DTYPE, (rows,))
+        self.rows = rows  # 映射建立之后再更新行数，并发读者不会越界
+
+    def block(self, start, end):
+        """返回 [start, end) 行的 float32 向量."""
+        block = self.vectors[start:end]
+        if self._dtype == np.int8:
+            return block.astype(np.float32) * self.scales[start:end, None]
+        if self._dtype != np.float32:
+            return block.astype(np.float32)
+        return block
+
+
+class VectorStore:
+    """
+    基于内存映射段文件的向量存储 (余弦相似度).
+    """
+
+    def __init__(self, path, dim=None, dtype=None, segment_rows=None):
+        self.path = path
+        self.segment_rows = segment_rows or VECTOR_SEGMENT_ROWS
+        self._lock = threading.RLock()
+        self._manifest_path = os.path.join(path, 'manifest.json')
+        self._tombstone_path = os.path.join(path, 'tombstones')
+        self._lock_path = os.path.join(path, 'LOCK')
+        os.makedirs(path, exist_ok=True)
+
+        self.dim = dim
+        self.dtype = dtype or VECTOR_STORE_DTYPE
+        self._segments = []
+        self._manifest_mtime = None
+        self._dead = set()
+        self._tombstone_offset = 0
+        self._tombstone_inode = None
+        if os.path.exists(self._manifest_path):
+            self._load_manifest()
+
+    @property
+    def storage_dtype(self):
+        return _STORAGE_DTYPES[self.dtype]
+
+    def _load_manifest(self):
+        with open(self._manifest_path) as f:
+            manifest = json.load(f)
+        self.dim = manifest['dim']
+        self.dtype = manifest['dtype']
+        # 段行数决定全局行号区间的划分，必须以创建存储时的值为准 (旧版 manifest 没有该字段，沿用当前配置)
+        stored_rows = manifest.get('segment_rows')
+        if stored_rows and stored_rows != self.segment_rows:
+            logging.warning(f"向量存储 {self.path} 的段行数为 {stored_rows}，忽略配置的 {self.segment_rows}")
+            self.segment_rows = stored_rows
+        existing = {segment.name: segment for segment in self._segments}
+        self._segments = [
+            existing.get(s['name']) or _Segment(self, s['name'], s['base'])
+            for s in manifest['segments']
+        ]
+        self._manifest_mtime = os.stat(self._manifest_path).st_mtime_ns
+
+    def _write_manifest(self):
+        manifest = {
+            'dim': self.dim,
+            'dtype': self.dtype,
+            'segment_rows': self.segment_rows,
+            'segments': [{'name': s.name, 'base': s.base} for s in self._segments]
+        }
+        tmp_path = self._manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+        self._manifest_mtime = os.stat(self._manifest_path).st_mtime_ns
+
+    def _refresh(self):
+        """同步其他进程的写入: manifest 变化、段追加和新墓碑."""
+        if os.path.exists(self._manifest_path) and os.stat(self._manifest_path).st_mtime_ns != self._manifest_mtime:
+            self._load_manifest()
+        for segment in self._segments:
+            segment.refresh()
+        if os.path.exists(self._tombstone_path):
+            stat = os.stat(self._tombstone_path)
+            if stat.st_ino != self._tombstone_inode:
+                # 墓碑文件被压缩重写，从头读取
+                self._dead = set()
+                self._tombstone_offset = 0
+                self._tombstone_inode = stat.st_ino
+            size = stat.st_size - stat.st_size % 8
+            if size > self._tombstone_offset:
+                with open(self._tombstone_path, 'rb') as f:
+                    f.seek(self._tombstone_offset)
+                    self._dead.update(np.frombuffer(f.read(size - self._tombstone_offset), dtype=np.int64).tolist())
+                self._tombstone_offset = size
+
+    def _next_segment_number(self):
+        return max((int(s.name.split('-')[1]) for s in self._segments), default=0) + 1
+
+    def _new_segment(self):
+        # 全局行号只增不减，已删除的行号不会被复用
+        base = max((s.base + s.rows for s in self._segments), default=0)
+        segment = _Segment(self, f'seg-{self._next_segment_number():06d}', base)
+        self._segments.append(segment)
+        self._write_manifest()
+        return segment
+
+    def _truncate_partial(self, segment):
+        """截掉上次写入中断时残留在各列末尾的半行数据，以 .cid 的行数为准 (调用方需持有文件锁)."""
+        widths = {'vec': self.dim * np.dtype(self.storage_dtype).itemsize, 'fid': ID_WIDTH, 'cid': ID_WIDTH}
+        if self.storage_dtype == np.int8:
+            widths['scale'] = np.dtype(np.float32).itemsize
+        for suffix, width in widths.items():
+            expected = segment.rows * width
+            try:
+                if os.path.getsize(segment.path(suffix)) > expected:
+                    os.truncate(segment.path(suffix), expected)
+            except FileNotFoundError:
+                pass
+
+    def add(self, vectors, chunk_ids, file_ids):
+        """
+        追加向量
+
+        Args:
+            vectors (array-like): (n, dim) 向量，写入前按行归一化
+            chunk_ids (list): 每行对应的分块 ID
+            file_ids (list): 每行对应的文件 ID
+
+        Returns:
+            list: 分配的全局行号
+        """
+        vectors = normalize(vectors)
+        if not (len(vectors) == len(chunk_ids) == len(file_ids)):
+            raise ValueError("vectors, chunk_ids, file_ids 的长度必须一致")
+        cids, fids = _encode_ids(chunk_ids), _encode_ids(file_ids)
+
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与存储维度 {self.dim} 不一致")
+
+            row_ids = []
+            position = 0
+            while position < len(vectors):
+                segment = self._segments[-1] if self._segments else None
+                if segment is None or segment.rows >= self.segment_rows:
+                    segment = self._new_segment()
+                self._truncate_partial(segment)
+                take = min(self.segment_rows - segment.rows, len(vectors) - position)
+                part = vectors[position:position + take]
+                if self.storage_dtype == np.int8:
+                    scales = np.abs(part).max(axis=1) / 127.0
+                    scales[scales == 0] = 1.0
+                    with open(segment.path('scale'), 'ab') as f:
+                        f.write(scales.astype(np.float32).tobytes())
+                    stored = np.round(part / scales[:, None]).astype(np.int8)
+                else:
+                    stored = part.astype(self.storage_dtype)
+                # .cid 最后写入: 其行数决定读者可见的行数
+                for suffix, data in (('vec', stored), ('fid', fids[position:position + take]),
+                                     ('cid', cids[position:position + take])):
+                    with open(segment.path(suffix), 'ab') as f:
+                        f.write(data.tobytes())
+                        f.flush()
+                row_ids.extend(range(segment.base + segment.rows, segment.base + segment.rows + take))
+                segment.refresh()
+                position += take
+            return row_ids
+
+    def _append_tombstones(self, row_ids):
+        if not row_ids:
+            return 0
+        with open(self._tombstone_path, 'ab') as f:
+            f.write(np.asarray(row_ids, dtype=np.int64).tobytes())
+        self._dead.update(row_ids)
+        stat = os.stat(self._tombstone_path)
+        self._tombstone_offset, self._tombstone_inode = stat.st_size, stat.st_ino
+        return len(row_ids)
+
+    def _find_rows(self, column, ids):
+        targets = _encode_ids(ids)
+        rows = []
+        for segment in self._segments:
+            values = segment.chunk_ids if column == 'cid' else segment.file_ids
+            for local in np.flatnonzero(np.isin(values, targets)):
+                row_id = segment.base + int(local)
+                if row_id not in self._dead:
+                    rows.append(row_id)
+        return rows
+
+    def delete_chunks(self, chunk_ids):
+        """按分块 ID 删除向量 (打墓碑)，返回删除的行数."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            return self._append_tombstones(self._find_rows('cid', chunk_ids))
+
+    def delete_files(self, file_ids):
+        """删除文件的全部向量 (打墓碑)，返回删除的行数."""
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            return self._append_tombstones(self._find_rows('fid', file_ids))
+
+    def get_row(self, row_id):
+        """返回全局行号对应的 (chunk_id, file_id)，已删除或不存在时返回 None."""
+        with self._lock:
+            self._refresh()
+            if row_id in self._dead:
+                return None
+            for segment in self._segments:
+                if segment.base <= row_id < segment.base + segment.rows:
+                    local = row_id - segment.base
+                    return segment.chunk_ids[local].decode('ascii'), segment.file_ids[local].decode('ascii')
+            return None
+
+    def search(self, queries, top_k=10, file_ids=None, chunk_ids=None):
+        """
+        批量暴力检索
+
+        Args:
+            queries (array-like): (q, dim) 或 (dim,) 查询向量
+            top_k (int): 每个查询返回的结果数
+            file_ids (list, optional): 只在这些文件的向量中检索
+            chunk_ids (list, optional): 指定 file_ids 时额外允许的分块 (不论其所属文件)
+
+        Returns:
+            list: 每个查询一个列表 [(chunk_id, file_id, score), ...]，按相似度降序
+        """
+        queries = normalize(queries)
+        n_queries = len(queries)
+        best_scores = np.full((n_queries, top_k), -np.inf, dtype=np.float32)
+        best_rows = np.full((n_queries, top_k), -1, dtype=np.int64)
+        allowed = _encode_ids(file_ids) if file_ids is not None else None
+        extra = _encode_ids(chunk_ids) if file_ids is not None and chunk_ids else None
+
+        with self._lock:
+            self._refresh()
+            if self.dim is not None and queries.shape[1] != self.dim:
+                raise ValueError(f"查询维度 {queries.shape[1]} 与存储维度 {self.dim} 不一致")
+            dead = np.fromiter(self._dead, dtype=np.int64, count=len(self._dead)) if self._dead else None
+            segments = list(self._segments)
+
+        for segment in segments:
+            rows = segment.rows
+            for start in range(0, rows, VECTOR_SEARCH_BLOCK_ROWS):
+                end = min(start + VECTOR_SEARCH_BLOCK_ROWS, rows)
+                mask = np.ones(end - start, dtype=bool)
+                if dead is not None:
+                    local_dead = dead[(dead >= segment.base + start) & (dead < segment.base + end)]
+                    mask[local_dead - segment.base - start] = False
+                if allowed is not None:
+                    allowed_rows = np.isin(segment.file_ids[start:end], allowed)
+                    if extra is not None:
+                        allowed_rows |= np.isin(segment.chunk_ids[start:end], extra)
+                    mask &= allowed_rows
+                if not mask.any():
+                    continue
+                scores = queries @ segment.block(start, end).T
+                scores[:, ~mask] = -np.inf
+                k = min(top_k, end - start)
+                block_top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, block_top, axis=1)], axis=1)
+                merged_rows = np.concatenate([best_rows, block_top + segment.base + start], axis=1)
+                keep = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+                best_rows = np.take_along_axis(merged_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        results = []
+        for query_scores, query_rows in zip(best_scores, best_rows):
+            hits = []
+            for score, row_id in zip(query_scores, query_rows):
+                if row_id < 0 or not np.isfinite(score):
+                    continue
+                segment = next(s for s in segments if s.base <= row_id < s.base + s.rows)
+                local = row_id - segment.base
+                hits.append((segment.chunk_ids[local].decode('ascii'), segment.file_ids[local].decode('ascii'), float(score)))
+            results.append(hits)
+        return results
+
+    def compact(self, min_dead_ratio=None):
+        """
+        重写墓碑比例超过 min_dead_ratio 的已封存段，物理删除已删除的行.
+        活动段 (最后一段) 不参与压缩. 压缩后的段获得新的全局行号.
+
+        Returns:
+            int: 清除的行数
+        """
+        min_dead_ratio = VECTOR_COMPACT_DEAD_RATIO if min_dead_ratio is None else min_dead_ratio
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if len(self._segments) < 2:
+                return 0
+            dead = np.fromiter(self._dead, dtype=np.int64, count=len(self._dead))
+            sealed, active = self._segments[:-1], self._segments[-1]
+            victims = []
+            for segment in sealed:
+                dead_rows = np.count_nonzero((dead >= segment.base) & (dead < segment.base + segment.rows))
+                if segment.rows and dead_rows / segment.rows >= min_dead_ratio:
+                    victims.append(segment)
+            if not victims:
+                return 0
+
+            # 存活行写入新段，行号排在活动段可能用到的所有行号之后，再原子替换 manifest
+            next_base = max(max(s.base + s.rows for s in self._segments), active.base + self.segment_rows)
+            # 先写临时文件再整体替换: 上次压缩中断残留的同名段文件被覆盖而不是被追加
+            name = f'seg-{self._next_segment_number():06d}'
+            suffixes = ['vec', 'fid', 'scale', 'cid'] if self.storage_dtype == np.int8 else ['vec', 'fid', 'cid']
+            outputs = {suffix: open(os.path.join(self.path, f'{name}.{suffix}.tmp'), 'wb') for suffix in suffixes}
+            purged = 0
+            try:
+                for segment in victims:
+                    alive = np.ones(segment.rows, dtype=bool)
+                    local_dead = dead[(dead >= segment.base) & (dead < segment.base + segment.rows)] - segment.base
+                    alive[local_dead] = False
+                    purged += int(segment.rows - alive.sum())
+                    columns = {'vec': segment.vectors, 'fid': segment.file_ids, 'cid': segment.chunk_ids, 'scale': segment.scales}
+                    for suffix in suffixes:
+                        outputs[suffix].write(np.ascontiguousarray(columns[suffix][alive]).tobytes())
+            finally:
+                for f in outputs.values():
+                    f.close()
+            for suffix in suffixes:
+                os.replace(os.path.join(self.path, f'{name}.{suffix}.tmp'), os.path.join(self.path, f'{name}.{suffix}'))
+            replacement = _Segment(self, name, next_base)
+
+            victim_names = {segment.name for segment in victims}
+            # 新段放在活动段之前，活动段继续接收追加
+            self._segments = [s for s in sealed if s.name not in victim_names] + [replacement, active]
+            self._write_manifest()
+
+            # 重写墓碑文件，只保留仍然有效的行号
+            remaining = [row for row in self._dead if not any(v.base <= row < v.base + v.rows for v in victims)]
+            tmp_path = self._tombstone_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(np.asarray(remaining, dtype=np.int64).tobytes())
+            os.replace(tmp_path, self._tombstone_path)
+            self._dead = set(remaining)
+            stat = os.stat(self._tombstone_path)
+            self._tombstone_offset, self._tombstone_inode = stat.st_size, stat.st_ino
+
+            for segment in victims:
+                for suffix in ('vec', 'fid', 'cid', 'scale'):
+                    if os.path.exists(segment.path(suffix)):
+                        os.remove(segment.path(suffix))
+            logging.info(f"向量存储压缩完成: 合并 {len(victims)} 个段，清除 {purged} 行")
+            return purged
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return sum(segment.rows for segment in self._segments) - len(self._dead)
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+_compaction_thread = None
+
+
+def get_vector_store():
+    """获取分块向量存储 (进程内单例)."""
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore(VECTOR_STORE_DIR)
+        return _vector_store
+
+
+def start_background_compaction(interval=None):
+    """启动后台压缩线程 (守护线程，每 interval 秒检查一次)."""
+    global _compaction_thread
+    if _compaction_thread is not None:
+        return _compaction_thread
+    interval = interval or VECTOR_COMPACT_INTERVAL
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            try:
+                get_vector_store().compact()
+            except Exception as e:
+                logging.error(f"向量存储后台压缩失败: {e}")
+
+    _compaction_thread = threading.Thread(target=run, name='vector-compaction', daemon=True)
+    _compaction_thread.stop_event = stop_event
+    _compaction_thread.start()
+    return _compaction_thread
@@ -21,8 +21,7 @@ import {
   deleteFileAPI,
   uploadFileAPI,
   batchUploadFilesAPI,
-  convertFileToMarkdownAPI,
-  saveMarkdownFileAPI,
+  serverConvertFileToMarkdownAPI,
   Folder as ApiFolder, // Renamed to avoid conflict with FolderIcon
   FileItem as ApiFile,  // Renamed for clarity
 } from "@/app/services/fileManagerService";
@@ -350,32 +349,17 @@ export default function DataPage() {
         title: "处理中",
         description: `正在转换文件 "${file.name}" 为Markdown...`,
       });
-      const conversionResult = await convertFileToMarkdownAPI(fileId);
+      const saveResult = await serverConvertFileToMarkdownAPI(fileId);
 
-      if (conversionResult.success && conversionResult.markdown_content) {
+      if (saveResult.code === 0 && saveResult.data) {
         toast({
-          title: "转换成功",
-          description: `文件 "${conversionResult.file_name || file.name}" 已成功转换为Markdown。正在保存...`,
+          title: "保存成功",
+          description: `Markdown 文件 "${saveResult.data.name}" 已成功保存到系统中。`,
         });
-
-        const originalName = conversionResult.file_name || file.name;
-        const baseName = originalName.includes('.') ? originalName.substring(0, originalName.lastIndexOf('.')) : originalName;
-        const markdownFilename = `${baseName}.md`;
-
-        const saveResult = await saveMarkdownFileAPI(fileId, conversionResult.markdown_content, markdownFilename);
-
-        if (saveResult.code === 0 && saveResult.data) {
-          toast({
-            title: "保存成功",
-            description: `Markdown 文件 "${saveResult.data.name}" 已成功保存到系统中。`,
-          });
-          await fetchData(currentFolderId);
-          setConversionSuccess(prev => ({ ...prev, [fileId]: true }));
-        } else {
-          throw new Error(saveResult.message || "保存Markdown文件失败");
-        }
+        await fetchData(currentFolderId);
+        setConversionSuccess(prev => ({ ...prev, [fileId]: true }));
       } else {
-        throw new Error(conversionResult.message || "Markdown转换失败");
+        throw new Error(saveResult.message || "Markdown转换失败");
       }
     } catch (error: any) {
       console.error("Markdown 转换或保存操作失败:", error);
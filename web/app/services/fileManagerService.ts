@@ -511,6 +511,60 @@ export async function convertFileToMarkdownAPI(fileId: string): Promise<{
   }
 }
 
+/**
+ * 在服务端将文件转换为Markdown并保存（文件不经过浏览器）
+ * @param fileId 原始文件ID
+ * @returns 包含保存后的Markdown文件信息的Promise
+ */
+export async function serverConvertFileToMarkdownAPI(fileId: string): Promise<{
+  code: number;
+  message: string;
+  data?: FileItem | null;
+}> {
+  return fetchAPI<{ code: number; message: string; data?: FileItem | null }>(`${API_BASE_URL}/files/${fileId}/convert`, {
+    method: 'POST',
+  });
+}
+
+export interface ConversionBatchProgress {
+  batch_id: string;
+  status: 'running' | 'completed';
+  total: number;
+  completed: number;
+  succeeded: number;
+  failed: number;
+  created_at: string;
+  finished_at: string | null;
+  results: Array<{ file_id: string; success: boolean; message: string; data?: FileItem | null }>;
+}
+
+/**
+ * 在服务端批量转换文件为Markdown，返回批量任务进度
+ * @param fileIds 原始文件ID数组
+ */
+export async function serverBatchConvertToMarkdownAPI(fileIds: string[]): Promise<{
+  code: number;
+  message: string;
+  data?: ConversionBatchProgress | null;
+}> {
+  return fetchAPI<{ code: number; message: string; data?: ConversionBatchProgress | null }>(`${API_BASE_URL}/files/convert/batch`, {
+    method: 'POST',
+    body: JSON.stringify({ file_ids: fileIds }),
+  });
+}
+
+/**
+ * 查询服务端批量转换任务进度
+ * @param batchId 批量任务ID
+ */
+export async function getConversionBatchAPI(batchId: string): Promise<{
+  code: number;
+  message: string;
+  data?: ConversionBatchProgress | null;
+}> {
+  return fetchAPI<{ code: number; message: string; data?: ConversionBatchProgress | null }>(`${API_BASE_URL}/files/convert/batch/${batchId}`);
+}
+
 /**
  * 获取文件内容
  * @param fileId 文件ID